@@ -1,19 +1,98 @@
 import sqlite3
+import numpy as np
 import pandas as pd
 import os
+import time
 import logging
 import re
+import atexit
+import threading
+from functools import partial
 from langchain_ollama import OllamaLLM
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+from langchain.tools import Tool
+from langchain.agents import AgentExecutor, create_react_agent
+from langchain_core.prompts import PromptTemplate
+from rollups import run_aggregate_tool, AGGREGATE_TOOL_DESCRIPTION
+from sql_tool import run_sql_tool, describe_schema, SQL_TOOL_DESCRIPTION
+from approximate import run_estimate_tool, ESTIMATE_TOOL_DESCRIPTION
+from sandbox import SandboxPool, TOOL_NOTE as SANDBOX_TOOL_NOTE
+from tool_cache import memoized, tool_cache
+from dataset_profile import profile_prompt
+from sessions import sessions, StepRecorder
+from partitions import (
+    build_catalog, current_rows, question_scope, scoped_frame, warm_hot_partitions, stats as partition_stats,
+)
+from databases.database import (
+    CATEGORICAL_COLUMNS, FLAG_COLUMNS, MONEY_COLUMNS,
+    get_dataset_version, snapshot_dir, read_snapshot_manifest,
+)
 
 # --- CONFIGURATION ---
 MODEL_NAME = "mistral"
 current_dir = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(current_dir, "databases", "retail_database.db")
+# "pandas": load the table into a DataFrame (default).
+# "sql": keep the data in SQLite and let the agent query it through a read-only SQL tool.
+AGENT_MODE = os.environ.get("AGENT_MODE", "pandas").lower()
+# Set SALES_DATETIME_INDEX=1 to index the DataFrame by date (the 'date' column is kept too)
+USE_DATETIME_INDEX = os.environ.get("SALES_DATETIME_INDEX", "0") == "1"
+# Set PYTHON_SANDBOX=0 to run the pandas agent's generated code inside the server process
+# instead of in the time- and memory-limited worker processes of sandbox.py
+USE_SANDBOX = os.environ.get("PYTHON_SANDBOX", "1") == "1"
+# Set SALES_SNAPSHOT=0 to always read the 'sales' table through sqlite3 instead of the columnar snapshot
+USE_SNAPSHOT = os.environ.get("SALES_SNAPSHOT", "1") == "1"
+# LLM round trips (Thought/Action steps) an agent may take before it has to answer
+AGENT_MAX_ITERATIONS = int(os.environ.get("AGENT_MAX_ITERATIONS", "6"))
+# CATEGORICAL_COLUMNS, FLAG_COLUMNS and MONEY_COLUMNS come from databases/database.py,
+# which writes the snapshot with the same dtypes
 
+# Name of the dataset at DB_PATH (datasets.py adds named ones)
+DEFAULT_DATASET = "default"
 
 _cached_agent = None
+# id(agent) -> the DatasetGeneration it was built on (see release_agent)
+_agent_generations = {}
+
+PANDAS_PREFIX_INTRO = "You are working with a pandas dataframe in Python. The name of the dataframe is `df`."
+PANDAS_PREFIX_TOOLS = "You should use the tools below to answer the question posed of you:"
+
+# ReAct instructions shared by the agents built with create_react_agent (braces escaped for .format())
+REACT_INSTRUCTIONS = """You have access to the following tools:
+
+{{tools}}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{{tool_names}}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Question: {{input}}
+Thought:{{agent_scratchpad}}"""
+
+SQL_AGENT_PROMPT = """You are a retail sales analyst. The data lives in the SQLite table 'sales' with columns:
+{schema}
+{profile}
+Filter and aggregate inside SQL; never select all rows. Answer concisely.
+
+""" + REACT_INSTRUCTIONS
+
+APPROXIMATE_AGENT_PROMPT = """You are a retail sales analyst giving quick approximate answers.
+{profile}
+The 'sales_estimate' tool estimates totals and averages from a stratified sample of the sales data.
+Every number in your answer is an estimate: say that the answer is approximate and give each
+number with its ± margin of error from the tool. Answer concisely.
+
+""" + REACT_INSTRUCTIONS
 
 def specific_error_handler(error: Exception) -> str:
     """
@@ -37,11 +116,482 @@ def specific_error_handler(error: Exception) -> str:
             
     return f"Final Answer: I encountered an error processing that request: {str(error)}"
 
+def _frame_memory_mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def optimize_sales_frame(df, datetime_index=False):
+    """
+    Convert the raw 'sales' frame to compact dtypes:
+    categoricals for the text dimensions, booleans for the 0/1 flags,
+    the smallest integer type that fits, and a real datetime64 'date'.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    for col in FLAG_COLUMNS:
+        if col in df.columns and df[col].notna().all() and df[col].isin([0, 1]).all():
+            df[col] = df[col].astype(bool)
+
+    for col in df.select_dtypes(include=["integer", "floating"]).columns:
+        values = df[col]
+        # Prices/revenue arrive as REAL but are whole Rupiah amounts; store them as integers when lossless
+        if values.dtype.kind == "f" and (values.isna().any() or not (values % 1 == 0).all()):
+            continue
+        df[col] = values.astype("int64")
+        if col not in MONEY_COLUMNS:
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        if datetime_index:
+            df = df.set_index("date", drop=False).rename_axis(None)
+
+    return df
+
+
+def load_sales_snapshot(db_path=DB_PATH, datetime_index=USE_DATETIME_INDEX):
+    """
+    Map the columnar snapshot written by databases/database.py instead of parsing the table.
+    Columns are copy-on-write memory maps, so loading takes milliseconds and worker
+    processes on the same host share the physical pages. Returns None if the snapshot
+    is missing or belongs to another dataset version.
+    """
+    path = snapshot_dir(db_path)
+    manifest = read_snapshot_manifest(path)
+    if manifest is None:
+        return None
+    conn = sqlite3.connect(db_path)
+    try:
+        version = get_dataset_version(conn)
+    finally:
+        conn.close()
+    if manifest.get("version") != version:
+        logging.info(f"Snapshot at {path} is for dataset version {manifest.get('version')}, database is at {version}")
+        return None
+
+    columns = {}
+    for spec in manifest["columns"]:
+        # np.asarray drops the memmap subclass but keeps the mapped buffer (no copy)
+        values = np.asarray(np.load(os.path.join(path, spec["name"] + ".npy"), mmap_mode="c"))
+        if spec["kind"] == "category":
+            values = pd.Categorical.from_codes(values, categories=spec["categories"])
+        columns[spec["name"]] = values
+    # copy=False keeps every column backed by its memory map
+    df = pd.DataFrame(columns, copy=False)
+    if datetime_index and "date" in df.columns:
+        df = df.set_index("date", drop=False).rename_axis(None)
+    df.attrs["dataset_version"] = version
+    # Snapshots written before partitioning aren't in date order
+    df.attrs["partitions"] = manifest.get("partitions") or None
+    # Older months are paged in from disk when a question first needs them
+    warm_hot_partitions(df, df.attrs["partitions"])
+    return df
+
+
+def load_sales_dataframe(db_path=DB_PATH, datetime_index=USE_DATETIME_INDEX):
+    """Load the 'sales' frame with compact dtypes, from the snapshot when there is a current one."""
+    if USE_SNAPSHOT:
+        started = time.perf_counter()
+        try:
+            df = load_sales_snapshot(db_path, datetime_index=datetime_index)
+        except Exception as e:
+            logging.warning(f"Could not map the columnar snapshot, reading SQLite instead: {e}")
+            df = None
+        if df is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            logging.info(f"Data mapped from snapshot. Rows: {len(df)}. Took {elapsed_ms:.0f} ms")
+            print(f"   Sales frame mapped from snapshot in {elapsed_ms:.0f} ms ({len(df)} rows)")
+            return df
+
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        # Read the version first: if the table changes meanwhile, the frame is tagged as older, never newer
+        version = get_dataset_version(conn)
+        df = pd.read_sql_query("SELECT * FROM sales", conn)
+    finally:
+        conn.close()
+
+    before_mb = _frame_memory_mb(df)
+    df = optimize_sales_frame(df, datetime_index=datetime_index)
+    df.attrs["dataset_version"] = version
+    df.attrs["partitions"] = build_catalog(df)
+    after_mb = _frame_memory_mb(df)
+    logging.info(f"Data loaded. Rows: {len(df)}. Memory: {before_mb:.1f} MB -> {after_mb:.1f} MB")
+    print(f"   Sales frame memory: {before_mb:.1f} MB -> {after_mb:.1f} MB ({len(df)} rows)")
+    return df
+
+
+def create_sql_agent(llm, extra_tools=(), db_path=None):
+    """
+    ReAct agent that answers from SQLite through the read-only 'sql_query' tool.
+    Nothing is loaded into pandas, so memory does not grow with the table.
+    """
+    db_path = db_path or DB_PATH
+    sql_tool = Tool(
+        name="sql_query",
+        func=partial(run_sql_tool, db_path=db_path),
+        description=SQL_TOOL_DESCRIPTION,
+    )
+    tools = [sql_tool, *extra_tools]
+    profile = escape_braces(profile_prompt(db_path))
+    prompt = PromptTemplate.from_template(SQL_AGENT_PROMPT.format(schema=describe_schema(db_path), profile=profile))
+    agent = create_react_agent(llm, tools, prompt)
+    return AgentExecutor(
+        agent=agent,
+        tools=tools,
+        verbose=False,
+        handle_parsing_errors=specific_error_handler,
+        max_iterations=AGENT_MAX_ITERATIONS,
+        early_stopping_method="force",
+    )
+
+
+def create_approximate_agent(llm=None, dataset=None):
+    """
+    ReAct agent for opt-in approximate answers: its only tool is 'sales_estimate', which
+    answers from the dataset's stratified sample (see approximate.py) in about the same
+    time at any table size. Nothing is loaded into pandas.
+    """
+    dataset = dataset or default_dataset
+    llm = llm or _default_llm()
+    estimate_tool = Tool(
+        name="sales_estimate",
+        func=partial(run_estimate_tool, db_path=dataset.db_path),
+        description=ESTIMATE_TOOL_DESCRIPTION,
+    )
+    profile = escape_braces(profile_prompt(dataset.db_path))
+    prompt = PromptTemplate.from_template(APPROXIMATE_AGENT_PROMPT.format(profile=profile))
+    agent = create_react_agent(llm, [estimate_tool], prompt)
+    return AgentExecutor(
+        agent=agent,
+        tools=[estimate_tool],
+        verbose=False,
+        handle_parsing_errors=specific_error_handler,
+        max_iterations=AGENT_MAX_ITERATIONS,
+        early_stopping_method="force",
+    )
+
+
+def escape_braces(text):
+    """Text that goes into a prompt template literally."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def build_pandas_prefix(profile_text=""):
+    """Prompt prefix of the pandas agent: sandbox rules and the dataset profile, when there are any."""
+    parts = [PANDAS_PREFIX_INTRO]
+    if USE_SANDBOX:
+        parts.append(SANDBOX_TOOL_NOTE)
+    if profile_text:
+        parts.append(escape_braces(profile_text))
+    parts.append(PANDAS_PREFIX_TOOLS)
+    return "\n".join(parts)
+
+
+class DatasetGeneration:
+    """
+    One loaded version of the sales data: the frame and, in sandbox mode, the worker
+    processes attached to it. Every agent built on it holds a reference; once a newer
+    generation replaces it (retire) and its last agent is released, its memory is freed.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.version = frame.attrs.get("dataset_version")
+        self.loaded_at = time.time()
+        self.agents = 0
+        self.retired = False
+        self.freed = False
+        self._sandbox_pool = None
+        self._lock = threading.Lock()
+
+    def sandbox_pool(self):
+        """Start the sandbox workers once, attached to this generation's frame."""
+        with self._lock:
+            if self._sandbox_pool is None:
+                self._sandbox_pool = SandboxPool(self.frame)
+                atexit.register(self._sandbox_pool.close)
+            return self._sandbox_pool
+
+    def acquire(self):
+        with self._lock:
+            self.agents += 1
+
+    def release(self):
+        with self._lock:
+            self.agents -= 1
+            free = self.retired and self.agents <= 0
+        if free:
+            self._free()
+
+    def retire(self):
+        """Called when a newer generation is current; frees everything once no agent uses it any more."""
+        with self._lock:
+            self.retired = True
+            free = self.agents <= 0
+        if free:
+            self._free()
+
+    def _free(self):
+        with self._lock:
+            if self.freed:
+                return
+            self.freed = True
+            pool, self._sandbox_pool = self._sandbox_pool, None
+            self.frame = None
+        if pool is not None:
+            pool.close()
+        print(f"🧹 Released dataset version {self.version}")
+
+    def memory_bytes(self):
+        """Frame plus the sandbox's shared copy of it (a memory-mapped frame counts in full)."""
+        with self._lock:
+            frame, pool = self.frame, self._sandbox_pool
+        if frame is None:
+            return 0
+        size = int(frame.memory_usage(index=True, deep=False).sum())
+        if pool is not None:
+            size += sum(segment.size for segment in pool._segments)
+        return size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "loaded_at": self.loaded_at,
+                "rows": len(self.frame) if self.frame is not None else 0,
+                "agents": self.agents,
+                "retired": self.retired,
+            }
+
+
+class SalesDataset:
+    """
+    One sales database and the data loaded from it: loaded on first use, hot-reloaded
+    as a new DatasetGeneration, and unloaded when datasets.py needs the memory back.
+    The default dataset follows DB_PATH; datasets.py registers the named ones.
+    """
+
+    def __init__(self, name=DEFAULT_DATASET, db_path=None):
+        self.name = name
+        self._db_path = db_path
+        self._generation = None
+        self._frame_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    @property
+    def db_path(self):
+        return self._db_path or DB_PATH
+
+    @property
+    def loaded(self):
+        return self._generation is not None
+
+    def cache_version(self, version):
+        """Key of `version` of this dataset in tool_cache (None: don't cache)."""
+        return None if version is None else (self.name, version)
+
+    def current_generation(self, acquire=False):
+        """The generation new agents are built on; loads the sales data on first use."""
+        with self._frame_lock:
+            if self._generation is None:
+                self._generation = DatasetGeneration(load_sales_dataframe(self.db_path))
+            if acquire:
+                # Under the lock, so a concurrent reload can't free it before the agent holds it
+                self._generation.acquire()
+            return self._generation
+
+    def reload(self, version=None, snapshot_wait=60):
+        """
+        Load the data of dataset `version` as a new generation (frame and sandbox workers),
+        off the request path, then make it current. Agents already built keep using the old
+        generation until they are released. Returns the new generation, or None if nothing
+        was loaded yet (the first request will load the latest data anyway), the data didn't
+        change, or the agent works on SQL directly.
+        """
+        if AGENT_MODE == "sql":
+            return None
+        with self._reload_lock:
+            old = self._generation
+            if old is None or (version is not None and version == old.version):
+                return None
+            if USE_SNAPSHOT and version is not None:
+                wait_for_snapshot(version, snapshot_wait, self.db_path)
+            started = time.perf_counter()
+            generation = DatasetGeneration(load_sales_dataframe(self.db_path))
+            if generation.version == old.version:
+                return None
+            if USE_SANDBOX:
+                generation.sandbox_pool()
+            with self._frame_lock:
+                self._generation = generation
+            print(f"🔁 Loaded dataset '{self.name}' version {generation.version} in "
+                  f"{time.perf_counter() - started:.2f}s (was {old.version})")
+            old.retire()
+            tool_cache.drop_dataset(self.name, keep_version=self.cache_version(generation.version))
+            return generation
+
+    def unload(self):
+        """Drop the loaded data; it is freed once the agents built on it are released. True if anything was loaded."""
+        with self._reload_lock:
+            with self._frame_lock:
+                old, self._generation = self._generation, None
+            if old is None:
+                return False
+            old.retire()
+            tool_cache.drop_dataset(self.name)
+            return True
+
+    def memory_bytes(self):
+        generation = self._generation
+        return generation.memory_bytes() if generation is not None else 0
+
+    def sandbox_stats(self):
+        generation = self._generation
+        pool = generation._sandbox_pool if generation is not None else None
+        return pool.stats() if pool is not None else {"enabled": USE_SANDBOX, "started": False}
+
+    def stats(self):
+        generation = self._generation
+        if generation is None:
+            return {"loaded": False}
+        frame = generation.frame
+        catalog = frame.attrs.get("partitions") if frame is not None else None
+        return {**generation.stats(), "partitions": len(catalog or []), "pruning": partition_stats.snapshot()}
+
+
+def wait_for_snapshot(version, timeout, db_path=None):
+    """Give databases/database.py time to write the snapshot for `version` (it does so right after a load)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        manifest = read_snapshot_manifest(snapshot_dir(db_path or DB_PATH))
+        if manifest is not None and manifest.get("version") == version:
+            return True
+        time.sleep(0.5)
+    return False
+
+
+default_dataset = SalesDataset()
+
+
+def current_generation(acquire=False):
+    """The default dataset's current generation (see SalesDataset.current_generation)."""
+    return default_dataset.current_generation(acquire)
+
+
+def get_sales_frame():
+    """The current sales DataFrame; every agent built by create_agent() shares it."""
+    return default_dataset.current_generation().frame
+
+
+def reload_dataset(version=None, snapshot_wait=60):
+    """Reload the default dataset (see SalesDataset.reload)."""
+    return default_dataset.reload(version, snapshot_wait)
+
+
+def release_agent(agent):
+    """Called when an agent is discarded; frees its generation's data once that is retired and unused."""
+    generation = _agent_generations.pop(id(agent), None)
+    if generation is not None:
+        generation.release()
+
+
+def agent_generation(agent):
+    return _agent_generations.get(id(agent))
+
+
+def sandbox_stats():
+    return default_dataset.sandbox_stats()
+
+
+def dataset_stats():
+    return default_dataset.stats()
+
+
+def _default_llm():
+    return OllamaLLM(
+        model=MODEL_NAME,
+        temperature=0.1,
+        callbacks=[StreamingStdOutCallbackHandler()] 
+    )
+
+
+def create_agent(llm=None, dataset=None):
+    """
+    Build a new agent instance on `dataset` (a SalesDataset; default: the one at DB_PATH).
+    In pandas mode all instances share the frame of the dataset's current DatasetGeneration;
+    each gets a shallow copy so columns added by generated code stay local to that agent.
+    Agents that are discarded go to release_agent() so a replaced generation can be freed.
+    `llm` defaults to the Ollama model (benchmark.py passes a scripted stand-in). Raises on failure.
+    """
+    dataset = dataset or default_dataset
+    if llm is None:
+        llm = _default_llm()
+    # Rollup tool: aggregates are answered from small pre-built tables
+    aggregate_tool = Tool(
+        name="sales_aggregate",
+        func=partial(run_aggregate_tool, db_path=dataset.db_path),
+        description=AGGREGATE_TOOL_DESCRIPTION,
+    )
+
+    if AGENT_MODE == "sql":
+        return create_sql_agent(llm, [aggregate_tool], db_path=dataset.db_path)
+
+    generation = dataset.current_generation(acquire=True)
+    try:
+        return _create_pandas_agent(llm, dataset, generation, aggregate_tool)
+    except Exception:
+        generation.release()
+        raise
+
+
+def _create_pandas_agent(llm, dataset, generation, aggregate_tool):
+    df = generation.frame.copy(deep=False)
+    executor = create_pandas_dataframe_agent(
+        llm, 
+        df, 
+        prefix=build_pandas_prefix(profile_prompt(dataset.db_path, generation.version, dtypes=df.dtypes)),
+        verbose=False, 
+        allow_dangerous_code=True,
+        # Executor options must go through agent_executor_kwargs; extra kwargs are ignored
+        agent_executor_kwargs={"handle_parsing_errors": specific_error_handler},
+        max_iterations=AGENT_MAX_ITERATIONS,
+        early_stopping_method="force",
+        extra_tools=[aggregate_tool]
+    )
+    # Tool calls only see the partitions of the question's period (see partitions.py)
+    catalog = df.attrs.get("partitions")
+    if USE_SANDBOX:
+        # Same tool name and description the prompt was built with, but the code runs in a worker
+        # process. Every call starts from a fresh namespace, so pure expressions can be memoized.
+        pool = generation.sandbox_pool()
+        run_code = memoized(pool.run, dataset.cache_version(generation.version), scope=lambda: current_rows(catalog))
+    else:
+        repl = next(tool for tool in executor.tools if tool.name == "python_repl_ast")
+
+        def run_code(code):
+            repl.locals["df"] = scoped_frame(df, current_rows(catalog))
+            return repl.run(code)
+    executor.tools = [
+        Tool(name=tool.name, func=run_code, description=tool.description)
+        if tool.name == "python_repl_ast" else tool
+        for tool in executor.tools
+    ]
+    _agent_generations[id(executor)] = generation
+    return executor
+
+
 def get_or_create_agent():
     global _cached_agent
     
     if _cached_agent is not None:
-        return _cached_agent
+        # Rebuild on the latest data after a reload (see reloader.py)
+        if AGENT_MODE == "sql" or not agent_generation(_cached_agent).retired:
+            return _cached_agent
+        release_agent(_cached_agent)
+        _cached_agent = None
 
     print("🔄 Loading Database and initializing Agent...")
     print(f"   Looking for DB at: {DB_PATH}")
@@ -51,36 +601,17 @@ def get_or_create_agent():
         print(f"❌ Error: DB file not found at {DB_PATH}")
         return None
 
-    # 2. Load Data into Pandas
+    # 2. Load Data and create Agent
     try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        df = pd.read_sql_query("SELECT * FROM sales", conn)
-        conn.close()
-            
-        logging.info(f"Data loaded. Rows: {len(df)}")
-
-        
-        llm = OllamaLLM(
-            model=MODEL_NAME,
-            temperature=0.1,
-            callbacks=[StreamingStdOutCallbackHandler()] 
-        )
-        # 4. Create Agent
-        _cached_agent = create_pandas_dataframe_agent(
-            llm, 
-            df, 
-            verbose=False, 
-            allow_dangerous_code=True,
-            handle_parsing_errors=specific_error_handler
-        )
-        
+        _cached_agent = create_agent()
         return _cached_agent
 
     except Exception as e:
         print(f"❌ Error initializing agent: {e}")
         return None
 
-def run_agent_logic(user_input):
+def run_agent_logic(user_input, session_id=None):
+    """Answer one question; with a session id, earlier turns of that conversation are used as context."""
     try:
         agent = get_or_create_agent()
         
@@ -88,12 +619,18 @@ def run_agent_logic(user_input):
             return (f"Error: Could not load the database at {DB_PATH}. "
                     "Please ensure 'retail_database.db' exists and has a 'sales' table.")
 
+        data_source = "the 'sales' table" if AGENT_MODE == "sql" else "the DataFrame 'df'"
         contextualized_input = (
-            "Answer this concisely using the DataFrame 'df': " + user_input + 
+            f"Answer this concisely using {data_source}: " + sessions.prompt(session_id, user_input) + 
             " Start with 'Final Answer:' immediately."
         )
 
-        response = agent.invoke(contextualized_input)
+        steps = StepRecorder()
+        # A follow-up may refer to periods of earlier questions, so it sees all partitions
+        scope = None if sessions.has_history(session_id) else user_input
+        with question_scope(scope):
+            response = agent.invoke(contextualized_input, config={"callbacks": [steps]})
+        sessions.record(session_id, user_input, response['output'], steps.steps)
         
         return response['output']
 
@@ -132,7 +669,7 @@ if __name__ == "__main__":
             if user_input:
                 print("🤔 Analyzing...")
                 print("\n🤖 Agent: ", end="", flush=True) 
-                result = run_agent_logic(user_input)
+                result = run_agent_logic(user_input, session_id="cli")
                 print("\n")
                 
         except KeyboardInterrupt:
@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from databases.database import get_dataset_version, get_dataset_id
+from sql_tool import get_pool, DB_PATH
+
+# --- CONFIGURATION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL", str(6 * 60 * 60)))
+# Reuse an answer for a question with the same content words in another order. Set to 0 to disable.
+FUZZY_MATCHING = os.environ.get("ANSWER_CACHE_FUZZY", "1") == "1"
+# SQLite file that keeps answers across restarts. Set ANSWER_CACHE_PATH="" to keep the cache in memory only.
+CACHE_DB_PATH = os.environ.get("ANSWER_CACHE_PATH", os.path.join(current_dir, "databases", "answer_cache.db"))
+
+logger = logging.getLogger(__name__)
+
+# Words that don't change what is being asked
+FILLER_WORDS = set("""
+a an the what whats was is were are please show me tell give can could you would i like to know
+""".split())
+
+# Answers that describe a failure rather than the data are never cached
+UNCACHEABLE_PREFIXES = ("I encountered an error", "Error:", "Agent stopped", "I ran into an error")
+
+
+def normalize_question(question):
+    """'What was total revenue in 2024?' and 'total revenue in 2024' both become 'total revenue in 2024'."""
+    text = question.lower().replace("’", "'").replace("'", "")
+    text = re.sub(r"[^\w\s-]", " ", text)
+    words = [word for word in text.split() if word not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def _content_words(normalized):
+    """
+    A fuzzy hit needs exactly the same content words: 'highest' vs 'lowest', 'promo'
+    vs 'non promo' or 2024 vs 2025 differ by one word but not by a little.
+    """
+    return frozenset(normalized.split())
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of agent answers with a TTL, keyed by normalized question
+    and dataset version. Entries from an older dataset version are never returned.
+    Optionally backed by a small SQLite file so answers survive restarts.
+    A version is (dataset id, version number), see current_dataset_version: a rebuilt
+    database counts from 1 again but gets a new id, so its old answers never match.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS,
+                 fuzzy=FUZZY_MATCHING, db_path=CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fuzzy = fuzzy
+        self.db_path = db_path or None
+        self._entries = OrderedDict()  # (version, normalized) -> (answer, created_at)
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.db_path:
+            self._init_disk()
+
+    # --- disk backing ---
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_disk(self):
+        try:
+            with self._connect() as conn:
+                # Answers from before the dataset id column can't be told apart: start over
+                columns = [row[1] for row in conn.execute('PRAGMA table_info("answers")')]
+                if columns and "dataset_id" not in columns:
+                    conn.execute("DROP TABLE answers")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS answers (
+                        dataset_id TEXT,
+                        version INTEGER NOT NULL,
+                        question TEXT NOT NULL,
+                        answer TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (dataset_id, version, question)
+                    )
+                """)
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache disk backing disabled: {e}")
+            self.db_path = None
+
+    def _disk_get(self, version, normalized):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT answer, created_at FROM answers WHERE dataset_id IS ? AND version = ? AND question = ?",
+                    (*version, normalized),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache read failed: {e}")
+            return None
+        return row
+
+    def _disk_put(self, version, normalized, answer, created_at):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answers (dataset_id, version, question, answer, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (*version, normalized, answer, created_at),
+                )
+                # Old versions, rebuilt databases and expired answers can go
+                conn.execute("DELETE FROM answers WHERE dataset_id IS NOT ? OR version < ? OR created_at < ?",
+                             (*version, time.time() - self.ttl_seconds))
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+    def warm_up(self, version):
+        """Load the most recent on-disk answers for `version` into memory (e.g. at startup)."""
+        if not self.db_path:
+            return 0
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT question, answer, created_at FROM answers WHERE dataset_id IS ? AND version = ? "
+                    "AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                    (*version, time.time() - self.ttl_seconds, self.max_entries),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache warm-up failed: {e}")
+            return 0
+        with self._lock:
+            self._switch_version(version)
+            for normalized, answer, created_at in reversed(rows):
+                self._entries[(version, normalized)] = (answer, created_at)
+            self._evict()
+        return len(rows)
+
+    # --- memory ---
+
+    def _switch_version(self, version):
+        """Drop everything cached for other dataset versions. Caller holds the lock."""
+        if self._version != version:
+            self._entries.clear()
+            self._version = version
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _fuzzy_lookup(self, version, normalized, now):
+        if not self.fuzzy:
+            return None
+        words = _content_words(normalized)
+        for key, (answer, created_at) in reversed(self._entries.items()):
+            if key[0] != version or now - created_at > self.ttl_seconds:
+                continue
+            if _content_words(key[1]) == words:
+                return key
+        return None
+
+    def get(self, question, version):
+        normalized = normalize_question(question)
+        key = (version, normalized)
+        now = time.time()
+        with self._lock:
+            self._switch_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            fuzzy_key = self._fuzzy_lookup(version, normalized, now)
+            if fuzzy_key is not None:
+                self._entries.move_to_end(fuzzy_key)
+                self.hits += 1
+                self.fuzzy_hits += 1
+                return self._entries[fuzzy_key][0]
+
+        if self.db_path:
+            row = self._disk_get(version, normalized)
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                with self._lock:
+                    self._entries[key] = (row[0], row[1])
+                    self._evict()
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question, answer, version):
+        if not answer or answer.startswith(UNCACHEABLE_PREFIXES):
+            return
+        normalized = normalize_question(question)
+        created_at = time.time()
+        with self._lock:
+            self._switch_version(version)
+            self._entries[(version, normalized)] = (answer, created_at)
+            self._entries.move_to_end((version, normalized))
+            self._evict()
+        if self.db_path:
+            self._disk_put(version, normalized, answer, created_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM answers")
+            except sqlite3.Error as e:
+                logger.warning(f"Answer cache clear failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "dataset_id": self._version[0] if self._version else None,
+                "dataset_version": self._version[1] if self._version else None,
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self.db_path is not None,
+            }
+
+
+def current_dataset_version(db_path=DB_PATH):
+    """(dataset id, version number) of the dataset: what cached answers are keyed on."""
+    with get_pool(db_path).connection() as conn:
+        return get_dataset_id(conn), get_dataset_version(conn)
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,52 @@
+import time
+from intent_router import try_fast_path, stats as router_stats
+from answer_cache import answer_cache, current_dataset_version
+
+GREETINGS = ["hello", "hi", "hallo", "hai"]
+GREETING_MSG = "Hello, I'm your assistant to help you know a little bit more about your sales. Ask me anything related to your sales. 👋"
+
+
+def quick_answer(user_text, trace=None, use_cache=True, db_path=None):
+    """
+    Answer without the LLM when we can: greetings, the fast-path intent router,
+    then the answer cache. Returns (answer or None, dataset version).
+    With a RequestTrace, sets trace.path to what answered and records a span per lookup.
+    use_cache=False skips the answer cache (a follow-up's answer depends on the conversation).
+    `db_path` answers from a named dataset (see datasets.py): fast path only, as the answer
+    cache holds the default dataset's answers.
+    """
+    if user_text.lower().strip() in GREETINGS:
+        if trace is not None:
+            trace.path = "greeting"
+        return GREETING_MSG, None
+
+    # --- FAST PATH: simple aggregates are answered without the LLM ---
+    started = time.perf_counter()
+    fast_answer = try_fast_path(user_text, db_path) if db_path else try_fast_path(user_text)
+    if trace is not None:
+        trace.add_span("fast_path", started, time.perf_counter() - started, hit=fast_answer is not None)
+    if fast_answer is not None:
+        if trace is not None:
+            trace.path = "fast_path"
+        return fast_answer, None
+
+    # --- ANSWER CACHE: same (or nearly the same) question on the same data ---
+    if db_path:
+        return None, None
+    started = time.perf_counter()
+    version = current_dataset_version()
+    if not use_cache:
+        return None, version
+    cached_answer = answer_cache.get(user_text, version)
+    if trace is not None:
+        trace.add_span("cache", started, time.perf_counter() - started, hit=cached_answer is not None)
+        if cached_answer is not None:
+            trace.path = "cache"
+    return cached_answer, version
+
+
+def record_agent_answer(user_text, result, version, seconds, cache=True):
+    """Bookkeeping after an agent run: LLM timing for the router stats and the answer cache."""
+    router_stats.record_llm_run(seconds)
+    if cache:
+        answer_cache.put(user_text, result.get("output", ""), version)
@@ -0,0 +1,207 @@
+"""
+Approximate answers from the stratified sample of 'sales'.
+
+databases/database.py keeps up to SAMPLE_ROWS_PER_STRATUM random rows of every
+store_location x sales_channel x month in the 'sales_sample' table. Its size
+depends on the number of strata, not on the number of sales, so an estimate takes
+the same (sub-second) time whether the table has a million rows or fifty million.
+Totals are stratified estimates: each sampled row counts for
+stratum_rows / stratum_sampled rows. Each one comes with a margin of error at
+APPROXIMATE_CONFIDENCE. Averages are ratios of two estimated totals, with a
+linearized variance. Requests opt in with "approximate": true; the agent then
+answers from the 'sales_estimate' tool only and says that its answer is approximate.
+"""
+import os
+import json
+import logging
+import threading
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from databases.database import SAMPLE_TABLE, SAMPLE_STRATA, get_dataset_version, table_exists
+from sql_tool import get_pool
+from rollups import METRICS, TIME_GRAINS, TOOL_MAX_ROWS, validate_request
+
+# --- CONFIGURATION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(current_dir, "databases", "retail_database.db")
+# Confidence level of the error bounds
+APPROXIMATE_CONFIDENCE = float(os.environ.get("APPROXIMATE_CONFIDENCE", "0.95"))
+
+# Each metric as (numerator, denominator) totals; "_rows" counts rows
+RATIO_METRICS = {
+    "revenue": ("revenue", None),
+    "units_sold": ("units_sold", None),
+    "transactions": ("_rows", None),
+    "avg_unit_price": ("revenue", "units_sold"),
+    "avg_order_value": ("revenue", "_rows"),
+}
+
+APPROXIMATE_NOTE = "(Approximate: estimated from a stratified sample of the sales data.)"
+
+logger = logging.getLogger(__name__)
+
+# Latest sample loaded per database, as db_path -> (version, frame)
+_samples = {}
+_lock = threading.Lock()
+
+
+def has_sample(db_path=DB_PATH):
+    """True if the database has a sample (databases loaded before it existed need to be loaded again)."""
+    with get_pool(db_path).connection() as conn:
+        return table_exists(conn, SAMPLE_TABLE)
+
+
+def load_sample(db_path=DB_PATH):
+    """The sample of the current dataset version as a DataFrame, cached per database and version."""
+    with get_pool(db_path).connection() as conn:
+        version = get_dataset_version(conn)
+        with _lock:
+            cached = _samples.get(db_path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        if not table_exists(conn, SAMPLE_TABLE):
+            raise ValueError("This dataset has no sample yet; load it again with databases/database.py")
+        sample = pd.read_sql_query(f'SELECT * FROM "{SAMPLE_TABLE}"', conn)
+
+    sample["month"] = sample["date"].str[:7]
+    for col in sample.columns:
+        if sample[col].dtype == object and col != "date":
+            sample[col] = sample[col].astype("category")
+    sample["_rows"] = 1.0
+    with _lock:
+        _samples[db_path] = (version, sample)
+    logger.info(f"Loaded the sample of {db_path} (version {version}, {len(sample)} rows)")
+    return sample
+
+
+def _select(sample, filters=None, date_from=None, date_to=None):
+    mask = np.ones(len(sample), dtype=bool)
+    for col, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        mask &= sample[col].isin(values).to_numpy()
+    if date_from:
+        mask &= (sample["date"] >= date_from).to_numpy()
+    if date_to:
+        mask &= (sample["date"] <= date_to).to_numpy()
+    return mask
+
+
+def _moments(rows, keys, totals):
+    """Per group and stratum: sums of every total and of every pairwise product."""
+    by = list(dict.fromkeys(keys + SAMPLE_STRATA + ["month"]))
+    frame = rows[by + ["stratum_rows", "stratum_sampled"]].copy()
+    for i, a in enumerate(totals):
+        frame[a] = rows[a].astype(float)
+        for b in totals[i:]:
+            frame[f"{a}*{b}"] = rows[a].astype(float) * rows[b].astype(float)
+    return frame.groupby(by, observed=True, sort=False).agg(
+        {col: "first" if col.startswith("stratum_") else "sum" for col in frame.columns if col not in by}
+    ).reset_index()
+
+
+def estimate_aggregate(metrics=("revenue",), group_by=(), filters=None, date_from=None, date_to=None,
+                       time_grain=None, order_by=None, descending=True, limit=None, db_path=DB_PATH,
+                       confidence=APPROXIMATE_CONFIDENCE):
+    """
+    Estimate an aggregate from the sample; same request as rollups.query_aggregate().
+    Returns (DataFrame with every metric and its "<metric>_moe" margin of error, sample rows used).
+    """
+    metrics, group_by = list(metrics), list(group_by)
+    validate_request(metrics, group_by, filters, time_grain, order_by)
+    sample = load_sample(db_path)
+    rows = sample[_select(sample, filters, date_from, date_to)]
+    if rows.empty:
+        return pd.DataFrame(columns=group_by + metrics), 0
+    if time_grain:
+        rows = rows.assign(period={"day": rows["date"], "month": rows["month"], "year": rows["month"].str[:4]}[time_grain])
+    keys = (["period"] if time_grain else []) + group_by
+    totals = sorted({name for metric in metrics for name in RATIO_METRICS[metric] if name})
+
+    moments = _moments(rows, keys, totals)
+    scale = moments["stratum_rows"] / moments["stratum_sampled"]
+    n = moments["stratum_sampled"]
+    # Variance factor of a stratum total: N^2 (1 - n/N) / n, over the sample covariance (n - 1 denominator)
+    factor = (moments["stratum_rows"] ** 2 * (1 - n / moments["stratum_rows"]) / n / (n - 1)).where(n > 1, 0.0)
+    parts = pd.DataFrame({col: moments[col] for col in keys})
+    for i, a in enumerate(totals):
+        parts[a] = moments[a] * scale
+        for b in totals[i:]:
+            # Rows of the stratum outside the group count as zeros
+            parts[f"{a}*{b}"] = factor * (moments[f"{a}*{b}"] - moments[a] * moments[b] / n)
+    grouped = parts.groupby(keys, observed=True, sort=False).sum().reset_index() if keys else parts.sum().to_frame().T
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    result = grouped[keys].copy()
+    for metric in metrics:
+        numerator, denominator = RATIO_METRICS[metric]
+        cov = lambda a, b: grouped[f"{min(a, b)}*{max(a, b)}"]
+        if denominator is None:
+            value, variance = grouped[numerator], cov(numerator, numerator)
+        else:
+            value = grouped[numerator] / grouped[denominator]
+            variance = (cov(numerator, numerator) - 2 * value * cov(numerator, denominator)
+                        + value ** 2 * cov(denominator, denominator)) / grouped[denominator] ** 2
+        result[metric] = value
+        result[f"{metric}_moe"] = z * np.sqrt(variance.clip(lower=0))
+
+    if order_by:
+        result = result.sort_values(order_by, ascending=not descending)
+    elif time_grain:
+        result = result.sort_values("period")
+    if limit:
+        result = result.head(int(limit))
+    return result.reset_index(drop=True), len(rows)
+
+
+def format_estimates(df, metrics, sample_rows, confidence=APPROXIMATE_CONFIDENCE):
+    """Estimates as 'value ± margin' text for the agent."""
+    if df.empty:
+        return "No sampled rows matched."
+    table = df.drop(columns=[col for col in df.columns if col.endswith("_moe")])
+    for metric in metrics:
+        table[metric] = [f"{value:,.2f} ± {margin:,.2f}" for value, margin in zip(df[metric], df[f"{metric}_moe"])]
+    text = (f"Approximate, from {sample_rows:,} sampled rows ({confidence:.0%} confidence):\n"
+            + table.head(TOOL_MAX_ROWS).to_string(index=False))
+    if len(table) > TOOL_MAX_ROWS:
+        text += f"\n... {len(table) - TOOL_MAX_ROWS} more rows"
+    return text
+
+
+def run_estimate_tool(tool_input, db_path=DB_PATH):
+    """Entry point for the agent's 'sales_estimate' tool; same JSON input as 'sales_aggregate'."""
+    try:
+        request = json.loads(tool_input.strip().strip("`"))
+        metrics = request.get("metrics", ["revenue"])
+        df, sample_rows = estimate_aggregate(
+            metrics=metrics,
+            group_by=request.get("group_by", []),
+            filters=request.get("filters"),
+            date_from=request.get("date_from"),
+            date_to=request.get("date_to"),
+            time_grain=request.get("time_grain"),
+            order_by=request.get("order_by"),
+            descending=request.get("descending", True),
+            limit=request.get("limit"),
+            db_path=db_path,
+        )
+    except Exception as e:
+        return f"Error: {e}"
+    return format_estimates(df, metrics, sample_rows)
+
+
+def approximate_note(answer):
+    """Text to add to an approximate answer that doesn't say it is one ("" if it does)."""
+    text = answer.lower()
+    return "" if "approximate" in text or "estimate" in text else " " + APPROXIMATE_NOTE
+
+
+ESTIMATE_TOOL_DESCRIPTION = (
+    "Estimated sales totals from a stratified sample, each with a margin of error (value ± margin). "
+    "Input is a JSON object with keys: metrics (list of " + ", ".join(METRICS) + "), "
+    "group_by (list of columns such as product_category, product_name, store_location, sales_channel, "
+    "promo, paydayeffect, holiday), filters (object column -> value or list), "
+    "date_from/date_to ('YYYY-MM-DD', inclusive), time_grain (" + ", ".join(TIME_GRAINS) + "), "
+    "order_by (a metric), descending (bool), limit (int). "
+    'Example: {"metrics": ["revenue"], "group_by": ["sales_channel"], "date_from": "2025-01-01", "date_to": "2025-12-31"}'
+)
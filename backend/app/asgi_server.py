@@ -0,0 +1,457 @@
+"""
+Async (ASGI) serving mode for the retail agent.
+
+Same /predict contract as server.py, but every request is an asyncio task instead
+of a thread, so idle SSE connections cost almost nothing. When the client goes away
+(e.g. the Angular ApiService aborts the fetch) the running agent task is cancelled,
+which also cancels its pending Ollama HTTP request. The request handling itself
+(validation, datasets, quick answers, bookkeeping, stats) is shared with server.py
+in handlers.py; this module only adapts it to Starlette and an asyncio agent pool.
+
+Run with:  uvicorn asgi_server:app --port 5000   (needs `starlette` and `uvicorn`)
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse, Response
+from starlette.routing import Route
+from starlette.concurrency import iterate_in_threadpool
+from agent import DB_PATH, release_agent, reload_dataset
+from streaming import AsyncQueueAdapter, sse_event
+from worker_pool import AGENT_WORKERS, AGENT_QUEUE_SIZE, AGENT_MAX_QUEUE_WAIT
+from reloader import DatasetWatcher
+from partitions import question_scope
+from batch import run_batch_async, BATCH_ITEM_TIMEOUT_SECONDS, NDJSON_MIMETYPE
+from metrics import RequestTrace, TracingCallbackHandler, registry as metrics_registry, CONTENT_TYPE
+from handlers import (
+    ApiError, PredictRequest, BatchRequest, datasets, create_pool_agent, open_export, readiness,
+    register_pool_gauges, stats_routes, warm_up_answer_cache,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How often an agent run checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+    'Connection': 'keep-alive'
+}
+
+
+class AsyncAgentPool:
+    """
+    Fixed set of agent instances handed out to requests one at a time.
+    At most `queue_size` requests may wait for an agent; a request waits at most `max_wait` seconds.
+    Agents on named datasets and for approximate answers are built on demand, up to `size` of each kind.
+    """
+
+    def __init__(self, size=AGENT_WORKERS, queue_size=AGENT_QUEUE_SIZE, max_wait=AGENT_MAX_QUEUE_WAIT):
+        self.size = size
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._agents = asyncio.Queue()
+        # ids of the agents built on the current data; others are dropped when released
+        self._current = set()
+        # Other agents, by (dataset, approximate): idle ones, how many were built, and each one's kind
+        self._named = {}
+        self._named_built = {}
+        self._agent_datasets = {}
+        self.ready = 0
+        self.warming_up = False
+        self.waiting = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.reloads = 0
+
+    async def start(self):
+        """Build the agents off the event loop, each joining the pool as soon as it is ready."""
+        self.warming_up = True
+        try:
+            await asyncio.gather(*(self._add_agent() for _ in range(self.size)))
+        finally:
+            self.warming_up = False
+
+    async def _add_agent(self):
+        try:
+            agent = await asyncio.to_thread(create_pool_agent)
+        except Exception as e:
+            logger.error(f"❗ Could not create agent: {e}")
+            return
+        if agent is not None:
+            self._current.add(id(agent))
+            self._agents.put_nowait(agent)
+            self.ready += 1
+
+    async def reload(self):
+        """
+        Replace every agent with one built on the current data (off the event loop).
+        Idle agents are dropped right away; busy ones finish their request first.
+        """
+        built = await asyncio.gather(*(asyncio.to_thread(create_pool_agent) for _ in range(self.size)),
+                                     return_exceptions=True)
+        fresh = [agent for agent in built if agent is not None and not isinstance(agent, Exception)]
+        for error in built:
+            if isinstance(error, Exception):
+                logger.error(f"❗ Could not rebuild agent: {error}")
+        if not fresh:
+            return 0
+        self._current = {id(agent) for agent in fresh}
+        while not self._agents.empty():
+            release_agent(self._agents.get_nowait())
+        for agent in fresh:
+            self._agents.put_nowait(agent)
+        self.ready = len(fresh)
+        # The other agents on the default dataset are built again when next needed
+        self.drop_dataset(None)
+        self.reloads += 1
+        return len(fresh)
+
+    def is_full(self):
+        return self.waiting >= self.queue_size
+
+    async def acquire(self, max_wait=None, dataset=None, approximate=False):
+        """
+        An agent on `dataset` (None: the default one), for approximate answers with `approximate`.
+        Raises asyncio.TimeoutError after the wait.
+        """
+        self.waiting += 1
+        try:
+            timeout = self.max_wait if max_wait is None else max_wait
+            if dataset is None and not approximate:
+                return await asyncio.wait_for(self._agents.get(), timeout=timeout)
+            return await asyncio.wait_for(self._acquire_named((dataset, approximate)), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+    async def _acquire_named(self, key):
+        idle = self._named.setdefault(key, asyncio.Queue())
+        if idle.empty() and self._named_built.get(key, 0) < self.size:
+            self._named_built[key] = self._named_built.get(key, 0) + 1
+            try:
+                agent = await asyncio.to_thread(create_pool_agent, *key)
+            except BaseException:
+                if self._named.get(key) is idle:
+                    self._named_built[key] -= 1
+                raise
+            # Dropped while it was built: answers this request, then is retired like the dataset's busy agents
+            if self._named.get(key) is idle:
+                self._current.add(id(agent))
+            self._agent_datasets[id(agent)] = key
+            return agent
+        return await idle.get()
+
+    def drop_dataset(self, name):
+        """Drop the other agents on dataset `name` (unloaded or reloaded): idle ones now, busy ones when released."""
+        self._current -= {agent_id for agent_id, key in self._agent_datasets.items() if key[0] == name}
+        for key in [key for key in self._named if key[0] == name]:
+            idle = self._named.pop(key)
+            self._named_built.pop(key, None)
+            while not idle.empty():
+                self.release(idle.get_nowait())
+
+    def release(self, agent):
+        key = self._agent_datasets.get(id(agent))
+        if key is not None:
+            if id(agent) in self._current and key in self._named:
+                self._named[key].put_nowait(agent)
+            else:
+                # Its dataset was dropped (unloaded or reloaded) while the agent was busy
+                self._current.discard(id(agent))
+                del self._agent_datasets[id(agent)]
+                release_agent(agent)
+        elif id(agent) in self._current:
+            self._agents.put_nowait(agent)
+        else:
+            # Built before the last reload
+            release_agent(agent)
+
+    def stats(self):
+        return {
+            "agents": self.ready,
+            "warming_up": self.warming_up,
+            "idle_agents": self._agents.qsize(),
+            "busy_agents": max(self.ready - self._agents.qsize(), 0),
+            "waiting": self.waiting,
+            "queue_capacity": self.queue_size,
+            "max_wait_seconds": self.max_wait,
+            "completed": self.completed,
+            "cancelled_on_disconnect": self.cancelled,
+            "timed_out_waiting": self.timed_out,
+            "rejected_queue_full": self.rejected,
+            "reloads": self.reloads,
+            "other_agents": [
+                {"dataset": key[0], "approximate": key[1], "agents": built,
+                 "idle_agents": self._named[key].qsize() if key in self._named else 0}
+                for key, built in self._named_built.items()
+            ],
+        }
+
+
+agent_pool = AsyncAgentPool()
+# Its callback needs the running loop, so it is set in lifespan()
+dataset_watcher = DatasetWatcher(DB_PATH, on_change=None)
+
+register_pool_gauges(lambda: agent_pool.waiting, lambda: agent_pool.stats()["busy_agents"], lambda: agent_pool.ready)
+
+
+def error_response(error):
+    return JSONResponse(error.body, status_code=error.status, headers=error.headers)
+
+
+async def request_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return {}
+
+
+async def run_agent(agent, req, handler):
+    try:
+        started = time.perf_counter()
+        with req.scope():
+            result = await agent.ainvoke(req.agent_input(), config=req.agent_config(handler))
+        await asyncio.to_thread(req.record, result, time.perf_counter() - started)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"❗ Agent task error: {e}")
+        req.trace.outcome = "error"
+        handler.queue.put(f"I encountered an error: {str(e)}")
+    finally:
+        handler.queue.put(None)
+
+
+async def watch_disconnect(request, task):
+    """Cancel `task` as soon as the client disconnects."""
+    while not task.done():
+        if await request.is_disconnected():
+            task.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def stream_text(text, trace):
+    trace.record_frame()
+    yield sse_event(text)
+    yield "data: [DONE]\n\n"
+    trace.finish()
+
+
+async def stream_agent(request, req):
+    trace = req.trace
+    waiting_since = time.perf_counter()
+    try:
+        agent = await agent_pool.acquire(dataset=req.named, approximate=req.approximate)
+    except asyncio.TimeoutError:
+        trace.finish("rejected")
+        yield sse_event("The assistant is busy, please try again shortly.")
+        yield "data: [DONE]\n\n"
+        return
+    trace.record_queue_wait(time.perf_counter() - waiting_since)
+
+    queue = asyncio.Queue()
+    handler = req.streaming_handler(AsyncQueueAdapter(queue, asyncio.get_running_loop()))
+    task = asyncio.create_task(run_agent(agent, req, handler))
+    # The agent goes back to the pool only once its run has really finished (or was cancelled)
+    task.add_done_callback(lambda _: agent_pool.release(agent))
+    watcher = asyncio.create_task(watch_disconnect(request, task))
+
+    finished = False
+    try:
+        while True:
+            token = await queue.get()
+            if token is None:
+                break
+            trace.record_frame()
+            yield sse_event(token)
+        finished = True
+        agent_pool.completed += 1
+        yield "data: [DONE]\n\n"
+    finally:
+        watcher.cancel()
+        if not finished and not task.done():
+            # The client went away mid-answer: stop the agent and its pending LLM calls
+            task.cancel()
+            agent_pool.cancelled += 1
+            trace.outcome = "disconnected"
+            logger.info("Client disconnected, cancelled agent run")
+        trace.finish()
+
+
+# --- ROUTES ---
+async def predict(request):
+    data = await request_body(request)
+    try:
+        req = await asyncio.to_thread(PredictRequest, data)
+    except ApiError as e:
+        return error_response(e)
+
+    # --- GREETING / FAST PATH / ANSWER CACHE: no LLM needed ---
+    answer = await asyncio.to_thread(req.quick_reply)
+    if answer is not None:
+        return StreamingResponse(stream_text(answer, req.trace), media_type='text/event-stream', headers=SSE_HEADERS)
+
+    # --- DATASET AND AGENT ---
+    try:
+        await asyncio.to_thread(req.load_dataset)
+        req.check_ready(agent_pool.ready, agent_pool.warming_up)
+        if agent_pool.is_full():
+            agent_pool.rejected += 1
+            raise req.reject("Too many requests are waiting, please try again shortly.", 429, 1)
+    except ApiError as e:
+        return error_response(e)
+
+    return StreamingResponse(stream_agent(request, req), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+async def predict_batch(request):
+    """Answer a list of questions; NDJSON lines in completion order (see batch.py)."""
+    data = await request_body(request)
+    try:
+        batch = await asyncio.to_thread(BatchRequest, data)
+    except ApiError as e:
+        return error_response(e)
+
+    async def answer_one(question):
+        return await answer_batch_question(batch, question)
+
+    return StreamingResponse(run_batch_async(batch.items, batch.concurrency, answer_one, batch.total),
+                             media_type=NDJSON_MIMETYPE, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def export(request):
+    """Stream every row of a read-only query or rollup as CSV, NDJSON or Arrow IPC (see export.py)."""
+    data = await request_body(request)
+    try:
+        stream, mimetype, headers = await asyncio.to_thread(open_export, data)
+    except ApiError as e:
+        return error_response(e)
+    return StreamingResponse(export_chunks(stream), media_type=mimetype, headers=headers)
+
+
+async def export_chunks(stream):
+    """Batches are fetched and encoded on a thread, one at a time as the client takes them."""
+    try:
+        async for chunk in iterate_in_threadpool(stream):
+            yield chunk
+    finally:
+        stream.close()
+
+
+async def answer_batch_question(batch, question):
+    """Answer one batch question without streaming: quick answer, else an agent from the pool."""
+    trace = RequestTrace(question)
+    try:
+        answer, version = await asyncio.to_thread(batch.quick_reply, question, trace)
+        if answer is None:
+            await asyncio.to_thread(batch.load_dataset)
+            answer = await asyncio.wait_for(run_batch_agent(batch, question, version, trace),
+                                            BATCH_ITEM_TIMEOUT_SECONDS)
+        return {"answer": answer, "path": trace.path}
+    except asyncio.CancelledError:
+        trace.outcome = "disconnected"
+        raise
+    except asyncio.TimeoutError:
+        trace.outcome = "error"
+        return {"error": f"No answer within {BATCH_ITEM_TIMEOUT_SECONDS:g}s"}
+    except Exception as e:
+        trace.outcome = "error"
+        return {"error": str(e)}
+    finally:
+        trace.finish()
+
+
+async def run_batch_agent(batch, question, version, trace):
+    if agent_pool.ready == 0 and not agent_pool.warming_up:
+        raise RuntimeError("AI agent not available. Please check the server logs.")
+    waiting_since = time.perf_counter()
+    # Unlike /predict, a busy pool isn't an error here: the item timeout bounds the wait
+    agent = await agent_pool.acquire(max_wait=BATCH_ITEM_TIMEOUT_SECONDS, dataset=batch.named,
+                                     approximate=batch.approximate)
+    trace.record_queue_wait(time.perf_counter() - waiting_since)
+    try:
+        started = time.perf_counter()
+        with question_scope(question):
+            result = await agent.ainvoke({"input": question}, config={"callbacks": [TracingCallbackHandler(trace)]})
+        output = await asyncio.to_thread(batch.record, question, result, version, time.perf_counter() - started)
+        agent_pool.completed += 1
+        return output
+    finally:
+        agent_pool.release(agent)
+
+
+async def healthz(request):
+    """Liveness: the process is up and serving, even while agents are still warming up."""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    """Readiness: at least one agent (and so the sales frame) is loaded."""
+    body, status = readiness(agent_pool.ready, agent_pool.warming_up)
+    return JSONResponse(body, status_code=status)
+
+
+async def metrics_route(request):
+    return Response(metrics_registry.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+def stats_route(payload):
+    async def route(request):
+        return JSONResponse(payload())
+    return route
+
+
+@asynccontextmanager
+async def lifespan(app):
+    print("🚀 Starting ASGI Server...")
+    # Agents (and the sales frame) load in the background; /healthz and /readyz answer meanwhile
+    warmup = asyncio.create_task(agent_pool.start())
+    loop = asyncio.get_running_loop()
+
+    def reload_agents(version):
+        # Runs on the watcher thread: load the data there, then swap the agents on the loop
+        if reload_dataset(version) is not None:
+            asyncio.run_coroutine_threadsafe(agent_pool.reload(), loop).result()
+
+    dataset_watcher.on_change = reload_agents
+    dataset_watcher.start()
+    # Called on the thread that unloaded or reloaded a named dataset
+    datasets.on_dataset_changed = lambda name: loop.call_soon_threadsafe(agent_pool.drop_dataset, name)
+    await asyncio.to_thread(warm_up_answer_cache)
+    yield
+    dataset_watcher.stop()
+    warmup.cancel()
+
+
+app = Starlette(
+    routes=[
+        Route('/predict', predict, methods=['POST']),
+        Route('/predict/batch', predict_batch, methods=['POST']),
+        Route('/export', export, methods=['POST']),
+        Route('/healthz', healthz, methods=['GET']),
+        Route('/readyz', readyz, methods=['GET']),
+        Route('/metrics', metrics_route, methods=['GET']),
+        # /sandbox/stats, /pool/stats, /datasets/stats, ...: same payloads as the Flask server
+        *(Route(path, stats_route(payload), methods=['GET'])
+          for path, payload in stats_routes(agent_pool.stats, dataset_watcher)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=5000)
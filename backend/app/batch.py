@@ -0,0 +1,131 @@
+"""
+Batch questions for /predict/batch.
+
+Reporting jobs send many questions at once. Questions that normalize to the same
+text (see answer_cache.normalize_question) are answered once. The rest run
+concurrently, at most `concurrency` at a time, on the same agent pool as
+/predict. Results are streamed back as NDJSON in completion order: one line per
+unique question (with every index it had in the request), then a summary line.
+"""
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from answer_cache import normalize_question
+from worker_pool import AGENT_WORKERS
+
+# --- CONFIGURATION ---
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "200"))
+# Default and maximum number of questions of one batch running at the same time
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(AGENT_WORKERS)))
+# Seconds one question may take, including waiting for a free agent
+BATCH_ITEM_TIMEOUT_SECONDS = float(os.environ.get("BATCH_ITEM_TIMEOUT_SECONDS", "300"))
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class BatchItem:
+    def __init__(self, question, normalized):
+        self.question = question
+        self.normalized = normalized
+        self.indices = []
+
+
+def parse_batch(data):
+    """
+    Validate a batch request body: {"messages": [...], "concurrency": n (optional)}.
+    Returns (items, concurrency); raises ValueError with a message for the client.
+    """
+    questions = (data or {}).get("messages")
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("'messages' must be a non-empty list of questions")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    items = {}
+    for index, question in enumerate(questions):
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"Question {index} is empty or not a string")
+        # Questions that normalize to nothing (e.g. only filler words) are kept apart
+        key = normalize_question(question) or question.strip().lower()
+        if key not in items:
+            items[key] = BatchItem(question.strip(), key)
+        items[key].indices.append(index)
+
+    try:
+        concurrency = int((data or {}).get("concurrency") or BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise ValueError("'concurrency' must be a number")
+    return list(items.values()), max(1, min(concurrency, BATCH_CONCURRENCY))
+
+
+def item_line(item, result, seconds):
+    """`result` is {"answer": ..., "path": ...} or {"error": ...}."""
+    line = {"indices": item.indices, "question": item.question, "seconds": round(seconds, 3), **result}
+    return json.dumps(line) + "\n"
+
+
+def summary_line(total, items, errors, started):
+    return json.dumps({
+        "done": True,
+        "questions": total,
+        "unique_questions": len(items),
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 3),
+    }) + "\n"
+
+
+def _timed(answer_one, question):
+    started = time.perf_counter()
+    try:
+        result = answer_one(question)
+    except Exception as e:
+        result = {"error": str(e)}
+    return result, time.perf_counter() - started
+
+
+def run_batch(items, concurrency, answer_one, total):
+    """Answer `items` on threads with blocking `answer_one(question)`; yields NDJSON lines as they finish."""
+    started = time.perf_counter()
+    errors = 0
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        futures = {executor.submit(_timed, answer_one, item.question): item for item in items}
+        for future in as_completed(futures):
+            result, seconds = future.result()
+            errors += "error" in result
+            yield item_line(futures[future], result, seconds)
+        yield summary_line(total, items, errors, started)
+    finally:
+        # The client may have gone away: don't start the questions that are still waiting
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_batch_async(items, concurrency, answer_one, total):
+    """Same as run_batch() with a coroutine `answer_one(question)`; cancelled when the client disconnects."""
+    started = time.perf_counter()
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def timed(item):
+        async with limit:
+            started_item = time.perf_counter()
+            try:
+                result = await answer_one(item.question)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = {"error": str(e)}
+            return item, result, time.perf_counter() - started_item
+
+    tasks = [asyncio.create_task(timed(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item, result, seconds = await next_done
+            errors += "error" in result
+            yield item_line(item, result, seconds)
+        yield summary_line(total, items, errors, started)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,418 @@
+"""
+Offline benchmarks for the sales agent, the ingestion step and the data generator.
+
+No Ollama needed: the agent runs on ScriptedLLM, which replays ReAct traces
+(built in, or recorded ones from --traces) with a configurable token rate.
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+A traces file is a JSON list of {"mode": "pandas"|"sql", "question": ..., "steps": [llm output, ...]}.
+Step i is returned once the prompt holds i observations for that question; "{observation}"
+in a step is replaced by the text of the last observation.
+"""
+import os
+import io
+import re
+import sys
+import json
+import time
+import math
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+# --- CONFIGURATION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_CONCURRENCY = [1, 4]
+DEFAULT_REQUESTS = 40
+# Simulated LLM speed: delay before the first token and between tokens
+DEFAULT_FIRST_TOKEN_DELAY = 0.05
+DEFAULT_TOKEN_DELAY = 0.002
+
+DEFAULT_TRACES = [
+    {
+        "mode": "pandas",
+        "question": "What is the total revenue?",
+        "steps": [
+            "Thought: I need to sum the revenue column.\nAction: python_repl_ast\nAction Input: df['revenue'].sum()",
+            "Thought: I now know the final answer\nFinal Answer: The total revenue is Rp {observation}.",
+        ],
+    },
+    {
+        "mode": "pandas",
+        "question": "Which store location has the highest revenue?",
+        "steps": [
+            "Thought: Group revenue by store and take the largest.\nAction: python_repl_ast\n"
+            "Action Input: df.groupby('store_location', observed=True)['revenue'].sum().idxmax()",
+            "Thought: I now know the final answer\nFinal Answer: {observation} has the highest revenue.",
+        ],
+    },
+    {
+        "mode": "pandas",
+        "question": "Show the monthly units sold trend",
+        "steps": [
+            "Thought: Sum units sold per month.\nAction: python_repl_ast\n"
+            "Action Input: df.groupby(df['date'].dt.to_period('M'))['units_sold'].sum().tail(6)",
+            "Thought: I now know the final answer\nFinal Answer: Units sold over the last six months:\n{observation}",
+        ],
+    },
+    {
+        "mode": "pandas",
+        "question": "How does promo affect revenue per sales channel?",
+        "steps": [
+            "Thought: Compare average revenue with and without promo per channel.\nAction: python_repl_ast\n"
+            "Action Input: df.groupby(['sales_channel', 'promo'], observed=True)['revenue'].mean().round(0)",
+            "Thought: I need the overall numbers too.\nAction: python_repl_ast\n"
+            "Action Input: df.groupby('promo')['revenue'].mean().round(0)",
+            "Thought: I now know the final answer\nFinal Answer: Average revenue by promo: {observation}",
+        ],
+    },
+    {
+        # The model forgets the ReAct format; exercises handle_parsing_errors
+        "mode": "pandas",
+        "question": "Is the business doing well?",
+        "steps": [
+            "Sales look healthy overall, with steady revenue across channels.",
+            "Thought: I now know the final answer\nFinal Answer: Sales look healthy overall, "
+            "with steady revenue across channels.",
+        ],
+    },
+    {
+        "mode": "sql",
+        "question": "What is the total revenue?",
+        "steps": [
+            "Thought: Sum revenue in SQL.\nAction: sql_query\nAction Input: SELECT SUM(revenue) FROM sales",
+            "Thought: I now know the final answer\nFinal Answer: The total revenue is {observation}.",
+        ],
+    },
+    {
+        "mode": "sql",
+        "question": "Which store location has the highest revenue?",
+        "steps": [
+            "Thought: Group by store.\nAction: sql_query\nAction Input: SELECT store_location, SUM(revenue) AS r "
+            "FROM sales GROUP BY store_location ORDER BY r DESC LIMIT 1",
+            "Thought: I now know the final answer\nFinal Answer: {observation}",
+        ],
+    },
+    {
+        "mode": "sql",
+        "question": "Show the monthly units sold trend",
+        "steps": [
+            "Thought: Sum units per month.\nAction: sql_query\nAction Input: SELECT substr(date, 1, 7) AS month, "
+            "SUM(units_sold) FROM sales GROUP BY month ORDER BY month DESC LIMIT 6",
+            "Thought: I now know the final answer\nFinal Answer: Units sold over the last six months:\n{observation}",
+        ],
+    },
+]
+
+
+class ScriptedLLM(LLM):
+    """Stand-in for OllamaLLM that replays ReAct traces and streams them token by token."""
+
+    traces: list = []
+    first_token_delay: float = DEFAULT_FIRST_TOKEN_DELAY
+    token_delay: float = DEFAULT_TOKEN_DELAY
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _respond(self, prompt):
+        best = None
+        for trace in self.traces:
+            at = prompt.rfind(trace["question"])
+            if at != -1 and (best is None or len(trace["question"]) > len(best[0]["question"])):
+                best = (trace, at)
+        if best is None:
+            return "Thought: I now know the final answer\nFinal Answer: I don't have a scripted answer for that."
+
+        trace, at = best
+        scratchpad = prompt[at:]
+        step = scratchpad.count("Observation:")
+        text = trace["steps"][min(step, len(trace["steps"]) - 1)]
+        observations = re.findall(r"Observation:\s*(.*?)(?=\n\s*Thought:|\Z)", scratchpad, re.S)
+        return text.replace("{observation}", observations[-1].strip() if observations else "")
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        text = self._respond(prompt)
+        if self.first_token_delay:
+            time.sleep(self.first_token_delay)
+        for token in re.findall(r"\s*\S+", text):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def _number(value, spec):
+    """Format a result for the console; runs where no request succeeded have None."""
+    return "n/a" if value is None else format(value, spec)
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silence the progress prints of the benchmarked code."""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# --- GENERATOR AND INGESTION ---
+
+def bench_data_pipeline(sizes, workers, seed, verbose=False):
+    """Generate a CSV of each size with rawdata.py, then load it with database.py."""
+    from databases import rawdata, database
+
+    generator_results, ingestion_results = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            csv_path = os.path.join(tmp, f"sales_{size}.csv")
+            db_path = os.path.join(tmp, f"sales_{size}.db")
+
+            started = time.perf_counter()
+            with quiet(not verbose):
+                rawdata.generate_large_dataset(size, filename=csv_path, seed=seed, workers=workers, sep=";")
+            elapsed = time.perf_counter() - started
+            generator_results.append({
+                "rows": size,
+                "workers": workers,
+                "seconds": elapsed,
+                "rows_per_sec": size / elapsed if elapsed > 0 else None,
+                "csv_mb": os.path.getsize(csv_path) / (1024 * 1024),
+            })
+            print(f"   generator  {size:>10,} rows: {size / elapsed:>12,.0f} rows/s")
+
+            with quiet(not verbose):
+                stats = database.ingest_csv(csv_path, db_path)
+            ingestion_results.append({
+                "rows": stats["rows"],
+                "seconds": stats["seconds"],
+                "rows_per_sec": stats["rows_per_sec"],
+                "peak_memory_mb": stats["peak_memory_mb"],
+            })
+            print(f"   ingestion  {size:>10,} rows: {stats['rows_per_sec']:>12,.0f} rows/s")
+    return generator_results, ingestion_results
+
+
+# --- /predict ---
+
+def _timed_request(client, question):
+    started = time.perf_counter()
+    response = client.post('/predict', json={"message": question}, buffered=False)
+    first_frame = None
+    frames = 0
+    for chunk in response.response:
+        if first_frame is None:
+            first_frame = time.perf_counter() - started
+        frames += 1
+    response.close()
+    return response.status_code, first_frame, time.perf_counter() - started, frames
+
+
+def bench_predict(traces, concurrency_levels, total_requests, workers, first_token_delay, token_delay,
+                  use_quick_answers=False):
+    """
+    Drive server.py's /predict through the Flask test client with `concurrency` parallel clients.
+    The worker pool, streaming and agent code are the real ones; only the LLM is scripted.
+    """
+    import agent
+    import server
+    import handlers
+    from worker_pool import AgentWorkerPool
+
+    mode_traces = [trace for trace in traces if trace.get("mode", "pandas") == agent.AGENT_MODE]
+    if not mode_traces:
+        raise ValueError(f"No traces for AGENT_MODE={agent.AGENT_MODE}")
+    questions = [trace["question"] for trace in mode_traces]
+
+    def make_agent():
+        llm = ScriptedLLM(traces=mode_traces, first_token_delay=first_token_delay, token_delay=token_delay)
+        return agent.create_agent(llm=llm)
+
+    # Never read or fill the real answer cache from a benchmark
+    handlers.answer_cache.db_path = None
+    handlers.answer_cache.clear()
+    if not use_quick_answers:
+        handlers.quick_answer = lambda *args, **kwargs: (None, None)
+
+    results = []
+    for concurrency in concurrency_levels:
+        server.agent_pool = AgentWorkerPool(make_agent, num_workers=workers,
+                                            queue_size=max(total_requests, 1), max_queue_wait=3600)
+        with quiet():
+            if not server.agent_pool.wait_until_ready():
+                raise RuntimeError("Could not create the benchmark agents")
+
+        def worker(index):
+            return _timed_request(server.app.test_client(), questions[index % len(questions)])
+
+        started = time.perf_counter()
+        with quiet(), ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(worker, range(total_requests)))
+        wall = time.perf_counter() - started
+
+        ok = [sample for sample in samples if sample[0] == 200]
+        statuses = {}
+        for sample in samples:
+            statuses[str(sample[0])] = statuses.get(str(sample[0]), 0) + 1
+        result = {
+            "concurrency": concurrency,
+            "workers": workers,
+            "requests": total_requests,
+            "statuses": statuses,
+            "seconds": wall,
+            "throughput_rps": len(ok) / wall if wall > 0 else None,
+            "latency_s": latency_summary([sample[2] for sample in ok]),
+            "first_frame_s": latency_summary([sample[1] for sample in ok if sample[1] is not None]),
+            "avg_frames": statistics.fmean(sample[3] for sample in ok) if ok else None,
+        }
+        results.append(result)
+        print(f"   /predict concurrency {concurrency:>3}: {_number(result['throughput_rps'], '.2f')} req/s, "
+              f"p50 {_number(result['latency_s']['p50'], '.3f')}s, p95 {_number(result['latency_s']['p95'], '.3f')}s, "
+              f"statuses {statuses}")
+    return {"agent_mode": agent.AGENT_MODE, "runs": results}
+
+
+# --- RESULTS ---
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=current_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(value, prefix=""):
+    """{'a': [{'rows': 10, 'x': 1}]} -> {'a[rows=10].x': 1}, so runs can be matched key by key."""
+    flat = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = i
+            if isinstance(item, dict):
+                for key in ("rows", "concurrency"):
+                    if key in item:
+                        label = f"{key}={item[key]}"
+                        break
+            flat.update(_flatten(item, f"{prefix}[{label}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix] = value
+    return flat
+
+
+def compare_results(baseline, current):
+    """Print the relative change of every rate and latency metric present in both runs."""
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for key in sorted(old.keys() & new.keys()):
+        if not re.search(r"(rows_per_sec|throughput_rps|latency_s\.|first_frame_s\.)", key) or key.endswith(".count"):
+            continue
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        print(f"   {key:<60} {old[key]:>12.4g} -> {new[key]:>12.4g} ({change:+.1f}%)")
+
+
+def load_traces(path):
+    if not path:
+        return DEFAULT_TRACES
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the sales agent and data pipeline.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated dataset sizes for the generator and ingestion benchmarks.")
+    parser.add_argument("--gen-workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", default=",".join(str(level) for level in DEFAULT_CONCURRENCY),
+                        help="Comma-separated numbers of parallel /predict clients.")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="/predict requests per concurrency level.")
+    parser.add_argument("--agent-workers", type=int, default=4)
+    parser.add_argument("--traces", default=None, help="JSON file with recorded ReAct traces.")
+    parser.add_argument("--first-token-delay", type=float, default=DEFAULT_FIRST_TOKEN_DELAY)
+    parser.add_argument("--token-delay", type=float, default=DEFAULT_TOKEN_DELAY)
+    parser.add_argument("--quick-answers", action="store_true",
+                        help="Let greetings, the fast path and the answer cache answer /predict too.")
+    parser.add_argument("--skip", default="", help="Comma-separated parts to skip: data, predict.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against.")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    skip = {part.strip() for part in args.skip.split(",") if part.strip()}
+    results = {}
+    print("=" * 60)
+    print("⏱️  SALES AGENT BENCHMARKS (offline)")
+    print("=" * 60)
+
+    if "data" not in skip:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        results["generator"], results["ingestion"] = bench_data_pipeline(
+            sizes, args.gen_workers, args.seed, verbose=args.verbose)
+
+    if "predict" not in skip:
+        levels = [int(level) for level in args.concurrency.split(",")]
+        results["predict"] = bench_predict(
+            load_traces(args.traces), levels, args.requests, args.agent_workers,
+            args.first_token_delay, args.token_delay, use_quick_answers=args.quick_answers)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_results(json.load(f), report)
@@ -1,6 +1,20 @@
 import sqlite3
 import pandas as pd
 import os
+import time
+import argparse
+import hashlib
+import json
+import shutil
+import uuid
+import numpy as np
+from datetime import datetime
+from numpy.lib.format import open_memmap
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 
 # Step 0: Get the absolute path of the directory where this script is located
 # This ensures the code works regardless of where you run the terminal command from
@@ -10,49 +24,897 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 csv_file_path = os.path.join(current_dir, "retail-dataset-new.csv")
 db_file_path = os.path.join(current_dir, "retail_database.db")
 
-print(f"Looking for CSV at: {csv_file_path}")
+# Explicit column types for the 'sales' table. Every one of them must be in the CSV
+# (see check_sales_columns); columns that are not listed here are stored as TEXT.
+SALES_COLUMN_TYPES = {
+    "date": "DATE",
+    "product_category": "TEXT",
+    "product_name": "TEXT",
+    "units_sold": "INTEGER",
+    "unit_price": "REAL",
+    "revenue": "REAL",
+    "store_location": "TEXT",
+    "sales_channel": "TEXT",
+    "paydayeffect": "INTEGER",
+    "holiday": "INTEGER",
+    "promo": "INTEGER",
+}
 
-try:
-    # Step 1: Check file existence
-    if not os.path.exists(csv_file_path):
-        raise FileNotFoundError(f"File not found at {csv_file_path}. Please ensure the CSV is in the 'backend/app/databases' folder.")
-
-    # Read the first line of raw text to see if there are hidden quotes
-    with open(csv_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        raw_line = f.readline().strip()
-        print(f"DEBUG - Raw first line of file: {raw_line}")
-
-    # Load csv data. 
-    # engine='python' is more robust for auto-detecting format.
-    # quoting=3 (csv.QUOTE_NONE) forces pandas to ignore quotes and split strictly on ';'.
-    df = pd.read_csv(csv_file_path, sep=";", engine='python', quoting=3)
-
-    # Step 1.5: Clean up quotes from the data values
-    # Since quoting=3 treats quotes as text, we need to manually remove them from string columns
-    print("Cleaning quotes from data...")
-    for col in df.select_dtypes(include=['object']).columns:
-        # Remove " and ' characters, then trim whitespace
-        df[col] = df[col].str.replace('"', '').str.replace("'", "").str.strip()
-
-    # DEBUG: Print the first few rows to verify columns are split correctly
-    print("--- PREVIEW OF DATA (Check if columns are split) ---")
-    print(df.head())
-    print("----------------------------------------------------")
-
-    # Step 2: data clean up
-    # Remove quotes from column names if they stuck around
-    df.columns = df.columns.str.replace('"', '').str.strip()
-
-    # Step 3: connect to SQLite using the absolute path
-    conn = sqlite3.connect(db_file_path)
-    print(f"Database created/connected at: {db_file_path}")
-
-    # Step 4: load data to SQLite
-    df.to_sql("sales", conn, if_exists="replace", index=False)
-    print("Data successfully loaded into the 'sales' table.")
-
-    # Step 5: close the connection
-    conn.close()
-
-except Exception as e:
-    print(f"An error occurred: {e}")
\ No newline at end of file
+DEFAULT_CHUNK_SIZE = 200_000
+# Rows written per transaction. Large transactions avoid a journal sync per chunk.
+DEFAULT_COMMIT_EVERY = 1_000_000
+
+# Quote characters removed from the raw CSV bytes before parsing
+_QUOTE_BYTES = b'"\''
+
+# Columns that identify a sale when appending incrementally. Incoming rows that
+# match an existing row, or an earlier row of the same file, on all of these are
+# treated as duplicates and skipped. Accepted limitation: two real sales that agree
+# on every key column are appended as one (a full load keeps both).
+NATURAL_KEY = ("date", "product_name", "store_location", "sales_channel", "units_sold", "unit_price", "promo")
+
+# Single-column indexes on 'sales' for the filters the SQL agent uses most
+SALES_INDEXES = ["date", "store_location", "sales_channel", "product_category"]
+
+# Pre-aggregated rollups of 'sales', kept in sync on every load.
+# grain is the time column of the rollup ('day' -> "date", 'month' -> "month" as YYYY-MM);
+# every rollup stores SUM(units_sold), SUM(revenue) and the number of sales rows.
+# paydayeffect and holiday follow from the date, so they are free at day grain.
+ROLLUPS = {
+    "sales_rollup_daily": {
+        "grain": "day",
+        "dims": ["product_category", "store_location", "sales_channel", "paydayeffect", "holiday"],
+    },
+    "sales_rollup_daily_promo": {
+        "grain": "day",
+        "dims": ["product_category", "promo", "paydayeffect", "holiday"],
+    },
+    "sales_rollup_monthly": {
+        "grain": "month",
+        "dims": ["product_category", "product_name", "store_location", "sales_channel"],
+    },
+    "sales_rollup_monthly_promo": {
+        "grain": "month",
+        "dims": ["product_category", "store_location", "sales_channel", "promo"],
+    },
+}
+
+# Stratified random sample of 'sales' for approximate answers (see approximate.py):
+# up to SAMPLE_ROWS_PER_STRATUM rows of every store_location x sales_channel x month,
+# kept in sync on every load like the rollups. Each sampled row carries the size of
+# its stratum and how many rows of it were sampled, which is what the estimates
+# and their error bounds are computed from.
+SAMPLE_TABLE = "sales_sample"
+SAMPLE_STRATA = ["store_location", "sales_channel"]
+SAMPLE_ROWS_PER_STRATUM = int(os.environ.get("SAMPLE_ROWS_PER_STRATUM", "200"))
+
+# Bytes hashed at the start and at the end of the already-ingested part of a file
+# to check it was only appended to since the last run.
+FINGERPRINT_BYTES = 64 * 1024
+
+# Columnar snapshot of 'sales' written next to the database after every load:
+# one .npy file per column plus manifest.json, memory-mapped by the agent at startup.
+# Rows are in date order, so every month is a contiguous range of rows: the manifest's
+# "partitions" list (the partition catalog) maps months to row ranges.
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_MANIFEST = "manifest.json"
+# Low-cardinality text columns, stored as categorical codes
+CATEGORICAL_COLUMNS = ["product_category", "product_name", "store_location", "sales_channel"]
+# 0/1 columns, stored as booleans
+FLAG_COLUMNS = ["paydayeffect", "holiday", "promo"]
+# Money columns stay 64-bit so arithmetic in generated code can't overflow
+MONEY_COLUMNS = ["unit_price", "revenue"]
+
+# Distinct values (most common first) stored per text column in the dataset profile
+PROFILE_MAX_VALUES = 200
+
+
+def configure_connection(conn, bulk=False):
+    """
+    Apply the PRAGMAs we want for this database.
+    WAL lets the agent keep reading while we write. In bulk mode we also
+    relax fsyncs and give SQLite a bigger page cache for the load.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF" if bulk else "PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-200000")  # ~200 MB (negative value = KiB)
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB (None if the platform can't tell us)."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class QuoteStrippingReader:
+    """
+    Binary file wrapper that drops every quote character as the bytes are read.
+    This cleans the whole file in one C-level pass (bytes.translate) instead of
+    running string replaces column by column after parsing.
+    """
+
+    def __init__(self, raw, prefix=b"", limit=None):
+        self.raw = raw
+        # Bytes served before the file contents (used to re-send the header when resuming)
+        self.prefix = prefix
+        # Absolute file offset we stop at, so rows appended while we read are left for next time
+        self.limit = limit
+
+    def read(self, size=-1):
+        if self.prefix:
+            data, self.prefix = self.prefix, b""
+            return data.translate(None, _QUOTE_BYTES)
+        if self.limit is not None:
+            remaining = max(self.limit - self.raw.tell(), 0)
+            size = remaining if size is None or size < 0 else min(size, remaining)
+        return self.raw.read(size).translate(None, _QUOTE_BYTES)
+
+    def __iter__(self):
+        # pandas only checks that the handle is iterable
+        return self
+
+    def __next__(self):
+        line = self.raw.readline()
+        if not line:
+            raise StopIteration
+        return line.translate(None, _QUOTE_BYTES)
+
+
+def read_csv_chunks(path, chunksize=DEFAULT_CHUNK_SIZE, start_offset=0, end_offset=None):
+    """
+    Stream the CSV as cleaned, typed chunks.
+    quoting=3 (csv.QUOTE_NONE) makes the parser split strictly on ';'; quotes are
+    already gone by then. The C engine is much faster than engine='python'.
+    With `start_offset` the header is read first and parsing resumes at that byte.
+    """
+    with open(path, "rb") as raw:
+        prefix = b""
+        if start_offset:
+            prefix = raw.readline()
+            raw.seek(start_offset)
+        reader = pd.read_csv(QuoteStrippingReader(raw, prefix, end_offset), sep=";", engine="c", quoting=3, dtype=str,
+                             chunksize=chunksize, keep_default_na=False, skipinitialspace=True,
+                             encoding="utf-8", encoding_errors="ignore")
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            yield clean_chunk(chunk)
+
+
+def clean_chunk(chunk):
+    """Trim whitespace and cast each column to its schema type."""
+    for col in chunk.columns:
+        col_type = SALES_COLUMN_TYPES.get(col, "TEXT")
+        if col_type in ("INTEGER", "REAL"):
+            chunk[col] = pd.to_numeric(chunk[col].str.strip(), errors="coerce")
+            if col_type == "INTEGER":
+                chunk[col] = chunk[col].astype("Int64")
+        elif col_type == "DATE":
+            chunk[col] = pd.to_datetime(chunk[col].str.strip(), errors="coerce").dt.strftime("%Y-%m-%d")
+        else:
+            chunk[col] = chunk[col].str.strip()
+            chunk[col] = chunk[col].mask(chunk[col] == "")
+    return chunk
+
+
+def check_sales_columns(columns):
+    """Raise ValueError if the parsed CSV header lacks any column of SALES_COLUMN_TYPES."""
+    missing = [col for col in SALES_COLUMN_TYPES if col not in set(columns)]
+    if missing:
+        raise ValueError(f"CSV is missing required column(s) {', '.join(missing)}; found {', '.join(columns)}. "
+                         "Check the file and its ';' separator.")
+
+
+def create_sales_table(conn, columns, table="sales"):
+    """Create an explicitly typed sales table for the given CSV columns."""
+    column_defs = ", ".join(f'"{col}" {SALES_COLUMN_TYPES.get(col, "TEXT")}' for col in columns)
+    conn.execute(f'CREATE TABLE "{table}" ({column_defs})')
+
+
+def insert_chunk(conn, chunk, table="sales"):
+    """Bulk insert a cleaned chunk. The caller owns the transaction."""
+    rows = chunk.astype(object).where(chunk.notna(), None).to_numpy().tolist()
+    placeholders = ", ".join("?" for _ in chunk.columns)
+    conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+    return len(rows)
+
+
+# --- Ingestion metadata (watermarks and dataset version) ---
+
+def ensure_metadata_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_watermarks (
+            source TEXT PRIMARY KEY,
+            max_date DATE,
+            file_offset INTEGER,
+            file_hash TEXT,
+            rows INTEGER,
+            updated_at TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dataset_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            dataset_id TEXT,
+            updated_at TEXT
+        )
+    """)
+    # Databases from before dataset_id get it on their next load
+    if "dataset_id" not in [row[1] for row in conn.execute('PRAGMA table_info("dataset_version")')]:
+        conn.execute("ALTER TABLE dataset_version ADD COLUMN dataset_id TEXT")
+
+
+def get_dataset_version(conn):
+    """
+    Current version of the 'sales' data. It goes up by one every time rows are
+    loaded, so other components can detect changes with a single-row lookup.
+    Returns 0 for databases created before versioning existed.
+    """
+    try:
+        row = conn.execute("SELECT version FROM dataset_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def get_dataset_id(conn):
+    """
+    Random id given to the database on its first load. Versions start at 1 again in a
+    database that was deleted and rebuilt; (dataset id, version) never repeats.
+    Returns None for databases not loaded since ids were introduced.
+    """
+    try:
+        row = conn.execute("SELECT dataset_id FROM dataset_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def bump_dataset_version(conn):
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.execute("""
+        INSERT INTO dataset_version (id, version, dataset_id, updated_at) VALUES (1, 1, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET version = version + 1, dataset_id = COALESCE(dataset_id, excluded.dataset_id),
+                                      updated_at = excluded.updated_at
+    """, (uuid.uuid4().hex, now))
+    return get_dataset_version(conn)
+
+
+def get_watermark(conn, source):
+    row = conn.execute(
+        "SELECT max_date, file_offset, file_hash, rows FROM ingest_watermarks WHERE source = ?",
+        (source,),
+    ).fetchone()
+    if row is None:
+        return None
+    return {"max_date": row[0], "file_offset": row[1], "file_hash": row[2], "rows": row[3]}
+
+
+def save_watermark(conn, source, max_date, file_offset, file_hash, rows):
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.execute("""
+        INSERT INTO ingest_watermarks (source, max_date, file_offset, file_hash, rows, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(source) DO UPDATE SET
+            max_date = excluded.max_date, file_offset = excluded.file_offset,
+            file_hash = excluded.file_hash, rows = excluded.rows, updated_at = excluded.updated_at
+    """, (source, max_date, file_offset, file_hash, rows, now))
+
+
+def complete_lines_offset(path):
+    """Offset just past the last newline, so a half-written last line is not ingested."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(FINGERPRINT_BYTES, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            idx = block.rfind(b"\n")
+            if idx != -1:
+                return pos - step + idx + 1
+            pos -= step
+    return 0
+
+
+def file_fingerprint(path, offset):
+    """Hash of the first and last FINGERPRINT_BYTES before `offset` (cheap even for huge files)."""
+    digest = hashlib.sha256(str(offset).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(min(FINGERPRINT_BYTES, offset)))
+        tail_start = max(offset - FINGERPRINT_BYTES, 0)
+        f.seek(tail_start)
+        digest.update(f.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+def table_exists(conn, table):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def create_sales_indexes(conn):
+    sales_columns = {row[1] for row in conn.execute('PRAGMA table_info("sales")')}
+    for col in SALES_INDEXES:
+        if col in sales_columns:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_sales_{col}" ON "sales" ("{col}")')
+    conn.execute("ANALYZE")
+
+
+# --- Rollups ---
+
+def ensure_rollup_catalog(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_catalog (
+            name TEXT PRIMARY KEY,
+            grain TEXT NOT NULL,
+            dims TEXT NOT NULL,
+            rows INTEGER,
+            built_at TEXT
+        )
+    """)
+
+
+def build_rollups(conn, since_date=None):
+    """
+    (Re)build the ROLLUPS tables from 'sales'. The caller owns the transaction.
+    With `since_date` only the periods from that date on are recomputed, which is
+    what an incremental append needs; otherwise the rollups are rebuilt from scratch.
+    Rollups that need a column the 'sales' table doesn't have are skipped.
+    """
+    ensure_rollup_catalog(conn)
+    if since_date is None:
+        conn.execute("DELETE FROM rollup_catalog")
+    sales_columns = {row[1] for row in conn.execute('PRAGMA table_info("sales")')}
+    now = datetime.now().isoformat(timespec="seconds")
+
+    for name, spec in ROLLUPS.items():
+        dims = spec["dims"]
+        if not set(dims + ["date", "units_sold", "revenue"]) <= sales_columns:
+            continue
+
+        if spec["grain"] == "day":
+            time_col, time_expr = "date", '"date"'
+            period_start, period_key = since_date, since_date
+        else:
+            time_col, time_expr = "month", 'substr("date", 1, 7)'
+            period_start = since_date[:7] + "-01" if since_date else None
+            period_key = since_date[:7] if since_date else None
+        if not table_exists(conn, name):
+            period_start = None
+
+        dim_list = ", ".join(f'"{dim}"' for dim in dims)
+        if period_start is None:
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            conn.execute(f"""
+                CREATE TABLE "{name}" (
+                    "{time_col}" TEXT, {", ".join(f'"{dim}" {SALES_COLUMN_TYPES.get(dim, "TEXT")}' for dim in dims)},
+                    units_sold INTEGER, revenue REAL, row_count INTEGER
+                )
+            """)
+            where, params = "", ()
+        else:
+            conn.execute(f'DELETE FROM "{name}" WHERE "{time_col}" >= ?', (period_key,))
+            where, params = 'WHERE "date" >= ?', (period_start,)
+
+        conn.execute(f"""
+            INSERT INTO "{name}" ("{time_col}", {dim_list}, units_sold, revenue, row_count)
+            SELECT {time_expr}, {dim_list}, SUM(units_sold), SUM(revenue), COUNT(*)
+            FROM "sales" {where}
+            GROUP BY {time_expr}, {dim_list}
+        """, params)
+        if period_start is None:
+            conn.execute(f'CREATE INDEX "idx_{name}_{time_col}" ON "{name}" ("{time_col}")')
+
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        conn.execute("""
+            INSERT INTO rollup_catalog (name, grain, dims, rows, built_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                grain = excluded.grain, dims = excluded.dims, rows = excluded.rows, built_at = excluded.built_at
+        """, (name, spec["grain"], ",".join(dims), rows, now))
+
+
+# --- Stratified sample ---
+
+def build_sample(conn, since_date=None, rows_per_stratum=SAMPLE_ROWS_PER_STRATUM):
+    """
+    (Re)build SAMPLE_TABLE from 'sales'. The caller owns the transaction.
+    With `since_date` only the months from that date on are sampled again, as in
+    build_rollups(); otherwise the sample is rebuilt from scratch. Skipped when
+    'sales' lacks a stratum column.
+    """
+    sales_columns = [row[1] for row in conn.execute('PRAGMA table_info("sales")')]
+    if not set(SAMPLE_STRATA + ["date"]) <= set(sales_columns):
+        return
+    month_start = since_date[:7] + "-01" if since_date else None
+    if month_start is None or not table_exists(conn, SAMPLE_TABLE):
+        conn.execute(f'DROP TABLE IF EXISTS "{SAMPLE_TABLE}"')
+        column_defs = ", ".join(f'"{col}" {SALES_COLUMN_TYPES.get(col, "TEXT")}' for col in sales_columns)
+        conn.execute(f'CREATE TABLE "{SAMPLE_TABLE}" ({column_defs}, stratum_rows INTEGER, stratum_sampled INTEGER)')
+        where, params = "", ()
+    else:
+        conn.execute(f'DELETE FROM "{SAMPLE_TABLE}" WHERE "date" >= ?', (month_start,))
+        where, params = 'WHERE "date" >= ?', (month_start,)
+
+    column_list = ", ".join(f'"{col}"' for col in sales_columns)
+    stratum = ", ".join(f'"{col}"' for col in SAMPLE_STRATA) + ', substr("date", 1, 7)'
+    conn.execute(f"""
+        INSERT INTO "{SAMPLE_TABLE}" ({column_list}, stratum_rows, stratum_sampled)
+        SELECT {column_list}, stratum_rows, MIN(stratum_rows, ?)
+        FROM (
+            SELECT *,
+                   ROW_NUMBER() OVER (PARTITION BY {stratum} ORDER BY random()) AS pick,
+                   COUNT(*) OVER (PARTITION BY {stratum}) AS stratum_rows
+            FROM "sales" {where}
+        )
+        WHERE pick <= ?
+    """, (rows_per_stratum, *params, rows_per_stratum))
+    if month_start is None:
+        conn.execute(f'CREATE INDEX "idx_{SAMPLE_TABLE}_date" ON "{SAMPLE_TABLE}" ("date")')
+
+
+# --- Dataset profile ---
+
+def ensure_profile_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dataset_profile (
+            version INTEGER PRIMARY KEY,
+            profile TEXT NOT NULL,
+            built_at TEXT
+        )
+    """)
+
+
+def build_profile(conn, table="sales"):
+    """
+    Summary of `table` the agent would otherwise look up itself: row count, date range,
+    type and range of every column, and the distinct values (with row counts) of the
+    text and 0/1 columns. A handful of aggregate queries, run once per load.
+    """
+    info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    profile = {"table": table, "rows": rows, "columns": []}
+    for _, name, col_type, *_ in info:
+        column = {"name": name, "type": col_type or "TEXT"}
+        if name == "date" or col_type == "DATE":
+            column["kind"] = "date"
+            column["min"], column["max"] = conn.execute(
+                f'SELECT MIN("{name}"), MAX("{name}") FROM "{table}"').fetchone()
+        elif name in FLAG_COLUMNS:
+            column["kind"] = "flag"
+            column["share_true"] = conn.execute(f'SELECT AVG("{name}" = 1) FROM "{table}"').fetchone()[0]
+        elif col_type in ("INTEGER", "REAL"):
+            column["kind"] = "numeric"
+            column["min"], column["max"], column["mean"] = conn.execute(
+                f'SELECT MIN("{name}"), MAX("{name}"), AVG("{name}") FROM "{table}"').fetchone()
+        else:
+            column["kind"] = "category"
+            counts = conn.execute(
+                f'SELECT "{name}", COUNT(*) FROM "{table}" GROUP BY "{name}" ORDER BY COUNT(*) DESC').fetchall()
+            column["distinct"] = len(counts)
+            column["values"] = [[value, count] for value, count in counts[:PROFILE_MAX_VALUES]]
+        column["nulls"] = conn.execute(f'SELECT COUNT(*) FROM "{table}" WHERE "{name}" IS NULL').fetchone()[0]
+        profile["columns"].append(column)
+    return profile
+
+
+def save_profile(conn, version, profile):
+    """Store the profile of dataset `version`; profiles of older versions are dropped."""
+    ensure_profile_table(conn)
+    conn.execute("DELETE FROM dataset_profile WHERE version != ?", (version,))
+    conn.execute("""
+        INSERT INTO dataset_profile (version, profile, built_at) VALUES (?, ?, ?)
+        ON CONFLICT(version) DO UPDATE SET profile = excluded.profile, built_at = excluded.built_at
+    """, (version, json.dumps(profile), datetime.now().isoformat(timespec="seconds")))
+
+
+def get_dataset_profile(conn, version):
+    """The stored profile of dataset `version`, or None (databases loaded before profiles existed)."""
+    try:
+        row = conn.execute("SELECT profile FROM dataset_profile WHERE version = ?", (version,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def snapshot_dir(db_path):
+    """retail_database.db -> retail_database.snapshot/"""
+    return os.path.splitext(db_path)[0] + SNAPSHOT_SUFFIX
+
+
+def read_snapshot_manifest(path):
+    """The snapshot's manifest as a dict, or None if there is no complete snapshot at `path`."""
+    try:
+        with open(os.path.join(path, SNAPSHOT_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _smallest_int_dtype(low, high):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _snapshot_column_specs(conn, columns):
+    """
+    On-disk dtype of every column, decided from the whole table so that every
+    chunk is written the same way: categorical codes for text, bool for flags,
+    the smallest integer type that fits, datetime64 for 'date'.
+    """
+    specs = []
+    for col in columns:
+        sql_type = SALES_COLUMN_TYPES.get(col, "TEXT")
+        if col == "date":
+            specs.append({"name": col, "kind": "datetime", "dtype": "datetime64[ns]"})
+        elif sql_type == "TEXT":
+            categories = [row[0] for row in conn.execute(
+                f'SELECT DISTINCT "{col}" FROM "sales" WHERE "{col}" IS NOT NULL ORDER BY 1')]
+            # -1 marks missing values, as in pandas categorical codes
+            dtype = _smallest_int_dtype(-1, len(categories))
+            specs.append({"name": col, "kind": "category", "dtype": dtype.str, "categories": categories})
+        else:
+            low, high, nulls, fractional = conn.execute(f"""
+                SELECT MIN("{col}"), MAX("{col}"), SUM("{col}" IS NULL), SUM("{col}" != CAST("{col}" AS INTEGER))
+                FROM "sales"
+            """).fetchone()
+            if nulls or fractional or low is None:
+                dtype = np.dtype(np.float64)
+            elif col in FLAG_COLUMNS and low >= 0 and high <= 1:
+                dtype = np.dtype(bool)
+            elif col in MONEY_COLUMNS:
+                dtype = np.dtype(np.int64)
+            else:
+                dtype = _smallest_int_dtype(low, high)
+            specs.append({"name": col, "kind": "numeric", "dtype": dtype.str})
+    return specs
+
+
+def _snapshot_partitions(conn):
+    """
+    Partition catalog: one entry per month with its row range in the date-ordered snapshot.
+    Rows without a date sort first and get month None.
+    """
+    partitions = []
+    start = 0
+    for month, rows, min_date, max_date in conn.execute("""
+        SELECT substr("date", 1, 7), COUNT(*), MIN("date"), MAX("date")
+        FROM "sales" GROUP BY substr("date", 1, 7) ORDER BY substr("date", 1, 7)
+    """):
+        partitions.append({"month": month, "start": start, "stop": start + rows,
+                           "min_date": min_date, "max_date": max_date})
+        start += rows
+    return partitions
+
+
+def write_snapshot(db_path=db_file_path, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Write the columnar snapshot of 'sales' for the current dataset version.
+    Columns are filled chunk by chunk, in date order, into memory-mapped .npy files in a
+    temporary directory that then replaces the old snapshot, so readers never see a
+    half-written one. Returns the snapshot path, or None when the table is empty.
+    """
+    path = snapshot_dir(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        version = get_dataset_version(conn)
+        rows = conn.execute('SELECT COUNT(*) FROM "sales"').fetchone()[0]
+        if rows == 0:
+            return None
+        columns = [row[1] for row in conn.execute('PRAGMA table_info("sales")')]
+        specs = _snapshot_column_specs(conn, columns)
+        partitions = _snapshot_partitions(conn) if "date" in columns else []
+        order = '"date", rowid' if partitions else "rowid"
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = {
+            spec["name"]: open_memmap(os.path.join(tmp_path, spec["name"] + ".npy"), mode="w+",
+                                      dtype=np.dtype(spec["dtype"]), shape=(rows,))
+            for spec in specs
+        }
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        written = 0
+        for chunk in pd.read_sql_query(f'SELECT {column_list} FROM "sales" ORDER BY {order}', conn,
+                                       chunksize=chunksize):
+            end = written + len(chunk)
+            for spec in specs:
+                values = chunk[spec["name"]]
+                if spec["kind"] == "datetime":
+                    values = pd.to_datetime(values, errors="coerce").to_numpy(dtype="datetime64[ns]")
+                elif spec["kind"] == "category":
+                    values = pd.Categorical(values, categories=spec["categories"]).codes
+                arrays[spec["name"]][written:end] = values
+            written = end
+        for array in arrays.values():
+            array.flush()
+        del arrays
+    finally:
+        conn.close()
+
+    manifest = {
+        "version": version,
+        "rows": rows,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "columns": specs,
+        "partitions": partitions,
+    }
+    with open(os.path.join(tmp_path, SNAPSHOT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    # Swap directories. Processes that still map the old files keep their pages until they reload.
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+
+def refresh_snapshot(db_path=db_file_path):
+    """Rewrite the snapshot unless it already matches the dataset version. Failures only warn."""
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            version = get_dataset_version(conn)
+        finally:
+            conn.close()
+        manifest = read_snapshot_manifest(snapshot_dir(db_path))
+        if manifest is not None and manifest.get("version") == version:
+            return snapshot_dir(db_path)
+        started = time.perf_counter()
+        path = write_snapshot(db_path)
+        if path:
+            print(f"Columnar snapshot written to {path} in {time.perf_counter() - started:.1f}s.")
+        return path
+    except Exception as e:
+        print(f"Warning: could not write the columnar snapshot: {e}")
+        return None
+
+
+def _finish_stats(started, total_rows, **extra):
+    elapsed = time.perf_counter() - started
+    stats = {
+        "rows": total_rows,
+        "seconds": elapsed,
+        "rows_per_sec": total_rows / elapsed if elapsed > 0 else 0.0,
+        "peak_memory_mb": peak_memory_mb(),
+    }
+    stats.update(extra)
+    return stats
+
+
+def ingest_csv(csv_path=csv_file_path, db_path=db_file_path, chunksize=DEFAULT_CHUNK_SIZE,
+               commit_every=DEFAULT_COMMIT_EVERY, incremental=False):
+    """
+    Load the CSV into the 'sales' table.
+    By default the table is replaced. With `incremental=True` only rows that are new
+    since the last run are appended (see `append_csv`).
+    The CSV is read and written chunk by chunk, so memory stays around one chunk.
+    Returns a dict with rows, seconds, rows_per_sec, peak_memory_mb and version.
+    """
+    if incremental:
+        return append_csv(csv_path, db_path, chunksize, commit_every)
+
+    started = time.perf_counter()
+    source = os.path.abspath(csv_path)
+    end_offset = complete_lines_offset(csv_path)
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves to control transaction size
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    print(f"Database created/connected at: {db_path}")
+    try:
+        configure_connection(conn, bulk=True)
+        ensure_metadata_tables(conn)
+
+        total_rows = 0
+        rows_in_txn = 0
+        conn.execute("BEGIN")
+        for i, chunk in enumerate(read_csv_chunks(csv_path, chunksize, end_offset=end_offset)):
+            if i == 0:
+                # DEBUG: Print the first few rows to verify columns are split correctly
+                print("--- PREVIEW OF DATA (Check if columns are split) ---")
+                print(chunk.head())
+                print("----------------------------------------------------")
+                # A wrong file or separator must not replace the table we have
+                check_sales_columns(chunk.columns)
+                conn.execute('DROP TABLE IF EXISTS "sales"')
+                create_sales_table(conn, chunk.columns)
+
+            written = insert_chunk(conn, chunk)
+            total_rows += written
+            rows_in_txn += written
+            if rows_in_txn >= commit_every:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                rows_in_txn = 0
+
+        # Every rebuild drops the old watermarks: they described the previous table
+        conn.execute("DELETE FROM ingest_watermarks")
+        max_date = conn.execute('SELECT MAX("date") FROM "sales"').fetchone()[0]
+        save_watermark(conn, source, max_date, end_offset, file_fingerprint(csv_path, end_offset), total_rows)
+        # Indexes are built once after the bulk insert, which is much faster than maintaining them row by row
+        create_sales_indexes(conn)
+        build_rollups(conn)
+        build_sample(conn)
+        version = bump_dataset_version(conn)
+        save_profile(conn, version, build_profile(conn))
+        conn.execute("COMMIT")
+
+        configure_connection(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    refresh_snapshot(db_path)
+    return _finish_stats(started, total_rows, version=version)
+
+
+def append_csv(csv_path=csv_file_path, db_path=db_file_path, chunksize=DEFAULT_CHUNK_SIZE,
+               commit_every=DEFAULT_COMMIT_EVERY):
+    """
+    Append only the rows that are new since this CSV was last ingested.
+
+    A source without a watermark (a new file) is read from the start. If the file
+    was only appended to (the fingerprint of the part we already read still matches),
+    parsing resumes at the stored byte offset. Otherwise the whole file is read again
+    and rows older than the stored max date are skipped. Only a database without a
+    'sales' table gets a full load.
+    In both cases rows already present on NATURAL_KEY, or repeated within the file,
+    are dropped, and the dataset version is bumped when at least one row was added.
+    """
+    started = time.perf_counter()
+    source = os.path.abspath(csv_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    print(f"Database created/connected at: {db_path}")
+    try:
+        configure_connection(conn, bulk=True)
+        ensure_metadata_tables(conn)
+        watermark = get_watermark(conn, source)
+    except Exception:
+        conn.close()
+        raise
+
+    if not table_exists(conn, "sales"):
+        conn.close()
+        print("No sales table yet, doing a full load.")
+        return ingest_csv(csv_path, db_path, chunksize, commit_every)
+
+    try:
+        end_offset = complete_lines_offset(csv_path)
+        start_offset = 0
+        min_date = None
+        if watermark is None:
+            # A new source (e.g. the next daily file): append all of it, still deduplicated on NATURAL_KEY
+            print("New source, appending all of its rows.")
+        else:
+            stored_offset = watermark["file_offset"] or 0
+            if 0 < stored_offset <= end_offset and file_fingerprint(csv_path, stored_offset) == watermark["file_hash"]:
+                start_offset = stored_offset
+                print(f"Source was appended to, resuming at byte {start_offset}.")
+            else:
+                min_date = watermark["max_date"]
+                print(f"Source changed, re-reading rows from {min_date} onwards.")
+
+        if start_offset == end_offset:
+            print("No new rows since the last run.")
+            version = get_dataset_version(conn)
+            conn.close()
+            refresh_snapshot(db_path)
+            return _finish_stats(started, 0, skipped=0, version=version)
+
+        key_cols = ", ".join(f'"{col}"' for col in NATURAL_KEY)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_sales_natural_key ON sales ({key_cols})")
+        conn.execute("DROP TABLE IF EXISTS temp.sales_staging")
+        conn.execute('CREATE TEMP TABLE sales_staging AS SELECT * FROM "sales" WHERE 0')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info("sales")')]
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        key_match = " AND ".join(f's."{col}" IS n."{col}"' for col in NATURAL_KEY)
+
+        appended = 0
+        skipped = 0
+        since_date = None
+        # Newest date read from this source: where a changed file is re-read from next time
+        source_max_date = watermark["max_date"] if watermark else None
+        rows_in_txn = 0
+        conn.execute("BEGIN")
+        for chunk in read_csv_chunks(csv_path, chunksize, start_offset, end_offset):
+            check_sales_columns(chunk.columns)
+            if min_date is not None:
+                chunk = chunk[chunk["date"] >= min_date]
+            if chunk.empty:
+                continue
+            if chunk["date"].notna().any():
+                chunk_max = chunk["date"].max()
+                source_max_date = chunk_max if source_max_date is None else max(source_max_date, chunk_max)
+            # Repeats within the chunk are dropped like repeats of earlier chunks (already in 'sales')
+            insert_chunk(conn, chunk[columns].drop_duplicates(subset=list(NATURAL_KEY)), table="sales_staging")
+            added = conn.execute(f"""
+                INSERT INTO "sales" ({column_list})
+                SELECT {column_list} FROM sales_staging n
+                WHERE NOT EXISTS (SELECT 1 FROM "sales" s WHERE {key_match})
+            """).rowcount
+            conn.execute("DELETE FROM sales_staging")
+            if added and chunk["date"].notna().any():
+                chunk_min = chunk["date"].min()
+                since_date = chunk_min if since_date is None else min(since_date, chunk_min)
+            appended += added
+            skipped += len(chunk) - added
+            rows_in_txn += len(chunk)
+            if rows_in_txn >= commit_every:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                rows_in_txn = 0
+
+        save_watermark(conn, source, source_max_date, end_offset, file_fingerprint(csv_path, end_offset),
+                       ((watermark or {}).get("rows") or 0) + appended)
+        if appended:
+            create_sales_indexes(conn)
+            build_rollups(conn, since_date)
+            build_sample(conn, since_date)
+            version = bump_dataset_version(conn)
+            save_profile(conn, version, build_profile(conn))
+        else:
+            version = get_dataset_version(conn)
+        conn.execute("COMMIT")
+
+        configure_connection(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    refresh_snapshot(db_path)
+    return _finish_stats(started, appended, skipped=skipped, version=version)
+
+
+def print_stats(stats):
+    peak = stats["peak_memory_mb"]
+    peak_text = f"{peak:.0f} MB" if peak is not None else "n/a"
+    print(f"Loaded {stats['rows']} rows in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/s, peak memory {peak_text}).")
+    if stats.get("skipped"):
+        print(f"Skipped {stats['skipped']} duplicate or already-ingested rows.")
+    print(f"Dataset version is now {stats['version']}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the retail CSV into SQLite.")
+    parser.add_argument("--csv", default=csv_file_path)
+    parser.add_argument("--db", default=db_file_path)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--commit-every", type=int, default=DEFAULT_COMMIT_EVERY)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Append only rows that are new since the last run instead of replacing the table.")
+    args = parser.parse_args()
+
+    print(f"Looking for CSV at: {args.csv}")
+
+    try:
+        # Step 1: Check file existence
+        if not os.path.exists(args.csv):
+            raise FileNotFoundError(f"File not found at {args.csv}. Please ensure the CSV is in the 'backend/app/databases' folder.")
+
+        # Read the first line of raw text to see if there are hidden quotes
+        with open(args.csv, 'r', encoding='utf-8', errors='ignore') as f:
+            raw_line = f.readline().strip()
+            print(f"DEBUG - Raw first line of file: {raw_line}")
+
+        # Step 2: stream, clean and bulk load into the 'sales' table
+        stats = ingest_csv(args.csv, args.db, args.chunksize, args.commit_every, incremental=args.incremental)
+        print("Data successfully loaded into the 'sales' table.")
+        print_stats(stats)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
@@ -1,147 +1,260 @@
+import os
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
 import pandas as pd
 import numpy as np
-import random
-from datetime import datetime, timedelta
 
-def generate_large_dataset(num_rows=300000):
-    print(f"Generating {num_rows} rows of Indonesian retail data...")
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = None
+    pq = None
 
-    # --- Configuration Lists ---
-    
-    locations = [
-        'Jakarta (Grand Indonesia)', 'Jakarta (Senayan City)', 'Jakarta (Kota Kasablanka)', 
-        'Jakarta (Pondok Indah Mall)', 'Surabaya (Tunjungan Plaza)', 'Surabaya (Galaxy Mall)',
-        'Bandung (Paris Van Java)', 'Bandung (Trans Studio)', 'Medan (Sun Plaza)',
-        'Bali (Beachwalk Kuta)', 'Yogyakarta (Ambarrukmo)', 'Semarang (Paragon City)',
-        'Makassar (Trans Studio)', 'Depok (Margo City)', 'Tangerang (AEON Mall)'
-    ]
+# --- Configuration Lists ---
+
+locations = [
+    'Jakarta (Grand Indonesia)', 'Jakarta (Senayan City)', 'Jakarta (Kota Kasablanka)',
+    'Jakarta (Pondok Indah Mall)', 'Surabaya (Tunjungan Plaza)', 'Surabaya (Galaxy Mall)',
+    'Bandung (Paris Van Java)', 'Bandung (Trans Studio)', 'Medan (Sun Plaza)',
+    'Bali (Beachwalk Kuta)', 'Yogyakarta (Ambarrukmo)', 'Semarang (Paragon City)',
+    'Makassar (Trans Studio)', 'Depok (Margo City)', 'Tangerang (AEON Mall)'
+]
+
+channels = [
+    'In-store', 'Shopee', 'Tokopedia', 'TikTok Shop', 'Zalora', 'Website', 'Lazada'
+]
 
-    channels = [
-        'In-store', 'Shopee', 'Tokopedia', 'TikTok Shop', 'Zalora', 'Website', 'Lazada'
+products = {
+    "Women's Clothing": [
+        ('Batik Maxi Dress', 450000), ('Kebaya Modern', 1200000), ('Denim Jacket', 499000),
+        ('Pleated Skirt', 225000), ('Cotton Blouse', 180000), ('Tunik Muslimah', 250000)
+    ],
+    "Men's Clothing": [
+        ('Batik Shirt Long Sleeve', 550000), ('Slim Fit Chinos', 350000),
+        ('Graphic T-Shirt', 120000), ('Tailored Suit Jacket', 2500000), ('Koko Shirt', 200000)
+    ],
+    "Footwear": [
+        ('Leather Pantofel', 850000), ('Running Sneakers', 1200000),
+        ('Slip-on Loafers', 650000), ('Canvas Sneakers', 250000), ('Platform Sandals', 350000)
+    ],
+    "Accessories": [
+        ('Silk Hijab', 125000), ('Leather Belt', 150000), ('Sling Bag', 185000),
+        ('Gold Plated Necklace', 250000), ('Aviator Sunglasses', 150000)
+    ],
+    "Activewear": [
+        ('Yoga Leggings', 250000), ('Performance Hoodie', 450000),
+        ('Sports Bra', 199000), ('Running Shorts', 180000), ('Jersey Bola', 150000)
     ]
+}
+
+columns = [
+    'date', 'product_category', 'product_name', 'units_sold',
+    'unit_price', 'revenue', 'store_location', 'sales_channel',
+    'paydayeffect', 'holiday', 'promo'
+]
+
+# Flatten product list into parallel arrays so rows can be picked by index
+category_names = list(products.keys())
+product_names = []
+product_category_codes = []
+product_base_prices = []
+for cat_code, (cat, items) in enumerate(products.items()):
+    for name, base_price in items:
+        product_names.append(name)
+        product_category_codes.append(cat_code)
+        product_base_prices.append(base_price)
+product_category_codes = np.array(product_category_codes, dtype=np.int8)
+product_base_prices = np.array(product_base_prices, dtype=np.int64)
+
+# --- Date Range ---
+START_DATE = datetime(2024, 1, 1)
+END_DATE = datetime(2025, 12, 31)
+DATE_RANGE_DAYS = (END_DATE - START_DATE).days
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def _daily_row_counts(num_rows, seed_seq):
+    """
+    Decide how many rows land on each day up front.
+    A multinomial over the days is the same distribution as sorting
+    `num_rows` uniform random days, but it is only DATE_RANGE_DAYS long,
+    so every chunk can find its (sorted) dates without the full list.
+    """
+    rng = np.random.default_rng(seed_seq)
+    pvals = np.full(DATE_RANGE_DAYS, 1.0 / DATE_RANGE_DAYS)
+    return rng.multinomial(num_rows, pvals)
+
+
+def generate_chunk(start_row, num_rows, day_offsets_cum, seed_seq):
+    """
+    Build rows [start_row, start_row + num_rows) as a DataFrame.
+    Every random draw for the chunk comes from its own seed, so the
+    output does not depend on how many processes are used.
+    """
+    rng = np.random.default_rng(seed_seq)
+
+    # 1. Dates (already sorted because the day counts are cumulative)
+    row_ids = np.arange(start_row, start_row + num_rows, dtype=np.int64)
+    day_idx = np.searchsorted(day_offsets_cum, row_ids, side='right')
+    dates = np.datetime64(START_DATE.date(), 'D') + day_idx.astype('timedelta64[D]')
+
+    # 2. Random Selection
+    prod_idx = rng.integers(0, len(product_names), num_rows)
+    loc_idx = rng.integers(0, len(locations), num_rows)
+    channel_idx = rng.integers(0, len(channels), num_rows)
+
+    # 3. Price Variation (Simulate discounts/fluctuations), rounded down to 1000 IDR
+    price_variance = rng.uniform(0.9, 1.1, num_rows)
+    unit_price = (np.floor(product_base_prices[prod_idx] * price_variance / 1000) * 1000).astype(np.int64)
+
+    # 4. Units Sold (Weighted: lower prices sell more)
+    units_high = np.where(unit_price < 200000, 15, np.where(unit_price < 1000000, 6, 3))
+    units = rng.integers(1, units_high)
+
+    # 5. Feature Engineering
+    months = dates.astype('datetime64[M]')
+    day = (dates - months).astype(np.int64) + 1
+    month = months.astype(np.int64) % 12 + 1
+    year = months.astype('datetime64[Y]').astype(np.int64) + 1970
+
+    # Payday Effect: In Indonesia, usually 25th-30th or 1st-5th
+    is_payday = (day >= 25) | (day <= 5)
+
+    # Holidays: New Year, Eid Al-Fitr (approx April for 2024, March for 2025), Independence (Aug), Christmas
+    is_holiday = (
+        ((month == 1) & (day == 1)) |
+        ((month == 8) & (day == 17)) |
+        ((month == 12) & (day == 25)) |
+        ((month == 4) & (day >= 9) & (day <= 12) & (year == 2024)) |
+        ((month == 3) & (day >= 29) & (day <= 31) & (year == 2025))
+    )
 
-    products = {
-        "Women's Clothing": [
-            ('Batik Maxi Dress', 450000), ('Kebaya Modern', 1200000), ('Denim Jacket', 499000),
-            ('Pleated Skirt', 225000), ('Cotton Blouse', 180000), ('Tunik Muslimah', 250000)
-        ],
-        "Men's Clothing": [
-            ('Batik Shirt Long Sleeve', 550000), ('Slim Fit Chinos', 350000), 
-            ('Graphic T-Shirt', 120000), ('Tailored Suit Jacket', 2500000), ('Koko Shirt', 200000)
-        ],
-        "Footwear": [
-            ('Leather Pantofel', 850000), ('Running Sneakers', 1200000), 
-            ('Slip-on Loafers', 650000), ('Canvas Sneakers', 250000), ('Platform Sandals', 350000)
-        ],
-        "Accessories": [
-            ('Silk Hijab', 125000), ('Leather Belt', 150000), ('Sling Bag', 185000),
-            ('Gold Plated Necklace', 250000), ('Aviator Sunglasses', 150000)
-        ],
-        "Activewear": [
-            ('Yoga Leggings', 250000), ('Performance Hoodie', 450000), 
-            ('Sports Bra', 199000), ('Running Shorts', 180000), ('Jersey Bola', 150000)
-        ]
-    }
-
-    # Flatten product list for easier selection
-    flat_products = []
-    for cat, items in products.items():
-        for name, base_price in items:
-            flat_products.append({'category': cat, 'name': name, 'base_price': base_price})
-
-    # --- Date Generation ---
-    start_date = datetime(2024, 1, 1)
-    end_date = datetime(2025, 12, 31)
-    date_range_days = (end_date - start_date).days
-    
-    # Generate random dates using numpy for speed
-    random_days = np.random.randint(0, date_range_days, num_rows)
-    dates = [start_date + timedelta(days=int(day)) for day in random_days]
-    dates.sort() # Sort by date usually looks better
-
-    # --- Data Construction ---
-    data = []
-    
-    for date_val in dates:
-        # 1. Random Selection
-        prod = random.choice(flat_products)
-        loc = random.choice(locations)
-        channel = random.choice(channels)
-        
-        # 2. Price Variation (Simulate discounts/fluctuations)
-        price_variance = random.uniform(0.9, 1.1)
-        final_unit_price = int(prod['base_price'] * price_variance / 1000) * 1000 # Round to nearest 1000 IDR
-        
-        # 3. Units Sold (Weighted: lower prices sell more)
-        if final_unit_price < 200000:
-            units = np.random.randint(1, 15)
-        elif final_unit_price < 1000000:
-            units = np.random.randint(1, 6)
-        else:
-            units = np.random.randint(1, 3)
-
-        revenue = units * final_unit_price
-
-        # 4. Feature Engineering
-        
-        # Payday Effect: In Indonesia, usually 25th-30th or 1st-5th
-        day = date_val.day
-        is_payday = 1 if (day >= 25 or day <= 5) else 0
-
-        # Holidays (Simplified Major Indo Holidays)
-        is_holiday = 0
-        month = date_val.month
-        # New Year, Eid Al-Fitr (approx April for 2024, March for 2025), Independence (Aug), Christmas
-        if (month == 1 and day == 1) or \
-           (month == 8 and day == 17) or \
-           (month == 12 and day == 25) or \
-           (month == 4 and 9 <= day <= 12 and date_val.year == 2024) or \
-           (month == 3 and 29 <= day <= 31 and date_val.year == 2025):
-            is_holiday = 1
-
-        # Promo: Higher chance on 'Twin Dates' (1.1, 2.2, etc) or Payday
-        is_promo = 0
-        if (month == day) or is_payday or is_holiday:
-            # 60% chance of promo on special days
-            if random.random() < 0.6:
-                is_promo = 1
-        else:
-            # 10% random promo otherwise
-            if random.random() < 0.1:
-                is_promo = 1
-        
-        # Adjust Price/Sales based on Promo
-        if is_promo:
-            final_unit_price = int(final_unit_price * 0.8) # 20% off
-            units = int(units * 1.5) # Sales boost
-            revenue = units * final_unit_price
-
-        data.append([
-            date_val.strftime('%Y-%m-%d'),
-            prod['category'],
-            prod['name'],
-            units,
-            final_unit_price,
-            revenue,
-            loc,
-            channel,
-            is_payday,
-            is_holiday,
-            is_promo
-        ])
-
-    # --- Create DataFrame and Save ---
-    columns = [
-        'date', 'product_category', 'product_name', 'units_sold', 
-        'unit_price', 'revenue', 'store_location', 'sales_channel', 
-        'paydayeffect', 'holiday', 'promo'
+    # Promo: 60% chance on 'Twin Dates', payday or holidays, 10% otherwise
+    special_day = (month == day) | is_payday | is_holiday
+    is_promo = rng.random(num_rows) < np.where(special_day, 0.6, 0.1)
+
+    # Adjust Price/Sales based on Promo (20% off, sales boost)
+    unit_price = np.where(is_promo, (unit_price * 0.8).astype(np.int64), unit_price)
+    units = np.where(is_promo, (units * 1.5).astype(np.int64), units)
+    revenue = units * unit_price
+
+    return pd.DataFrame({
+        'date': dates.astype(str),
+        'product_category': pd.Categorical.from_codes(product_category_codes[prod_idx], category_names),
+        'product_name': pd.Categorical.from_codes(prod_idx, product_names),
+        'units_sold': units,
+        'unit_price': unit_price,
+        'revenue': revenue,
+        'store_location': pd.Categorical.from_codes(loc_idx, locations),
+        'sales_channel': pd.Categorical.from_codes(channel_idx, channels),
+        'paydayeffect': is_payday.astype(np.int8),
+        'holiday': is_holiday.astype(np.int8),
+        'promo': is_promo.astype(np.int8),
+    }, columns=columns)
+
+
+def _generate_chunk_task(args):
+    return generate_chunk(*args)
+
+
+def iter_chunks(num_rows, chunk_size=DEFAULT_CHUNK_SIZE, seed=None, workers=1):
+    """
+    Yield the dataset as DataFrames of at most `chunk_size` rows, in date order.
+    With `workers` > 1 the chunks are built in a process pool, but at most
+    two chunks per worker are in flight so memory stays flat.
+    """
+    root = np.random.SeedSequence(seed)
+    date_seed, chunk_root = root.spawn(2)
+    day_offsets_cum = np.cumsum(_daily_row_counts(num_rows, date_seed))
+
+    num_chunks = (num_rows + chunk_size - 1) // chunk_size
+    chunk_seeds = chunk_root.spawn(num_chunks)
+    tasks = [
+        (i * chunk_size, min(chunk_size, num_rows - i * chunk_size), day_offsets_cum, chunk_seeds[i])
+        for i in range(num_chunks)
     ]
-    
-    df = pd.DataFrame(data, columns=columns)
-    
-    filename = 'indonesian_fashion_sales_300k.csv'
-    df.to_csv(filename, index=False)
-    print(f"Successfully created {filename} with {len(df)} rows.")
+
+    if workers <= 1:
+        for task in tasks:
+            yield generate_chunk(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        next_task = 0
+        max_in_flight = workers * 2
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < max_in_flight:
+                pending.append(executor.submit(_generate_chunk_task, tasks[next_task]))
+                next_task += 1
+            yield pending.pop(0).result()
+
+
+def generate_large_dataset(num_rows=300000, filename=None, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE,
+                           seed=None, workers=1, sep=','):
+    """
+    Write `num_rows` rows of synthetic retail data to CSV or Parquet.
+    Rows are produced and written chunk by chunk, so memory is bounded by
+    `chunk_size` (times the number of in-flight workers) rather than `num_rows`.
+    """
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported format '{fmt}'. Use 'csv' or 'parquet'.")
+    if fmt == 'parquet' and pq is None:
+        raise ImportError("Writing Parquet requires 'pyarrow'. Install it or use fmt='csv'.")
+
+    if filename is None:
+        filename = f'indonesian_fashion_sales_{num_rows // 1000}k.{fmt}'
+
+    print(f"Generating {num_rows} rows of Indonesian retail data...")
+    started = time.perf_counter()
+
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    written = 0
+    parquet_writer = None
+    try:
+        for chunk in iter_chunks(num_rows, chunk_size=chunk_size, seed=seed, workers=workers):
+            if fmt == 'csv':
+                chunk.to_csv(filename, mode='a', header=(written == 0), index=False, sep=sep)
+            else:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(filename, table.schema)
+                parquet_writer.write_table(table)
+            written += len(chunk)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+    elapsed = time.perf_counter() - started
+    rate = written / elapsed if elapsed > 0 else float('inf')
+    print(f"Successfully created {filename} with {written} rows in {elapsed:.1f}s ({rate:,.0f} rows/s).")
+    return filename
+
 
 if __name__ == "__main__":
-    generate_large_dataset(800000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic Indonesian retail sales data.")
+    parser.add_argument("--rows", type=int, default=800000)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--sep", default=",")
+    args = parser.parse_args()
+
+    generate_large_dataset(
+        args.rows,
+        filename=args.output,
+        fmt=args.format,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        workers=args.workers,
+        sep=args.sep,
+    )
@@ -0,0 +1,99 @@
+"""
+Dataset profile for the agent prompt.
+
+Before answering, the agent tends to spend LLM round trips on `df.head()`,
+`df['store_location'].unique()` or the date range. databases/database.py stores
+a profile with exactly that (row count, date range, column ranges, distinct
+values) for every dataset version. It is formatted compactly here and put into
+the agent's prompt, so typical questions go straight to the computation.
+"""
+import os
+import sqlite3
+import logging
+import threading
+from databases.database import build_profile, get_dataset_profile, get_dataset_version
+
+# --- CONFIGURATION ---
+# Set DATASET_PROFILE=0 to leave the profile out of the prompt
+PROFILE_IN_PROMPT = os.environ.get("DATASET_PROFILE", "1") == "1"
+# Columns with more distinct values only list the most common ones
+PROFILE_PROMPT_MAX_VALUES = int(os.environ.get("DATASET_PROFILE_MAX_VALUES", "30"))
+
+logger = logging.getLogger(__name__)
+
+# Latest profile loaded per database, as db_path -> (version, profile)
+_cached = {}
+_lock = threading.Lock()
+
+
+def load_profile(db_path, version=None):
+    """
+    Profile of dataset `version` (default: the current one). Databases loaded before
+    profiles existed get one built on the fly; either way it is cached per database and version.
+    """
+    with _lock:
+        cached = _cached.get(db_path)
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            if version is None:
+                version = get_dataset_version(conn)
+                if cached is not None and cached[0] == version:
+                    return cached[1]
+            profile = get_dataset_profile(conn, version)
+            if profile is None:
+                profile = build_profile(conn)
+        finally:
+            conn.close()
+        _cached[db_path] = (version, profile)
+        return profile
+
+
+def _number(value):
+    if value is None:
+        return "n/a"
+    if float(value).is_integer():
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+
+def format_profile(profile, dtypes=None, max_values=PROFILE_PROMPT_MAX_VALUES):
+    """
+    One line per column. `dtypes` maps column names to the type the agent sees
+    (e.g. the DataFrame's dtypes); otherwise the SQLite types are shown.
+    """
+    lines = [f"Data profile ({profile['rows']:,} rows). It describes all of the data, "
+             "so there is no need to inspect the data before computing the answer:"]
+    for column in profile["columns"]:
+        name = column["name"]
+        dtype = str(dtypes[name]) if dtypes is not None and name in dtypes else column["type"]
+        kind = column["kind"]
+        if kind == "date":
+            text = f"{column['min']} to {column['max']}"
+        elif kind == "flag":
+            share = column["share_true"] or 0.0
+            text = f"flag, set in {share:.0%} of rows"
+        elif kind == "numeric":
+            text = f"{_number(column['min'])} to {_number(column['max'])}, mean {_number(column['mean'])}"
+        else:
+            values = [str(value) for value, _ in column["values"][:max_values]]
+            if column["distinct"] > len(values):
+                text = f"{column['distinct']} values, most common: {', '.join(values)}, ..."
+            else:
+                text = f"{column['distinct']} values: {', '.join(values)}"
+        if column.get("nulls"):
+            text += f"; {column['nulls']:,} empty"
+        lines.append(f"- {name} ({dtype}): {text}")
+    return "\n".join(lines)
+
+
+def profile_prompt(db_path, version=None, dtypes=None):
+    """Profile text for the prompt, or "" when it is turned off or can't be read."""
+    if not PROFILE_IN_PROMPT:
+        return ""
+    try:
+        return format_profile(load_profile(db_path, version), dtypes)
+    except (sqlite3.Error, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"⚠️ Dataset profile unavailable, the agent will explore the data itself: {e}")
+        return ""
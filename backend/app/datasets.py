@@ -0,0 +1,217 @@
+"""
+Named sales datasets served by one process.
+
+Each brand or region has its own SQLite database, built with databases/database.py.
+SALES_DATASETS lists them as name=path pairs. The database at agent.DB_PATH is
+always there as "default". /predict picks one with its `dataset` field. A dataset's
+frame (and sandbox workers) load on the first question that targets it. When the
+loaded datasets take more than DATASET_MEMORY_BUDGET_MB, the least recently used
+are unloaded, and their agents with them. They load again on their next question.
+The default dataset is never unloaded: the agent pools keep agents on it ready.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from agent import AGENT_MODE, DEFAULT_DATASET, USE_SANDBOX, SalesDataset, default_dataset
+from reloader import DatasetWatcher, RELOAD_POLL_SECONDS
+
+# --- CONFIGURATION ---
+# Named datasets, e.g. "brand_a=/data/brand_a.db,jakarta=/data/jakarta.db"
+SALES_DATASETS = os.environ.get("SALES_DATASETS", "")
+# Memory of the loaded datasets (frames plus their sandbox copies); beyond it the least recently used unload
+DATASET_MEMORY_BUDGET_MB = float(os.environ.get("DATASET_MEMORY_BUDGET_MB", "2048"))
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownDataset(LookupError):
+    """Raised for a dataset name that isn't registered. Maps to 404."""
+
+
+def parse_datasets(spec):
+    """{name: db_path} from "name=path,name=path"; raises ValueError on a malformed entry."""
+    paths = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, path = entry.partition("=")
+        name, path = name.strip(), path.strip()
+        if not sep or not name or not path:
+            raise ValueError(f"SALES_DATASETS entry '{entry}' is not name=path")
+        if name == DEFAULT_DATASET:
+            raise ValueError(f"'{DEFAULT_DATASET}' is the database at DB_PATH and can't be redefined")
+        paths[name] = path
+    return paths
+
+
+class _DatasetStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.last_load_seconds = None
+        self.load_failures = 0
+        self.evictions = 0
+        self.last_used = None
+
+
+class DatasetRegistry:
+    """
+    The datasets by name, loaded on first use and unloaded least recently used first.
+    `on_dataset_changed(name)` is called when a dataset's data is unloaded or reloaded,
+    so the agent pools can drop the agents they built on it.
+    """
+
+    def __init__(self, paths=None, memory_budget=DATASET_MEMORY_BUDGET_MB * 1024 * 1024,
+                 on_dataset_changed=None, reload_interval=RELOAD_POLL_SECONDS):
+        paths = parse_datasets(SALES_DATASETS) if paths is None else paths
+        self.memory_budget = int(memory_budget)
+        self.on_dataset_changed = on_dataset_changed
+        self.reload_interval = reload_interval
+        self._datasets = {DEFAULT_DATASET: default_dataset}
+        self._datasets.update({name: SalesDataset(name, path) for name, path in paths.items()})
+        self._stats = {name: _DatasetStats() for name in self._datasets}
+        self._load_locks = {name: threading.Lock() for name in self._datasets}
+        # Loaded datasets, least recently used first
+        self._loaded = OrderedDict()
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return list(self._datasets)
+
+    def resolve(self, name):
+        """Registered name for a request's `dataset` field (empty: the default); raises UnknownDataset."""
+        name = name or DEFAULT_DATASET
+        if name not in self._datasets:
+            raise UnknownDataset(f"Unknown dataset '{name}'")
+        return name
+
+    def get(self, name):
+        """The SalesDataset registered as `name` (empty: the default), without loading it."""
+        return self._datasets[self.resolve(name)]
+
+    def acquire(self, name, record=True):
+        """
+        Dataset `name`, loaded (the calling thread loads it if needed). With `record`, counts
+        a hit or a miss: requests record, the agent factories that follow them don't.
+        """
+        name = self.resolve(name)
+        dataset = self._datasets[name]
+        stats = self._stats[name]
+        with self._load_locks[name]:
+            with self._lock:
+                loaded = name in self._loaded
+                if loaded:
+                    self._loaded.move_to_end(name)
+                if record:
+                    stats.hits += loaded
+                    stats.misses += not loaded
+                stats.last_used = time.time()
+            if not loaded:
+                self._load(name, dataset, stats)
+        if not loaded:
+            self._evict(keep=name)
+        return dataset
+
+    def _load(self, name, dataset, stats):
+        started = time.perf_counter()
+        try:
+            if AGENT_MODE != "sql":
+                generation = dataset.current_generation()
+                if USE_SANDBOX:
+                    generation.sandbox_pool()
+        except Exception:
+            with self._lock:
+                stats.load_failures += 1
+            raise
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._loaded[name] = True
+            stats.loads += 1
+            stats.load_seconds += seconds
+            stats.last_load_seconds = seconds
+        if AGENT_MODE != "sql":
+            print(f"📦 Loaded dataset '{name}' in {seconds:.2f}s ({dataset.memory_bytes() / (1024 * 1024):.1f} MB)")
+        if name != DEFAULT_DATASET and self.reload_interval > 0:
+            # The default dataset has the servers' own watcher
+            watcher = DatasetWatcher(dataset.db_path, lambda version: self._reload(name, version), self.reload_interval)
+            with self._lock:
+                self._watchers[name] = watcher
+            watcher.start()
+
+    def _reload(self, name, version):
+        if self._datasets[name].reload(version) is not None:
+            self._notify(name)
+
+    def _notify(self, name):
+        if self.on_dataset_changed is not None:
+            try:
+                self.on_dataset_changed(name)
+            except Exception as e:
+                logger.error(f"❗ Could not drop the agents of dataset '{name}': {e}")
+
+    def memory_bytes(self):
+        # Includes the default dataset when the agent pools loaded it before any request
+        return sum(dataset.memory_bytes() for dataset in self._datasets.values())
+
+    def _evict(self, keep):
+        """Unload least recently used datasets until the loaded ones fit the budget."""
+        while self.memory_bytes() > self.memory_budget:
+            with self._lock:
+                victim = next((name for name in self._loaded if name not in (keep, DEFAULT_DATASET)), None)
+            if victim is None:
+                return
+            self.unload(victim, evicted=True)
+
+    def unload(self, name, evicted=False):
+        """Unload dataset `name`; its memory is freed once its running questions finish."""
+        name = self.resolve(name)
+        with self._load_locks[name]:
+            with self._lock:
+                if self._loaded.pop(name, None) is None:
+                    return False
+                if evicted:
+                    self._stats[name].evictions += 1
+                watcher = self._watchers.pop(name, None)
+            if watcher is not None:
+                watcher.stop()
+            self._datasets[name].unload()
+        print(f"📤 Unloaded dataset '{name}'" + (" (memory budget)" if evicted else ""))
+        self._notify(name)
+        return True
+
+    def stats(self):
+        with self._lock:
+            loaded = list(self._loaded)
+            watchers = dict(self._watchers)
+            per_dataset = {}
+            for name, dataset in self._datasets.items():
+                stats = self._stats[name]
+                lookups = stats.hits + stats.misses
+                per_dataset[name] = {
+                    "db_path": dataset.db_path,
+                    "loaded": name in self._loaded or dataset.loaded,
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "hit_rate": stats.hits / lookups if lookups else 0.0,
+                    "loads": stats.loads,
+                    "load_failures": stats.load_failures,
+                    "avg_load_seconds": stats.load_seconds / stats.loads if stats.loads else None,
+                    "last_load_seconds": stats.last_load_seconds,
+                    "evictions": stats.evictions,
+                    "last_used": stats.last_used,
+                }
+        for name, entry in per_dataset.items():
+            entry["memory_bytes"] = self._datasets[name].memory_bytes()
+            entry["version"] = self._datasets[name].stats().get("version")
+            if name in watchers:
+                entry["watcher"] = watchers[name].stats()
+        return {
+            "memory_bytes": sum(entry["memory_bytes"] for entry in per_dataset.values()),
+            "memory_budget_bytes": self.memory_budget,
+            "loaded": loaded,
+            "datasets": per_dataset,
+        }
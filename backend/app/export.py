@@ -0,0 +1,348 @@
+"""
+Bulk result export for /export.
+
+Breakdowns with thousands of rows don't belong in a streamed chat answer. /export
+runs one validated read-only query against a dataset and streams every row back as
+CSV, NDJSON or Arrow IPC (stream format). The body is either {"sql": "SELECT ..."}
+(checked like the agent's 'sql_query' tool) or {"aggregate": {...}} with the same
+keys as the 'sales_aggregate' tool, answered from the smallest covering rollup.
+
+Rows are fetched EXPORT_BATCH_ROWS at a time from a cursor of the export's own
+connection (exports don't hold the agents' pooled connections) and each batch is
+encoded and yielded on its own. The server pulls the next batch only once the last
+one was written to the client, so a slow client slows the query down instead of
+filling memory. The query runs and fills its first batch before any byte is sent:
+errors in it are a 400, not a broken stream. Later errors cut the stream short (for
+Arrow, without the end-of-stream marker).
+"""
+import io
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import threading
+from databases.database import SALES_COLUMN_TYPES
+from sql_tool import DB_PATH, connect_read_only, validate_query
+from rollups import plan_aggregate
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# --- CONFIGURATION ---
+# Rows fetched, encoded and sent at a time; memory per export stays around one batch
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "5000"))
+# Exports streaming at the same time; more get a 429
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", "2"))
+# Seconds of query time per export (time waiting on the client doesn't count)
+EXPORT_QUERY_TIMEOUT_SECONDS = float(os.environ.get("EXPORT_QUERY_TIMEOUT", "120"))
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64", "TEXT": "string", "DATE": "string"}
+
+logger = logging.getLogger(__name__)
+
+
+class ExportBusy(Exception):
+    """Raised when EXPORT_MAX_CONCURRENT exports are already streaming. Maps to 429."""
+
+    retry_after = 5
+
+
+def parse_export(data):
+    """
+    Validate an export request body. Returns (format, query) where query is
+    ("sql", sql) or ("aggregate", request dict); raises ValueError with a message for the client.
+    """
+    data = data or {}
+    fmt = str(data.get("format") or "csv").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    if fmt == "arrow" and pa is None:
+        raise ValueError("Arrow export needs pyarrow, which isn't installed on this server")
+
+    sql, aggregate = data.get("sql"), data.get("aggregate")
+    if (sql is None) == (aggregate is None):
+        raise ValueError("Send exactly one of 'sql' or 'aggregate'")
+    if sql is not None:
+        if not isinstance(sql, str):
+            raise ValueError("'sql' must be a string")
+        return fmt, ("sql", validate_query(sql))
+    if not isinstance(aggregate, dict):
+        raise ValueError("'aggregate' must be an object like the sales_aggregate tool input")
+    return fmt, ("aggregate", aggregate)
+
+
+def _plan(conn, query):
+    kind, value = query
+    if kind == "sql":
+        return value, (), "sql"
+    sql, params, source = plan_aggregate(
+        conn,
+        metrics=value.get("metrics", ["revenue"]),
+        group_by=value.get("group_by", []),
+        filters=value.get("filters"),
+        date_from=value.get("date_from"),
+        date_to=value.get("date_to"),
+        time_grain=value.get("time_grain"),
+        order_by=value.get("order_by"),
+        descending=value.get("descending", True),
+        limit=value.get("limit"),
+    )
+    return sql, params, source
+
+
+class _CsvEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def header(self, rows):
+        return self._write([self.columns])
+
+    def batch(self, rows):
+        return self._write(rows)
+
+    def footer(self):
+        return b""
+
+    def _write(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def header(self, rows):
+        return b""
+
+    def batch(self, rows):
+        return "".join(json.dumps(dict(zip(self.columns, row))) + "\n" for row in rows).encode("utf-8")
+
+    def footer(self):
+        return b""
+
+
+def _arrow_array(values, arrow_type):
+    """Values as an Arrow array of the column's type; later batches may need a (lossless) cast."""
+    if pa.types.is_string(arrow_type):
+        return pa.array([None if value is None else str(value) for value in values], type=arrow_type)
+    # Converted as they are, then cast: the cast raises where it would lose data (7.5 to int64)
+    array = pa.array(values)
+    return array if array.type == arrow_type else array.cast(arrow_type)
+
+
+class _ArrowEncoder:
+    """Arrow IPC stream: schema message, one record batch per fetched batch, end-of-stream marker."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.sink = io.BytesIO()
+        self.schema = None
+        self.writer = None
+
+    def _schema(self, rows):
+        fields = []
+        for i, col in enumerate(self.columns):
+            # Typed from the first batch's values: a column's name says nothing about an expression
+            # aliased to it (AVG(units_sold) AS units_sold). Mixed values are sent as text.
+            declared = pa.type_for_alias(ARROW_TYPES[SALES_COLUMN_TYPES[col]]) if col in SALES_COLUMN_TYPES else None
+            try:
+                arrow_type = pa.array([row[i] for row in rows]).type
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrow_type = pa.string()
+            if pa.types.is_null(arrow_type):
+                arrow_type = declared or pa.string()
+            elif pa.types.is_integer(arrow_type) and declared is not None and pa.types.is_floating(declared):
+                arrow_type = declared
+            fields.append(pa.field(col, arrow_type))
+        return pa.schema(fields)
+
+    def header(self, rows):
+        self.schema = self._schema(rows)
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        return self._take()
+
+    def batch(self, rows):
+        arrays = []
+        for i, field in enumerate(self.schema):
+            try:
+                arrays.append(_arrow_array([row[i] for row in rows], field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(f"Column '{field.name}' doesn't fit one Arrow type ({e}); CAST it in the query") from e
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._take()
+
+    def footer(self):
+        self.writer.close()
+        return self._take()
+
+    def _take(self):
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+
+ENCODERS = {"csv": _CsvEncoder, "ndjson": _NdjsonEncoder, "arrow": _ArrowEncoder}
+
+
+class ExportStream:
+    """
+    One running export: iterate it for the encoded chunks. The query has already run
+    (and filled its first batch) when the constructor returns. close() releases the
+    connection and the export slot; iterating to the end or a disconnect does too.
+    """
+
+    def __init__(self, exporter, query, fmt, db_path, batch_rows, timeout):
+        self.exporter = exporter
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.timeout = timeout
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.query_seconds = 0.0
+        self._fetch_started = self.started
+        self._closed = False
+        self.conn = None
+        self.source = None
+        try:
+            self.conn = connect_read_only(db_path)
+            self.conn.set_progress_handler(self._check_timeout, 10000)
+            sql, params, self.source = _plan(self.conn, query)
+            self.cursor = self._timed(self.conn.execute, sql, params)
+            self.columns = [col[0] for col in self.cursor.description or []]
+            self._first = self._timed(self.cursor.fetchmany, batch_rows)
+            self.encoder = ENCODERS[fmt](self.columns)
+        except BaseException:
+            self.close()
+            raise
+
+    def _check_timeout(self):
+        # Non-zero return value makes SQLite abort the statement
+        return 1 if self.query_seconds + time.perf_counter() - self._fetch_started > self.timeout else 0
+
+    def _timed(self, call, *args):
+        self._fetch_started = time.perf_counter()
+        try:
+            return call(*args)
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise TimeoutError(f"Export query took longer than {self.timeout:g}s and was stopped.") from e
+            raise
+        finally:
+            self.query_seconds += time.perf_counter() - self._fetch_started
+
+    def __iter__(self):
+        try:
+            yield from self._count(self.encoder.header(self._first))
+            rows, self._first = self._first, None
+            while rows:
+                self.rows += len(rows)
+                yield from self._count(self.encoder.batch(rows))
+                rows = self._timed(self.cursor.fetchmany, self.batch_rows)
+            yield from self._count(self.encoder.footer())
+            self.exporter.record(self, "completed")
+        except GeneratorExit:
+            self.exporter.record(self, "disconnected")
+            raise
+        except Exception as e:
+            logger.error(f"❗ Export cut short after {self.rows} rows: {e}")
+            self.exporter.record(self, "failed")
+        finally:
+            self.close()
+
+    def _count(self, chunk):
+        if chunk:
+            self.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        finally:
+            self.exporter.release()
+
+
+class Exporter:
+    """Opens exports, at most EXPORT_MAX_CONCURRENT at a time, and keeps their stats."""
+
+    def __init__(self, max_concurrent=EXPORT_MAX_CONCURRENT, batch_rows=EXPORT_BATCH_ROWS,
+                 timeout=EXPORT_QUERY_TIMEOUT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.batch_rows = batch_rows
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+        self.outcomes = {"completed": 0, "disconnected": 0, "failed": 0}
+        self.rows = 0
+        self.bytes = 0
+
+    def open(self, query, fmt="csv", db_path=DB_PATH):
+        """
+        Start an export; raises ExportBusy when all slots are taken, and ValueError,
+        TimeoutError or sqlite3.Error when the query fails before anything is sent.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExportBusy(f"{self.max_concurrent} exports are already running, please try again shortly.")
+        with self._lock:
+            self.active += 1
+        return ExportStream(self, query, fmt, db_path, self.batch_rows, self.timeout)
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def record(self, stream, outcome):
+        seconds = time.perf_counter() - stream.started
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.rows += stream.rows
+            self.bytes += stream.bytes
+        logger.info(f"Export {outcome}: {stream.rows} rows, {stream.bytes} bytes as {stream.fmt} "
+                    f"from '{stream.source}' in {seconds:.2f}s ({stream.query_seconds:.2f}s in SQLite)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "max_concurrent": self.max_concurrent,
+                "rejected": self.rejected,
+                **self.outcomes,
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "batch_rows": self.batch_rows,
+            }
+
+
+def export_headers(fmt):
+    """Content type and download headers for an export response."""
+    mimetype, extension = FORMATS[fmt]
+    return mimetype, {
+        "Content-Disposition": f'attachment; filename="sales_export.{extension}"',
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+
+
+exporter = Exporter()
@@ -0,0 +1,234 @@
+"""
+Request handling shared by server.py (Flask) and asgi_server.py (Starlette).
+
+Nothing here knows about a web framework or an agent pool: request validation and
+dataset resolution, the steps before an agent runs (quick answer, dataset load,
+readiness), the bookkeeping after it, export opening and the stats payloads. The
+servers adapt it: they turn ApiError into a JSON error response and run the agent
+on their own pool (threads or asyncio tasks). Everything here blocks, so the ASGI
+server calls it with asyncio.to_thread.
+"""
+import sqlite3
+import logging
+from agent import DEFAULT_DATASET, create_agent, create_approximate_agent, sandbox_stats, dataset_stats
+from intent_router import stats as router_stats
+from answer_cache import answer_cache, current_dataset_version
+from tool_cache import tool_cache
+from answering import quick_answer, record_agent_answer
+from streaming import StreamingQueueCallbackHandler
+from sessions import sessions, session_key, StepRecorder
+from datasets import DatasetRegistry, UnknownDataset
+from approximate import has_sample, approximate_note
+from partitions import question_scope
+from export import exporter, parse_export, export_headers, ExportBusy
+from batch import parse_batch
+from metrics import RequestTrace, TracingCallbackHandler, GaugeFunction, registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Named datasets, loaded on first use. Each server sets on_dataset_changed so its agent pool
+# drops the agents on a dataset that was unloaded or reloaded.
+datasets = DatasetRegistry()
+
+
+class ApiError(Exception):
+    """An error response: message, HTTP status and, for retryable ones, Retry-After seconds."""
+
+    def __init__(self, message, status, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def body(self):
+        return {"error": str(self)}
+
+    @property
+    def headers(self):
+        return {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+
+
+def create_pool_agent(dataset=None, approximate=False):
+    """Agent for a pool, on the default dataset or on a named one (loaded by its request)."""
+    if approximate:
+        return create_approximate_agent(dataset=datasets.get(dataset))
+    if dataset is None:
+        return create_agent()
+    return create_agent(dataset=datasets.acquire(dataset, record=False))
+
+
+def _db_path(named):
+    return datasets.get(named).db_path if named else None
+
+
+def _dataset_options(data):
+    """(registered name, name or None for the default, approximate) of a request body."""
+    # Optional: the dataset to answer from (see datasets.py); the default one otherwise
+    try:
+        dataset = datasets.resolve(data.get("dataset"))
+    except UnknownDataset as e:
+        raise ApiError(str(e), 404)
+    named = None if dataset == DEFAULT_DATASET else dataset
+    # Optional: a quick estimate from the dataset's stratified sample instead of an exact answer
+    approximate = bool(data.get("approximate"))
+    if approximate and not has_sample(datasets.get(named).db_path):
+        raise ApiError("Approximate answers aren't available for this dataset until it is loaded again.", 400)
+    return dataset, named, approximate
+
+
+def load_dataset(dataset, approximate=False, trace=None):
+    """Load the dataset before its agent runs (estimates only need the sample); raises ApiError 503."""
+    if approximate:
+        return
+    try:
+        # Loaded by its first question, least recently used ones unloaded
+        datasets.acquire(dataset)
+    except Exception as e:
+        logger.error(f"❗ Could not load dataset '{dataset}': {e}")
+        if trace is not None:
+            trace.finish("unavailable")
+        raise ApiError(f"Dataset '{dataset}' could not be loaded. Please check the server logs.", 503)
+
+
+class PredictRequest:
+    """A validated /predict body and the steps around its agent run."""
+
+    def __init__(self, data):
+        data = data or {}
+        self.message = data.get("message")
+        if not self.message:
+            raise ApiError("No message provided", 400)
+        self.dataset, self.named, self.approximate = _dataset_options(data)
+        # Optional: clients that send a session id get follow-up questions answered in context
+        self.session_id = session_key(data.get("session_id"), self.named)
+        self.follow_up = sessions.has_history(self.session_id)
+        self.trace = RequestTrace(self.message)
+        self.steps = StepRecorder()
+        self.version = None
+
+    def quick_reply(self):
+        """Greeting, fast path or answer cache: the answer without the LLM, or None."""
+        answer, self.version = quick_answer(self.message, trace=self.trace, use_cache=not self.follow_up,
+                                            db_path=_db_path(self.named))
+        if answer is not None:
+            sessions.record(self.session_id, self.message, answer)
+        return answer
+
+    def load_dataset(self):
+        load_dataset(self.dataset, self.approximate, self.trace)
+
+    def check_ready(self, ready_workers, warming_up):
+        """Raise ApiError 503 while no agent on the default dataset is loaded."""
+        # Other agents (named datasets, estimates) are built on demand
+        if self.named is not None or self.approximate or ready_workers > 0:
+            return
+        self.trace.finish("unavailable")
+        if warming_up:
+            raise ApiError("The assistant is still starting up, please try again shortly.", 503, retry_after=2)
+        raise ApiError("AI agent not available. Please check the server logs.", 503)
+
+    def reject(self, message, status, retry_after):
+        """A request the agent pool turned away."""
+        self.trace.finish("rejected")
+        return ApiError(message, status, retry_after)
+
+    def streaming_handler(self, queue):
+        return StreamingQueueCallbackHandler(queue, answer_suffix=approximate_note if self.approximate else None)
+
+    def agent_input(self):
+        return {"input": sessions.prompt(self.session_id, self.message)}
+
+    def agent_config(self, handler):
+        return {"callbacks": [handler, TracingCallbackHandler(self.trace), self.steps]}
+
+    def scope(self):
+        # Tool calls only scan the partitions of the question's period (not for follow-ups)
+        return question_scope(None if self.follow_up else self.message)
+
+    def record(self, result, seconds):
+        """Bookkeeping after the agent answered: router stats, answer cache, session history."""
+        output = result.get("output", "")
+        if self.approximate:
+            output += approximate_note(output)
+        record_agent_answer(self.message, result, self.version, seconds,
+                            cache=not self.follow_up and self.named is None and not self.approximate)
+        sessions.record(self.session_id, self.message, output, self.steps.steps)
+        return output
+
+
+class BatchRequest:
+    """A validated /predict/batch body; its questions are answered one by one (see batch.py)."""
+
+    def __init__(self, data):
+        data = data or {}
+        try:
+            self.items, self.concurrency = parse_batch(data)
+        except ValueError as e:
+            raise ApiError(str(e), 400)
+        self.dataset, self.named, self.approximate = _dataset_options(data)
+        self.total = len(data["messages"])
+
+    def quick_reply(self, question, trace):
+        """(answer or None, dataset version) without the LLM."""
+        return quick_answer(question, trace=trace, db_path=_db_path(self.named))
+
+    def load_dataset(self):
+        load_dataset(self.dataset, self.approximate)
+
+    def record(self, question, result, version, seconds):
+        record_agent_answer(question, result, version, seconds, cache=self.named is None and not self.approximate)
+        output = result.get("output", "")
+        return output + approximate_note(output) if self.approximate else output
+
+
+def open_export(data):
+    """Start an /export (see export.py): (stream, mimetype, headers). Raises ApiError."""
+    data = data or {}
+    try:
+        fmt, query = parse_export(data)
+        dataset = datasets.get(data.get("dataset"))
+        # Runs the query up to its first batch, so query errors are still a 400
+        stream = exporter.open(query, fmt, dataset.db_path)
+    except UnknownDataset as e:
+        raise ApiError(str(e), 404)
+    except ExportBusy as e:
+        raise ApiError(str(e), 429, retry_after=e.retry_after)
+    except (ValueError, TimeoutError, sqlite3.Error) as e:
+        raise ApiError(str(e), 400)
+    mimetype, headers = export_headers(fmt)
+    return stream, mimetype, headers
+
+
+def readiness(ready_workers, warming_up):
+    """/readyz body and status: ready once at least one agent (and so the sales frame) is loaded."""
+    ready = ready_workers > 0
+    return {"ready": ready, "warming_up": warming_up, "ready_workers": ready_workers}, 200 if ready else 503
+
+
+def register_pool_gauges(queue_length, busy_workers, ready_workers):
+    """Agent pool gauges for /metrics; each argument returns the server's current value."""
+    metrics_registry.register(GaugeFunction(
+        "sales_agent_pool_queue_length", "Requests waiting for a free agent.", queue_length))
+    metrics_registry.register(GaugeFunction(
+        "sales_agent_pool_busy_workers", "Agents running a request.", busy_workers))
+    metrics_registry.register(GaugeFunction(
+        "sales_agent_pool_ready_workers", "Agents that are loaded.", ready_workers))
+
+
+def stats_routes(pool_stats, dataset_watcher):
+    """(path, payload function) of every stats endpoint; `pool_stats` returns the server's pool stats."""
+    return [
+        ("/sandbox/stats", sandbox_stats),
+        ("/tool-cache/stats", tool_cache.stats),
+        ("/router/stats", router_stats.snapshot),
+        ("/cache/stats", answer_cache.stats),
+        ("/sessions/stats", sessions.stats),
+        ("/pool/stats", pool_stats),
+        ("/dataset/stats", lambda: {"dataset": dataset_stats(), "watcher": dataset_watcher.stats()}),
+        ("/datasets/stats", datasets.stats),
+        ("/export/stats", exporter.stats),
+    ]
+
+
+def warm_up_answer_cache():
+    answer_cache.warm_up(current_dataset_version())
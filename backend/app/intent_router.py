@@ -0,0 +1,424 @@
+import os
+import re
+import time
+import logging
+import threading
+import calendar
+from dataclasses import dataclass, field
+from typing import Optional
+from databases.database import get_dataset_version
+from rollups import query_aggregate, load_catalog, DB_PATH
+from sql_tool import get_pool
+
+# --- CONFIGURATION ---
+# Set FAST_PATH=0 to send every question to the LLM agent
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH", "1") == "1"
+# Max rows listed in a grouped answer when the question has no "top N"
+MAX_LISTED_ROWS = 20
+
+logger = logging.getLogger(__name__)
+
+# Words that pick the metric. Checked in order, so the more specific phrases come first.
+METRIC_PHRASES = [
+    ("avg_order_value", ["average order value", "avg order value", "average revenue per transaction",
+                         "average transaction value", "aov"]),
+    ("avg_unit_price", ["average unit price", "average price", "avg price", "mean price"]),
+    ("transactions", ["number of transactions", "number of sales", "transactions", "transaction count",
+                      "orders", "order count"]),
+    ("units_sold", ["units sold", "units", "quantity", "items sold", "qty"]),
+    ("revenue", ["revenue", "sales", "turnover", "omzet", "income"]),
+]
+
+METRIC_LABELS = {
+    "revenue": "revenue",
+    "units_sold": "units sold",
+    "transactions": "transactions",
+    "avg_unit_price": "average unit price",
+    "avg_order_value": "average order value",
+}
+
+MONEY_METRICS = {"revenue", "avg_unit_price", "avg_order_value"}
+
+# Ranking words and the direction they sort in (True: highest first)
+RANKING_WORDS = {
+    "top": True, "best": True, "highest": True, "most": True, "largest": True, "biggest": True,
+    "bottom": False, "worst": False, "lowest": False, "least": False, "smallest": False, "fewest": False,
+}
+
+DIMENSION_WORDS = {
+    "sales_channel": ["channel", "channels", "platform", "platforms", "marketplace", "marketplaces"],
+    "store_location": ["location", "locations", "store", "stores", "city", "cities", "branch", "branches", "mall", "malls"],
+    "product_category": ["category", "categories"],
+    "product_name": ["product", "products", "item", "items"],
+    "promo": ["promo", "promos", "promotion", "promotions"],
+    "paydayeffect": ["payday", "paydays"],
+    "holiday": ["holiday", "holidays"],
+}
+
+TIME_GRAIN_WORDS = {
+    "day": ["day", "days", "daily"],
+    "month": ["month", "months", "monthly"],
+    "year": ["year", "years", "yearly", "annual", "annually"],
+}
+
+MONTH_NAMES = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTH_NAMES.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+# Words that carry no meaning for the query itself. Negations ("without", "excluding") and
+# ranking words are not filler: left over, they send the question to the LLM agent.
+STOPWORDS = set("""
+a an the of in on at for to from by per across each every and or vs versus with is was were are be
+been what whats what's which who how much many show me give list tell total overall sum all our my we us
+do did does get got have had please between during compared compare split broken down breakdown grouped group
+it its that this there their them than ranked rank ranking value amount sold generated made performing performance
+""".split())
+
+@dataclass
+class Intent:
+    metric: str
+    group_by: list = field(default_factory=list)
+    filters: dict = field(default_factory=dict)
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    time_grain: Optional[str] = None
+    limit: Optional[int] = None
+    descending: bool = True
+    ranked: bool = False
+    period_label: str = ""
+
+
+class RouterStats:
+    """Counters for how often the fast path answers instead of the LLM agent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.fast_seconds = 0.0
+        self.llm_runs = 0
+        self.llm_seconds = 0.0
+
+    def record_hit(self, seconds):
+        with self._lock:
+            self.hits += 1
+            self.fast_seconds += seconds
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_llm_run(self, seconds):
+        """Called by the server for every question answered by the LLM agent."""
+        with self._lock:
+            self.llm_runs += 1
+            self.llm_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses + self.errors
+            avg_fast = self.fast_seconds / self.hits if self.hits else 0.0
+            avg_llm = self.llm_seconds / self.llm_runs if self.llm_runs else None
+            saved = self.hits * (avg_llm - avg_fast) if avg_llm is not None else None
+            return {
+                "enabled": FAST_PATH_ENABLED,
+                "questions": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": self.hits / total if total else 0.0,
+                "avg_fast_path_seconds": avg_fast,
+                "avg_llm_seconds": avg_llm,
+                "estimated_llm_seconds_saved": saved,
+            }
+
+
+stats = RouterStats()
+
+# db_path -> (dataset version, known values)
+_known_values = {}
+_known_values_lock = threading.Lock()
+
+
+def load_known_values(db_path=DB_PATH):
+    """
+    Distinct values of the text dimensions, used to spot filters like 'Jakarta' or 'Shopee'.
+    Read from the smallest rollup that has the column and refreshed when the dataset version changes.
+    """
+    with get_pool(db_path).connection() as conn:
+        version = get_dataset_version(conn)
+        with _known_values_lock:
+            cached = _known_values.get(db_path)
+            if cached is not None and cached[0] == version and cached[1]:
+                return cached[1]
+
+        catalog = load_catalog(conn)
+        values = {}
+        for col in ("sales_channel", "store_location", "product_category", "product_name"):
+            table = next((r["name"] for r in catalog if col in r["dims"]), "sales")
+            rows = conn.execute(f'SELECT DISTINCT "{col}" FROM "{table}" WHERE "{col}" IS NOT NULL').fetchall()
+            values[col] = [row[0] for row in rows]
+
+    with _known_values_lock:
+        _known_values[db_path] = (version, values)
+    return values
+
+
+def _normalize(text):
+    text = text.lower().replace("’", "'").replace("'", "")
+    text = re.sub(r"[?!.,:;]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _consume(text, phrase):
+    """Remove `phrase` (as whole words) from `text`. Returns (found, remaining text)."""
+    pattern = r"(?<!\w)" + re.escape(phrase) + r"(?!\w)"
+    new_text, count = re.subn(pattern, " ", text)
+    return count > 0, new_text
+
+
+def _month_range(year, month):
+    last_day = calendar.monthrange(year, month)[1]
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{last_day:02d}", f"in {calendar.month_name[month]} {year}"
+
+
+def _parse_time(text):
+    """
+    Find an explicit date range: two ISO dates, 'March 2025', '2025-03' or a single year.
+    Returns (remaining text, (date_from, date_to, label)); the range is None if there is none,
+    and the text is None if the time expression is ambiguous.
+    """
+    iso = re.findall(r"\b(\d{4}-\d{2}-\d{2})\b", text)
+    if len(iso) == 2:
+        date_from, date_to = sorted(iso)
+        for value in iso:
+            text = text.replace(value, " ")
+        return text, (date_from, date_to, f"from {date_from} to {date_to}")
+    if iso:
+        return None, None
+
+    month_pattern = "|".join(sorted(MONTH_NAMES, key=len, reverse=True))
+    month_year = re.search(r"\b(" + month_pattern + r")\s+(\d{4})\b", text)
+    if month_year:
+        text = text.replace(month_year.group(0), " ")
+        return text, _month_range(int(month_year.group(2)), MONTH_NAMES[month_year.group(1)])
+
+    year_month = re.search(r"\b(\d{4})-(\d{2})\b", text)
+    if year_month:
+        year, month = int(year_month.group(1)), int(year_month.group(2))
+        if not 1 <= month <= 12:
+            return None, None
+        return text.replace(year_month.group(0), " "), _month_range(year, month)
+
+    years = re.findall(r"\b(20\d{2})\b", text)
+    if len(years) == 1:
+        text = re.sub(r"\b" + years[0] + r"\b", " ", text)
+        return text, (f"{years[0]}-01-01", f"{years[0]}-12-31", f"in {years[0]}")
+    if len(years) > 1:
+        return None, None
+    return text, None
+
+
+def _filter_phrases(known_values):
+    """Map lowercase phrases to (column, values). 'jakarta' maps to every Jakarta store."""
+    phrases = {}
+    for col, values in known_values.items():
+        for value in values:
+            phrases.setdefault(_normalize(value), (col, []))[1].append(value)
+            if col == "store_location" and "(" in value:
+                city = _normalize(value.split("(")[0])
+                phrases.setdefault(city, (col, []))[1].append(value)
+    return phrases
+
+
+def parse_question(question, known_values):
+    """
+    Turn a simple aggregate question into an Intent, or return None.
+    Parsing is deliberately strict: if any word is left that we don't understand,
+    the question goes to the LLM agent instead.
+    """
+    text = _normalize(question)
+    if not text:
+        return None
+
+    # 1. Top/bottom N
+    limit, descending = None, True
+    top = re.search(r"\b(top|bottom|best|worst)\s+(\d{1,3})\b", text)
+    if top:
+        limit = int(top.group(2))
+        descending = top.group(1) in ("top", "best")
+        text = text.replace(top.group(0), " ")
+    # "which store had the lowest revenue": ranked, in the direction of the word
+    if re.search(r"\bat (least|most)\b", text):
+        return None
+    directions = set()
+    for word, word_descending in RANKING_WORDS.items():
+        found, text = _consume(text, word)
+        if found:
+            directions.add(word_descending)
+    if top:
+        directions.add(descending)
+    if len(directions) > 1:
+        return None
+    ranked = bool(directions)
+    if directions:
+        descending = directions.pop()
+
+    # 2. Time range
+    text, time_range = _parse_time(text)
+    if text is None:
+        return None
+    date_from, date_to, period_label = time_range or (None, None, "")
+
+    # 3. Filters on known values (longest first, so 'TikTok Shop' wins over 'Shop')
+    filters = {}
+    named = {}
+    phrases = _filter_phrases(known_values)
+    for phrase in sorted(phrases, key=len, reverse=True):
+        found, text = _consume(text, phrase)
+        if found:
+            col, values = phrases[phrase]
+            named[col] = named.get(col, 0) + 1
+            matched = filters.setdefault(col, [])
+            matched.extend(value for value in values if value not in matched)
+
+    # 4. Metric
+    metric = None
+    for name, metric_phrases in METRIC_PHRASES:
+        for phrase in metric_phrases:
+            found, text = _consume(text, phrase)
+            if found and metric is None:
+                metric = name
+    if metric is None:
+        return None
+    # "how many sales" counts sales; it isn't a revenue (or price) question
+    if metric in MONEY_METRICS and re.search(r"\bhow many\b", text):
+        return None
+
+    # 5. Group-by dimensions and time grain
+    group_by = []
+    for col, words in DIMENSION_WORDS.items():
+        for word in words:
+            found, text = _consume(text, word)
+            if found and col not in group_by:
+                group_by.append(col)
+    time_grain = None
+    for grain, words in TIME_GRAIN_WORDS.items():
+        for word in words:
+            found, text = _consume(text, word)
+            if found:
+                time_grain = grain
+
+    # A dimension that is also filtered to one value is a filter, not a grouping
+    group_by = [col for col in group_by if len(filters.get(col, [])) != 1]
+    # Two or more values named for one column ("kebaya modern vs batik maxi dress") are compared, not summed
+    group_by += [col for col, count in named.items() if count > 1 and col not in group_by]
+    if limit is not None and not group_by:
+        # "top 5 by revenue" with no dimension: products are what people mean
+        group_by = ["product_name"]
+    if ranked and not group_by and not time_grain:
+        # "the highest revenue" with nothing to rank
+        return None
+
+    # 6. Anything left over that isn't filler means we didn't understand the question
+    leftover = [word for word in text.split() if word not in STOPWORDS]
+    if leftover:
+        logger.debug(f"Fast path skipped, unknown words: {leftover}")
+        return None
+
+    return Intent(
+        metric=metric,
+        group_by=group_by,
+        filters=filters,
+        date_from=date_from,
+        date_to=date_to,
+        time_grain=time_grain,
+        limit=limit,
+        descending=descending,
+        ranked=ranked,
+        period_label=period_label,
+    )
+
+
+def _format_value(metric, value):
+    if value is None or value != value:  # None or NaN
+        return "n/a"
+    if metric in MONEY_METRICS:
+        return f"Rp {value:,.0f}"
+    return f"{value:,.0f}"
+
+
+def format_answer(intent, df):
+    label = METRIC_LABELS[intent.metric]
+    filter_text = ", ".join(" / ".join(str(v) for v in values) for values in intent.filters.values())
+    scope = " ".join(part for part in [f"for {filter_text}" if filter_text else "", intent.period_label] if part)
+    scope = f" {scope}" if scope else ""
+
+    if df.empty:
+        return f"No sales found{scope}."
+
+    if not intent.group_by and not intent.time_grain:
+        value = df[intent.metric].iloc[0]
+        return f"Total {label}{scope} was {_format_value(intent.metric, value)}."
+
+    key_cols = (["period"] if intent.time_grain else []) + intent.group_by
+    shown = df if intent.limit else df.head(MAX_LISTED_ROWS)
+    lines = [f"{label.capitalize()}{scope}:"]
+    for _, row in shown.iterrows():
+        key = " | ".join(_format_key(col, row[col]) for col in key_cols)
+        lines.append(f"- {key}: {_format_value(intent.metric, row[intent.metric])}")
+    if len(shown) < len(df):
+        lines.append(f"... and {len(df) - len(shown)} more")
+    return "\n".join(lines)
+
+
+def _format_key(col, value):
+    if col in ("promo", "paydayeffect", "holiday"):
+        names = {"promo": "promo", "paydayeffect": "payday", "holiday": "holiday"}
+        return names[col] if value else f"no {names[col]}"
+    return str(value)
+
+
+def answer_intent(intent, db_path=DB_PATH):
+    # Rankings and plain breakdowns are sorted by the metric; time series stay in period order
+    order_by = intent.metric if intent.ranked or (intent.group_by and not intent.time_grain) else None
+    df, _source = query_aggregate(
+        metrics=[intent.metric],
+        group_by=intent.group_by,
+        filters=intent.filters,
+        date_from=intent.date_from,
+        date_to=intent.date_to,
+        time_grain=intent.time_grain,
+        order_by=order_by,
+        descending=intent.descending,
+        limit=intent.limit,
+        db_path=db_path,
+    )
+    return format_answer(intent, df)
+
+
+def try_fast_path(question, db_path=DB_PATH):
+    """
+    Answer `question` without the LLM if it is a simple aggregate.
+    Returns the answer text, or None when the question should go to the agent.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    started = time.perf_counter()
+    try:
+        intent = parse_question(question, load_known_values(db_path))
+        if intent is None:
+            stats.record_miss()
+            return None
+        answer = answer_intent(intent, db_path)
+    except Exception as e:
+        logger.warning(f"Fast path failed, falling back to the agent: {e}")
+        stats.record_error()
+        return None
+
+    stats.record_hit(time.perf_counter() - started)
+    return answer
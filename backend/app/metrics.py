@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from langchain.callbacks.base import BaseCallbackHandler
+
+# --- CONFIGURATION ---
+# Requests slower than this (seconds) are logged with all their spans. Unset or 0 disables the slow log.
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "0") or 0)
+# Optional JSON-lines file for the slow log; without it slow requests go to the 'slow_requests' logger
+SLOW_REQUEST_LOG_PATH = os.environ.get("SLOW_REQUEST_LOG_PATH", "")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("slow_requests")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [bucket counts..., +Inf count], sum
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeFunction:
+    """Gauge whose value is read from `func` at scrape time (e.g. the worker pool's queue length)."""
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(float(value))}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name not in self._names:
+                self._metrics.append(metric)
+                self._names.add(metric.name)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = registry.register(Counter(
+    "sales_agent_requests_total", "Finished /predict requests by how they were answered.", ["path", "outcome"]))
+REQUEST_SECONDS = registry.register(Histogram(
+    "sales_agent_request_seconds", "Total /predict time, from arrival to the last SSE frame.", LATENCY_BUCKETS, ["path"]))
+QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "sales_agent_queue_wait_seconds", "Time a request waited for a free agent.", LATENCY_BUCKETS))
+LLM_SECONDS = registry.register(Histogram(
+    "sales_agent_llm_call_seconds", "Latency of one LLM call (one ReAct step).", LATENCY_BUCKETS))
+LLM_FIRST_TOKEN_SECONDS = registry.register(Histogram(
+    "sales_agent_llm_first_token_seconds", "Time from LLM call start to its first streamed token.", LATENCY_BUCKETS))
+LLM_TOKENS = registry.register(Counter(
+    "sales_agent_llm_tokens_total", "Prompt and completion tokens (estimated when the LLM doesn't report them).",
+    ["kind"]))
+TOOL_SECONDS = registry.register(Histogram(
+    "sales_agent_tool_seconds", "Tool execution time (pandas REPL, SQL, rollups).", FAST_BUCKETS, ["tool"]))
+TOOL_ERRORS = registry.register(Counter(
+    "sales_agent_tool_errors_total", "Tool calls that raised.", ["tool"]))
+ITERATIONS = registry.register(Histogram(
+    "sales_agent_iterations", "ReAct iterations (agent actions) per answered question.", COUNT_BUCKETS))
+PARSE_FAILURES = registry.register(Counter(
+    "sales_agent_parse_failures_total", "LLM outputs that failed the ReAct format and went through specific_error_handler."))
+STREAM_SECONDS = registry.register(Histogram(
+    "sales_agent_stream_seconds", "Time from the first SSE frame to the end of the stream.", LATENCY_BUCKETS))
+SLOW_REQUESTS = registry.register(Counter(
+    "sales_agent_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS."))
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) for LLMs that don't report usage."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class RequestTrace:
+    """
+    Spans of one /predict request: queue wait, LLM calls, tool calls, parse
+    failures and SSE streaming. finish() turns them into metrics and, for slow
+    requests, a log entry.
+    """
+
+    def __init__(self, question):
+        self.question = question
+        self.path = "agent"
+        # "ok", "error", "rejected", "unavailable" or "disconnected"
+        self.outcome = "ok"
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.iterations = 0
+        self.parse_failures = 0
+        self.first_frame_at = None
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def add_span(self, kind, started, seconds, **attrs):
+        with self._lock:
+            self.spans.append({"kind": kind, "start": round(started - self.started, 4),
+                               "seconds": round(seconds, 4), **attrs})
+
+    def record_queue_wait(self, seconds):
+        self.add_span("queue", time.perf_counter() - seconds, seconds)
+        QUEUE_WAIT_SECONDS.observe(seconds)
+
+    def record_frame(self):
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+
+    def finish(self, outcome=None):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        outcome = outcome or self.outcome
+        ended = time.perf_counter()
+        total = ended - self.started
+        if self.first_frame_at is not None:
+            stream_seconds = ended - self.first_frame_at
+            self.add_span("stream", self.first_frame_at, stream_seconds)
+            STREAM_SECONDS.observe(stream_seconds)
+        REQUESTS.inc(path=self.path, outcome=outcome)
+        REQUEST_SECONDS.observe(total, path=self.path)
+        if self.path == "agent" and outcome == "ok":
+            ITERATIONS.observe(self.iterations)
+        if SLOW_REQUEST_SECONDS and total >= SLOW_REQUEST_SECONDS:
+            SLOW_REQUESTS.inc()
+            self._log_slow(total, outcome)
+
+    def to_dict(self, total=None, outcome=None):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "started_at": self.started_at,
+            "question": self.question,
+            "path": self.path,
+            "outcome": outcome,
+            "seconds": round(total, 4) if total is not None else None,
+            "iterations": self.iterations,
+            "parse_failures": self.parse_failures,
+            "spans": spans,
+        }
+
+    def _log_slow(self, total, outcome):
+        entry = json.dumps(self.to_dict(total, outcome), default=str)
+        if SLOW_REQUEST_LOG_PATH:
+            try:
+                with open(SLOW_REQUEST_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(entry + "\n")
+                return
+            except OSError as e:
+                logger.warning(f"Could not write the slow request log: {e}")
+        slow_logger.warning(entry)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records LLM, tool and agent-step spans of one agent run into a RequestTrace."""
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._llm_runs = {}   # run_id -> [started, first_token_at, prompt_tokens, completion_tokens]
+        self._tool_runs = {}  # run_id -> (started, tool name)
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs) -> None:
+        self._llm_runs[run_id] = [time.perf_counter(), None, sum(estimate_tokens(p) for p in prompts), 0]
+
+    def on_llm_new_token(self, token: str, *, run_id=None, **kwargs) -> None:
+        run = self._llm_runs.get(run_id)
+        if run is None:
+            return
+        if run[1] is None:
+            run[1] = time.perf_counter()
+        run[3] += 1
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs) -> None:
+        run = self._llm_runs.pop(run_id, None)
+        if run is None:
+            return
+        started, first_token_at, prompt_tokens, completion_tokens = run
+        seconds = time.perf_counter() - started
+        # Ollama reports exact counts in the generation info; otherwise keep the estimates
+        estimated = True
+        text = ""
+        for generations in response.generations or []:
+            for generation in generations:
+                text += generation.text
+                info = generation.generation_info or {}
+                if info.get("prompt_eval_count") is not None and info.get("eval_count") is not None:
+                    prompt_tokens, completion_tokens = info["prompt_eval_count"], info["eval_count"]
+                    estimated = False
+        if estimated and not completion_tokens:
+            completion_tokens = estimate_tokens(text)
+
+        LLM_SECONDS.observe(seconds)
+        if first_token_at is not None:
+            LLM_FIRST_TOKEN_SECONDS.observe(first_token_at - started)
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        self.trace.add_span("llm", started, seconds, prompt_tokens=prompt_tokens,
+                            completion_tokens=completion_tokens, estimated_tokens=estimated)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs) -> None:
+        run = self._llm_runs.pop(run_id, None)
+        if run is not None:
+            self.trace.add_span("llm", run[0], time.perf_counter() - run[0], error=str(error))
+
+    def on_agent_action(self, action, **kwargs) -> None:
+        self.trace.iterations += 1
+        # AgentExecutor turns an unparseable LLM output into an action for the "_Exception" tool
+        if action.tool == "_Exception":
+            self.trace.parse_failures += 1
+            PARSE_FAILURES.inc()
+
+    def on_tool_start(self, serialized, input_str, *, run_id=None, **kwargs) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._tool_runs[run_id] = (time.perf_counter(), name)
+
+    def on_tool_end(self, output, *, run_id=None, **kwargs) -> None:
+        run = self._tool_runs.pop(run_id, None)
+        if run is None:
+            return
+        started, name = run
+        seconds = time.perf_counter() - started
+        if name != "_Exception":
+            TOOL_SECONDS.observe(seconds, tool=name)
+        self.trace.add_span("tool", started, seconds, tool=name)
+
+    def on_tool_error(self, error, *, run_id=None, **kwargs) -> None:
+        run = self._tool_runs.pop(run_id, None)
+        if run is None:
+            return
+        started, name = run
+        TOOL_ERRORS.inc(tool=name)
+        self.trace.add_span("tool", started, time.perf_counter() - started, tool=name, error=str(error))
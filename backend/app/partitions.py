@@ -0,0 +1,270 @@
+"""
+Monthly partitions of the sales frame, and pruning them per question.
+
+databases/database.py writes the columnar snapshot in date order, so every month
+is a contiguous range of rows; the manifest lists them (the partition catalog,
+kept in df.attrs["partitions"]). While a question that names its period ("in
+March 2025", "last month", "since 2025") is being answered, the agent's code runs
+on a zero-copy slice with only the partitions of that period. It scans, and for a
+memory-mapped frame pages in, just those months. The most recent months are read
+once at load so they stay hot in memory; older ones are paged in from disk the
+first time a question needs them, so the working set follows the questions asked.
+
+Pruning is conservative: questions that compare periods or look at trends, or
+whose period can't be read exactly, run on the whole frame.
+"""
+import os
+import re
+import calendar
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import date, timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+# Set PARTITION_PRUNING=0 to always run the agent's code on the whole frame
+PARTITION_PRUNING = os.environ.get("PARTITION_PRUNING", "1") == "1"
+# Most recent months read into memory when the frame is loaded
+SALES_HOT_MONTHS = int(os.environ.get("SALES_HOT_MONTHS", "3"))
+
+MONTH_NAMES = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTH_NAMES.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+_MONTH_PATTERN = "|".join(sorted(MONTH_NAMES, key=len, reverse=True))
+
+# Questions with these words need data outside the period they name
+WIDE_SCOPE_WORDS = re.compile(
+    r"\b(compare[ds]?|comparison|vs|versus|growth|grow|grew|change[ds]?|increase[ds]?|decrease[ds]?|"
+    r"previous|prior|before|earlier|trend[s]?|over time|all[- ]time|ever|history|historical|"
+    r"yoy|mom|year[- ]over[- ]year|month[- ]over[- ]month|than)\b"
+)
+
+# The period named is where the range starts (and it runs to the newest data) ...
+OPEN_END_WORDS = r"after|following|since|from|starting(?: from| in)?"
+# ... or where it ends (and it runs from the oldest data). Either word has to come right
+# before the period ("since March 2025"); "onwards" and "to date" right after it.
+OPEN_START_WORDS = r"until|till|up to|upto|through|thru"
+_BOUND_BEFORE = rf"(?:\b(?:(?P<open_end>{OPEN_END_WORDS})|(?P<open_start>{OPEN_START_WORDS}))\s+)?"
+_BOUND_AFTER = r"(?:\s+(?P<onwards>onwards?|to date)\b)?"
+
+# Question text of the request being answered, for the agent's tools (see question_scope)
+_scope_question = contextvars.ContextVar("partition_scope_question", default=None)
+
+
+class _PruningStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pruned = 0
+        self.full_scans = 0
+        self.rows_scanned = 0
+        self.rows_total = 0
+
+    def record(self, rows, total):
+        with self.lock:
+            if rows < total:
+                self.pruned += 1
+            else:
+                self.full_scans += 1
+            self.rows_scanned += rows
+            self.rows_total += total
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "enabled": PARTITION_PRUNING,
+                "pruned_tool_calls": self.pruned,
+                "full_scan_tool_calls": self.full_scans,
+                "rows_scanned_share": self.rows_scanned / self.rows_total if self.rows_total else 1.0,
+            }
+
+
+stats = _PruningStats()
+
+
+def build_catalog(df):
+    """Partition catalog of a frame loaded without the snapshot, if its rows are in date order."""
+    if "date" not in df.columns or len(df) == 0:
+        return None
+    dates = df["date"].reset_index(drop=True)
+    if dates.isna().any() or not dates.is_monotonic_increasing:
+        return None
+    months = dates.dt.strftime("%Y-%m")
+    bounds = months.ne(months.shift()).to_numpy().nonzero()[0].tolist() + [len(df)]
+    return [
+        {"month": months.iloc[start], "start": start, "stop": stop,
+         "min_date": dates.iloc[start].strftime("%Y-%m-%d"), "max_date": dates.iloc[stop - 1].strftime("%Y-%m-%d")}
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def _month_start(day, months_back=0):
+    month_index = day.year * 12 + day.month - 1 - months_back
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _month_end(year, month):
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _find_periods(text, pattern, to_range, periods):
+    """
+    Append (start, end, bound) for every match of the period `pattern` to `periods`;
+    bound is the open-bound word right before or after it ('since', 'until', 'onwards') or None.
+    Returns the text without the periods. Raises ValueError for impossible dates.
+    """
+    def take(match):
+        start, end = to_range(match)
+        bound = match.group("open_end") or match.group("open_start") or match.group("onwards")
+        kind = "open_start" if match.group("open_start") else "open_end" if bound else None
+        periods.append((start, end, kind and (kind, bound.split()[0])))
+        return " "
+    return re.sub(_BOUND_BEFORE + pattern + _BOUND_AFTER, take, text)
+
+
+def _iso_day(match):
+    day = date.fromisoformat(match.group("day"))
+    return day, day
+
+
+def _named_month(match):
+    year, month = int(match.group("year")), MONTH_NAMES[match.group("month")]
+    return date(year, month, 1), _month_end(year, month)
+
+
+def _numeric_month(match):
+    year, month = int(match.group("year")), int(match.group("month"))
+    return date(year, month, 1), _month_end(year, month)
+
+
+def _year(match):
+    year = int(match.group("year"))
+    return date(year, 1, 1), date(year, 12, 31)
+
+
+@lru_cache(maxsize=1024)
+def question_date_range(question, last_date):
+    """
+    (start, end) dates the question is about, or None when it needs all the data.
+    `last_date` ('YYYY-MM-DD', the newest sale) anchors 'last month', 'this year' etc.
+    Explicit dates, 'March 2025', '2025-03' and years are combined into one covering range;
+    'after June 2025' or 'up to March 2025' run to the newest or from the oldest data.
+    """
+    text = question.lower()
+    if WIDE_SCOPE_WORDS.search(text):
+        return None
+    latest = date.fromisoformat(last_date)
+    # (start, end, (open_end|open_start, bound word) or None) of every period named
+    periods = []
+
+    try:
+        text = _find_periods(text, r"\b(?P<day>\d{4}-\d{2}-\d{2})\b", _iso_day, periods)
+        text = _find_periods(text, r"\b(?P<month>" + _MONTH_PATTERN + r")\s+(?P<year>\d{4})\b", _named_month, periods)
+        text = _find_periods(text, r"\b(?P<year>\d{4})-(?P<month>\d{2})\b", _numeric_month, periods)
+        text = _find_periods(text, r"\b(?P<year>20\d{2})\b", _year, periods)
+    except ValueError:
+        return None
+
+    relative = re.search(r"\b(last|past|previous)\s+(\d+)\s+(day|week|month)s?\b", text)
+    if relative:
+        count, unit = int(relative.group(2)), relative.group(3)
+        days = {"day": 1, "week": 7}.get(unit)
+        periods.append((latest - timedelta(days=count * days) if days else _month_start(latest, count), latest, None))
+    elif re.search(r"\b(last|this) week\b|\byesterday\b|\btoday\b", text):
+        periods.append((latest - timedelta(days=13), latest, None))
+    elif re.search(r"\blast month\b", text):
+        # "Last month" may mean the one before the newest: take both
+        periods.append((_month_start(latest, 1), latest, None))
+    elif re.search(r"\bthis month\b", text):
+        periods.append((_month_start(latest), latest, None))
+    elif re.search(r"\blast year\b", text):
+        periods.append((date(latest.year - 1, 1, 1), latest, None))
+    elif re.search(r"\bthis year\b|\bytd\b|\byear to date\b", text):
+        periods.append((date(latest.year, 1, 1), latest, None))
+
+    if not periods:
+        return None
+    start, end = min(p[0] for p in periods), max(p[1] for p in periods)
+    bounds = [(i, p[2]) for i, p in enumerate(periods) if p[2]]
+    if len(periods) == 1 and bounds:
+        # Open-ended ranges run from the period named to the newest data, or from the oldest data to it
+        kind, word = bounds[0][1]
+        if kind == "open_start":
+            start = date.min
+        else:
+            if word in ("after", "following"):
+                start = end + timedelta(days=1)
+            end = latest
+    elif bounds:
+        # "from March 2025 until June 2025" pairs up; any other open bound among several periods reads everything
+        paired = len(periods) == 2 and all((i == 0 and kind == "open_end" and word not in ("onwards", "onward", "to"))
+                                           or (i == 1 and kind == "open_start") for i, (kind, word) in bounds)
+        if not paired:
+            return None
+        if bounds[0][1] in (("open_end", "after"), ("open_end", "following")):
+            start = periods[0][1] + timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
+
+def prune(catalog, start, end):
+    """Row range (start_row, stop_row) covering the partitions that overlap [start, end]."""
+    selected = [p for p in catalog
+                if p["month"] is not None and p["max_date"] >= start and p["min_date"] <= end]
+    if not selected:
+        return None
+    return selected[0]["start"], selected[-1]["stop"]
+
+
+def rows_for_question(catalog, question):
+    """Row range of `catalog` the question needs, or None for all rows."""
+    if not PARTITION_PRUNING or not catalog or not question:
+        return None
+    dated = [p for p in catalog if p["month"] is not None]
+    if not dated:
+        return None
+    period = question_date_range(question, dated[-1]["max_date"])
+    if period is None:
+        return None
+    rows = prune(catalog, *period)
+    if rows is None or rows == (0, catalog[-1]["stop"]):
+        return None
+    return rows
+
+
+def current_rows(catalog):
+    """Row range for the question being answered on this thread/task (None: all rows)."""
+    rows = rows_for_question(catalog, _scope_question.get())
+    if catalog:
+        total = catalog[-1]["stop"]
+        stats.record(rows[1] - rows[0] if rows else total, total)
+    return rows
+
+
+@contextmanager
+def question_scope(question):
+    """Tool calls made inside this block may prune partitions by `question`'s period."""
+    token = _scope_question.set(question)
+    try:
+        yield
+    finally:
+        _scope_question.reset(token)
+
+
+def scoped_frame(df, rows):
+    """Zero-copy slice of `df` with only the rows of the selected partitions."""
+    return df if rows is None else df.iloc[rows[0]:rows[1]]
+
+
+def warm_hot_partitions(df, catalog, months=SALES_HOT_MONTHS):
+    """Read the newest `months` partitions once so their pages are resident; older ones stay on disk."""
+    if not catalog or months <= 0:
+        return 0
+    start = catalog[max(len(catalog) - months, 0)]["start"]
+    for name in df.columns:
+        column = df[name]
+        values = column.cat.codes.to_numpy() if isinstance(column.dtype, pd.CategoricalDtype) else column.to_numpy()
+        if values.dtype.kind in "biufcmMb" and values.flags.c_contiguous:
+            # Touching one byte per page is enough to fault it in
+            int(values[start:].view(np.uint8)[::4096].sum())
+    return len(df) - start
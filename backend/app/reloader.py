@@ -0,0 +1,116 @@
+"""
+Hot reload of the sales data.
+
+A background thread notices when databases/database.py loads new rows into
+retail_database.db and calls back so the servers can build a new frame, sandbox
+and agents off the request path (see agent.reload_dataset). Each check is cheap:
+`PRAGMA data_version` on a connection kept open tells whether anyone else has
+committed since the last check, and only then is the one-row dataset_version
+table read. A replaced file (new inode) reopens the connection.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from databases.database import get_dataset_version
+
+# --- CONFIGURATION ---
+# Seconds between checks; 0 turns hot reload off
+RELOAD_POLL_SECONDS = float(os.environ.get("DATASET_RELOAD_SECONDS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetWatcher:
+    """Calls `on_change(version)` on its own thread whenever the dataset version in `db_path` changes."""
+
+    def __init__(self, db_path, on_change, interval=RELOAD_POLL_SECONDS):
+        self.db_path = db_path
+        self.on_change = on_change
+        self.interval = interval
+        self.version = None
+        self._conn = None
+        self._file_id = None
+        self._data_version = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.checks = 0
+        self.changes = 0
+        self.failures = 0
+        self.last_change_at = None
+        self.last_reload_seconds = None
+
+    def start(self):
+        """Start polling (idempotent). Does nothing when hot reload is off."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _connect(self, file_id):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._file_id = file_id
+        self._data_version = None
+
+    def check(self):
+        """Return the new dataset version if it changed since the last check, else None."""
+        try:
+            st = os.stat(self.db_path)
+        except FileNotFoundError:
+            return None
+        file_id = (st.st_dev, st.st_ino)
+        if self._conn is None or file_id != self._file_id:
+            self._connect(file_id)
+
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+        version = get_dataset_version(self._conn)
+        if version == self.version:
+            return None
+        self.version = version
+        return version
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checks += 1
+            try:
+                version = self.check()
+            except sqlite3.Error as e:
+                # e.g. the file is being replaced; reconnect on the next check
+                logger.warning(f"⚠️ Dataset watcher could not read {self.db_path}: {e}")
+                self._conn = None
+                continue
+            if version is None:
+                continue
+            started = time.perf_counter()
+            try:
+                self.on_change(version)
+                self.changes += 1
+                self.last_change_at = time.time()
+                self.last_reload_seconds = time.perf_counter() - started
+            except Exception as e:
+                self.failures += 1
+                # Try again on the next check
+                self.version = None
+                self._data_version = None
+                logger.error(f"❗ Reload of dataset version {version} failed: {e}")
+
+    def stats(self):
+        return {
+            "enabled": self.interval > 0,
+            "interval_seconds": self.interval,
+            "version": self.version,
+            "checks": self.checks,
+            "version_changes": self.changes,
+            "failures": self.failures,
+            "last_reload_at": self.last_change_at,
+            "last_reload_seconds": self.last_reload_seconds,
+        }
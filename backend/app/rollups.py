@@ -0,0 +1,199 @@
+import sqlite3
+import os
+import json
+import calendar
+import logging
+import pandas as pd
+from databases.database import SALES_COLUMN_TYPES
+from sql_tool import get_pool
+
+# --- CONFIGURATION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(current_dir, "databases", "retail_database.db")
+
+# Max rows returned as text to the agent
+TOOL_MAX_ROWS = 50
+
+TIME_GRAINS = ("day", "month", "year")
+
+# SQL for each metric. Rollups store row_count; the base table counts rows itself.
+METRICS = {
+    "revenue": ("SUM(revenue)", "SUM(revenue)"),
+    "units_sold": ("SUM(units_sold)", "SUM(units_sold)"),
+    "transactions": ("SUM(row_count)", "COUNT(*)"),
+    "avg_unit_price": ("SUM(revenue) * 1.0 / SUM(units_sold)", "SUM(revenue) * 1.0 / SUM(units_sold)"),
+    "avg_order_value": ("SUM(revenue) * 1.0 / SUM(row_count)", "AVG(revenue)"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def load_catalog(conn):
+    """Rollups available in this database, smallest first."""
+    try:
+        rows = conn.execute("SELECT name, grain, dims, rows FROM rollup_catalog ORDER BY rows").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [{"name": name, "grain": grain, "dims": set(dims.split(",")), "rows": count}
+            for name, grain, dims, count in rows]
+
+
+def _is_month_aligned(date_from, date_to):
+    if date_from and not date_from.endswith("-01"):
+        return False
+    if date_to:
+        year, month, day = (int(part) for part in date_to.split("-"))
+        if day != calendar.monthrange(year, month)[1]:
+            return False
+    return True
+
+
+def choose_source(catalog, dims, time_grain=None, date_from=None, date_to=None):
+    """
+    Pick the smallest rollup that has every needed dimension at a fine enough
+    time grain. Falls back to the 'sales' table when nothing covers the request.
+    """
+    needs_day = time_grain == "day" or not _is_month_aligned(date_from, date_to)
+    for rollup in catalog:
+        if not set(dims) <= rollup["dims"]:
+            continue
+        if needs_day and rollup["grain"] != "day":
+            continue
+        return rollup
+    return None
+
+
+def build_aggregate_sql(source, metrics, group_by=(), filters=None, date_from=None, date_to=None,
+                        time_grain=None, order_by=None, descending=True, limit=None):
+    """Build the SELECT for an aggregate against a rollup (dict from the catalog) or the base table (None)."""
+    is_rollup = source is not None
+    table = source["name"] if is_rollup else "sales"
+    if is_rollup and source["grain"] == "month":
+        time_col, month_expr = "month", "month"
+    else:
+        time_col, month_expr = "date", 'substr("date", 1, 7)'
+
+    select, group, where, params = [], [], [], []
+
+    if time_grain:
+        period_expr = {"day": '"date"', "month": month_expr, "year": f"substr({month_expr}, 1, 4)"}[time_grain]
+        select.append(f"{period_expr} AS period")
+        group.append(period_expr)
+
+    for dim in group_by:
+        select.append(f'"{dim}"')
+        group.append(f'"{dim}"')
+
+    for metric in metrics:
+        select.append(f'{METRICS[metric][0 if is_rollup else 1]} AS "{metric}"')
+
+    for col, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        where.append(f'"{col}" IN ({", ".join("?" for _ in values)})')
+        params.extend(values)
+
+    if date_from:
+        where.append(f'"{time_col}" >= ?')
+        params.append(date_from[:7] if time_col == "month" else date_from)
+    if date_to:
+        where.append(f'"{time_col}" <= ?')
+        params.append(date_to[:7] if time_col == "month" else date_to)
+
+    sql = f'SELECT {", ".join(select)} FROM "{table}"'
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if group:
+        sql += " GROUP BY " + ", ".join(group)
+    if order_by:
+        sql += f' ORDER BY "{order_by}" {"DESC" if descending else "ASC"}'
+    elif time_grain:
+        sql += " ORDER BY period"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return sql, params
+
+
+def validate_request(metrics, group_by, filters, time_grain, order_by):
+    known_columns = set(SALES_COLUMN_TYPES)
+    for metric in metrics:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Use one of: {', '.join(METRICS)}")
+    for col in list(group_by) + list((filters or {}).keys()):
+        if col not in known_columns or col in METRICS or col == "date":
+            raise ValueError(f"Unknown dimension '{col}'")
+    if time_grain and time_grain not in TIME_GRAINS:
+        raise ValueError(f"Unknown time grain '{time_grain}'. Use one of: {', '.join(TIME_GRAINS)}")
+    if order_by and order_by not in metrics and order_by not in group_by and order_by != "period":
+        raise ValueError(f"order_by must be one of the requested metrics or dimensions, got '{order_by}'")
+
+
+def plan_aggregate(conn, metrics, group_by=(), filters=None, date_from=None, date_to=None,
+                   time_grain=None, order_by=None, descending=True, limit=None):
+    """Validated SELECT for an aggregate on the smallest rollup in `conn` that covers it: (sql, params, source name)."""
+    metrics, group_by = list(metrics), list(group_by)
+    validate_request(metrics, group_by, filters, time_grain, order_by)
+    dims = set(group_by) | set((filters or {}).keys())
+    source = choose_source(load_catalog(conn), dims, time_grain, date_from, date_to)
+    sql, params = build_aggregate_sql(source, metrics, group_by, filters, date_from, date_to,
+                                      time_grain, order_by, descending, limit)
+    return sql, params, source["name"] if source else "sales"
+
+
+def query_aggregate(metrics=("revenue",), group_by=(), filters=None, date_from=None, date_to=None,
+                    time_grain=None, order_by=None, descending=True, limit=None, db_path=DB_PATH):
+    """
+    Answer an aggregate from the smallest rollup that covers it.
+    Dates are inclusive 'YYYY-MM-DD' strings. Returns (DataFrame, source table name).
+    """
+    metrics, group_by = list(metrics), list(group_by)
+    validate_request(metrics, group_by, filters, time_grain, order_by)
+
+    with get_pool(db_path).connection() as conn:
+        sql, params, source_name = plan_aggregate(conn, metrics, group_by, filters, date_from, date_to,
+                                                  time_grain, order_by, descending, limit)
+        df = pd.read_sql_query(sql, conn, params=params)
+
+    logger.info(f"Aggregate answered from '{source_name}' ({len(df)} rows)")
+    return df, source_name
+
+
+def run_aggregate_tool(tool_input, db_path=DB_PATH):
+    """
+    Entry point for the agent's 'sales_aggregate' tool.
+    Takes the query as a JSON object and returns the result table as text.
+    """
+    try:
+        request = json.loads(tool_input.strip().strip("`"))
+        df, source = query_aggregate(
+            metrics=request.get("metrics", ["revenue"]),
+            group_by=request.get("group_by", []),
+            filters=request.get("filters"),
+            date_from=request.get("date_from"),
+            date_to=request.get("date_to"),
+            time_grain=request.get("time_grain"),
+            order_by=request.get("order_by"),
+            descending=request.get("descending", True),
+            limit=request.get("limit"),
+            db_path=db_path,
+        )
+    except Exception as e:
+        return f"Error: {e}"
+
+    if df.empty:
+        return "No rows matched."
+    text = df.head(TOOL_MAX_ROWS).to_string(index=False)
+    if len(df) > TOOL_MAX_ROWS:
+        text += f"\n... {len(df) - TOOL_MAX_ROWS} more rows"
+    return text
+
+
+AGGREGATE_TOOL_DESCRIPTION = (
+    "Fast pre-aggregated sales totals. Prefer this over python for sums/counts. "
+    "Input is a JSON object with keys: metrics (list of " + ", ".join(METRICS) + "), "
+    "group_by (list of columns such as product_category, product_name, store_location, sales_channel, "
+    "promo, paydayeffect, holiday), filters (object column -> value or list), "
+    "date_from/date_to ('YYYY-MM-DD', inclusive), time_grain (day, month or year), "
+    "order_by (a metric), descending (bool), limit (int). "
+    'Example: {"metrics": ["revenue"], "group_by": ["sales_channel"], "date_from": "2025-01-01", "date_to": "2025-12-31"}'
+)
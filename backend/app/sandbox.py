@@ -0,0 +1,344 @@
+"""
+Process-isolated execution of agent-generated pandas code.
+
+The sales frame is published once into shared memory. Worker processes attach
+to it without copying and run each python_repl_ast call under a wall-clock
+timeout, a CPU-time limit and an address-space limit. A call that hits the
+wall-clock timeout (or crashes its worker) kills only that worker, which is
+replaced, so a runaway cross join can't stall the Flask process or other requests.
+"""
+import os
+import re
+import ast
+import math
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from io import StringIO
+from queue import Queue, Empty
+from contextlib import redirect_stdout
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: only the wall-clock timeout applies there
+    resource = None
+
+# --- CONFIGURATION ---
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Wall-clock seconds per tool call; the worker is killed and replaced when exceeded
+SANDBOX_TIMEOUT_SECONDS = float(os.environ.get("SANDBOX_TIMEOUT_SECONDS", "30"))
+# CPU seconds per tool call
+SANDBOX_CPU_SECONDS = int(os.environ.get("SANDBOX_CPU_SECONDS", "20"))
+# Extra memory a tool call may allocate on top of the worker's baseline (Linux only)
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "1024"))
+# Longer results are cut before they are sent back to the agent
+SANDBOX_MAX_OUTPUT_CHARS = int(os.environ.get("SANDBOX_MAX_OUTPUT_CHARS", "20000"))
+# How long a new worker may take to start (spawned workers re-import the server's modules)
+SANDBOX_STARTUP_SECONDS = float(os.environ.get("SANDBOX_STARTUP_SECONDS", "120"))
+
+logger = logging.getLogger(__name__)
+
+TOOL_NOTE = (
+    "Every python_repl_ast call runs in a fresh session where only `df`, `pd` and `np` are defined, "
+    "so compute everything you need in a single snippet. `df` is read-only: assign new columns instead of "
+    "modifying existing ones."
+)
+
+
+class CPULimitExceeded(Exception):
+    pass
+
+
+# --- shared memory ---
+
+def publish_frame(df):
+    """
+    Copy every column of `df` into its own shared memory block.
+    Returns (segments, layout); `layout` is what workers need to attach.
+    Categoricals are shared as codes plus their categories.
+    """
+    segments = []
+    layout = {"columns": [], "datetime_index": isinstance(df.index, pd.DatetimeIndex) and "date" in df.columns}
+    for name in df.columns:
+        column = df[name]
+        entry = {"name": name}
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = np.asarray(column.cat.codes)
+            entry["categories"] = column.cat.categories.tolist()
+        else:
+            values = column.to_numpy()
+        if values.dtype == object:
+            raise TypeError(f"Column '{name}' has object dtype and can't be shared; convert it first")
+        segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[:] = values
+        segments.append(segment)
+        entry.update({"segment": segment.name, "dtype": values.dtype.str, "rows": len(values)})
+        layout["columns"].append(entry)
+    return segments, layout
+
+
+def _attach_segment(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: workers share the parent's resource tracker, which already
+        # tracks the block, so attaching normally doesn't change who unlinks it
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_frame(layout):
+    """Rebuild the frame from shared memory without copying. Returns (df, segments)."""
+    segments = []
+    columns = {}
+    for entry in layout["columns"]:
+        segment = _attach_segment(entry["segment"])
+        segments.append(segment)
+        values = np.ndarray((entry["rows"],), dtype=np.dtype(entry["dtype"]), buffer=segment.buf)
+        values.flags.writeable = False
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(values, categories=entry["categories"])
+        columns[entry["name"]] = values
+    df = pd.DataFrame(columns, copy=False)
+    if layout["datetime_index"]:
+        df = df.set_index("date", drop=False).rename_axis(None)
+    return df, segments
+
+
+# --- worker process ---
+
+def sanitize_input(code):
+    """Strip the backticks and 'python' marker LLMs like to wrap code in."""
+    code = re.sub(r"^(\s|`)*(?i:python)?\s*", "", code)
+    return re.sub(r"(\s|`)*$", "", code)
+
+
+def execute_code(code, namespace, cpu_seconds=SANDBOX_CPU_SECONDS, memory_mb=SANDBOX_MEMORY_MB):
+    """Run `code` like the pandas agent's REPL tool: the value of the last expression, or what was printed."""
+    output = StringIO()
+    try:
+        tree = ast.parse(sanitize_input(code))
+        with redirect_stdout(output):
+            exec(compile(ast.Module(tree.body[:-1], type_ignores=[]), "<agent>", "exec"), namespace)
+            last = ast.unparse(ast.Module(tree.body[-1:], type_ignores=[]))
+            try:
+                result = eval(last, namespace)
+            except SyntaxError:
+                exec(last, namespace)
+                result = None
+        return output.getvalue() if result is None else str(result)
+    except MemoryError:
+        return f"MemoryError: the code needed more than {memory_mb} MB"
+    except CPULimitExceeded:
+        return f"TimeoutError: the code used more than {cpu_seconds}s of CPU time"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def _virtual_memory_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _raise_cpu_limit(signum, frame):
+    raise CPULimitExceeded()
+
+
+def _set_cpu_limit(seconds):
+    if resource is None or not hasattr(resource, "RLIMIT_CPU"):
+        return
+    if seconds is None:
+        resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, resource.RLIM_INFINITY))
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = math.ceil(usage.ru_utime + usage.ru_stime)
+    resource.setrlimit(resource.RLIMIT_CPU, (used + seconds, resource.RLIM_INFINITY))
+
+
+def _worker_main(conn, layout, cpu_seconds, memory_mb):
+    df, segments = attach_frame(layout)
+    if resource is not None and hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    baseline = _virtual_memory_bytes()
+    if resource is not None and baseline is not None and memory_mb:
+        limit = baseline + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    conn.send("ready")
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        code, rows = message
+        # rows: partition row range of the question (see partitions.py); a zero-copy slice
+        frame = df if rows is None else df.iloc[rows[0]:rows[1]]
+        namespace = {"df": frame.copy(deep=False), "pd": pd, "np": np}
+        _set_cpu_limit(cpu_seconds)
+        try:
+            result = execute_code(code, namespace, cpu_seconds, memory_mb)
+        finally:
+            _set_cpu_limit(None)
+        del namespace
+        try:
+            conn.send(result[:SANDBOX_MAX_OUTPUT_CHARS])
+        except (EOFError, OSError):
+            break
+    del df
+    for segment in segments:
+        segment.close()
+
+
+# --- parent side ---
+
+class _Worker:
+    def __init__(self, context, layout, cpu_seconds, memory_mb, index):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, layout, cpu_seconds, memory_mb),
+            name=f"sandbox-worker-{index}", daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        """Wait for the worker's 'ready' message, sent once it has attached to the shared frame."""
+        if not self.ready and self.conn.poll(timeout):
+            self.ready = self.conn.recv() == "ready"
+        return self.ready
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Fixed set of worker processes sharing one published frame. run(code) is
+    thread-safe; concurrent calls run on different workers (and cores).
+    """
+
+    def __init__(self, df, workers=SANDBOX_WORKERS, timeout=SANDBOX_TIMEOUT_SECONDS,
+                 cpu_seconds=SANDBOX_CPU_SECONDS, memory_mb=SANDBOX_MEMORY_MB):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.num_workers = workers
+        # spawn: forking a multi-threaded server process is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._segments, self._layout = publish_frame(df)
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._spawned = 0
+        self._closed = False
+        self.calls = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.busy_seconds = 0.0
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        with self._lock:
+            self._spawned += 1
+            index = self._spawned
+        return _Worker(self._context, self._layout, self.cpu_seconds, self.memory_mb, index)
+
+    def run(self, code, rows=None):
+        """
+        Run one tool call, on rows [start, stop) of the frame if `rows` is given.
+        Always returns a string: the result, or an error the agent can read.
+        """
+        if self._closed:
+            return "Error: the Python sandbox is shut down"
+        started = time.monotonic()
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except Empty:
+            return f"TimeoutError: no Python worker became free within {self.timeout:g}s"
+
+        replace = False
+        try:
+            if not worker.wait_ready(SANDBOX_STARTUP_SECONDS):
+                replace = True
+                with self._lock:
+                    self.crashes += 1
+                return "Error: the Python worker did not start"
+            started = time.monotonic()
+            worker.conn.send((code, rows))
+            remaining = self.timeout - (time.monotonic() - started)
+            if worker.conn.poll(max(remaining, 0)):
+                return worker.conn.recv()
+            replace = True
+            with self._lock:
+                self.timeouts += 1
+            return f"TimeoutError: the code ran longer than {self.timeout:g}s and was stopped"
+        except (EOFError, OSError, BrokenPipeError):
+            # The worker died: killed by the OS (memory) or the hard CPU limit
+            replace = True
+            with self._lock:
+                self.crashes += 1
+            return "Error: the Python worker crashed while running this code (probably out of memory)"
+        finally:
+            with self._lock:
+                self.calls += 1
+                self.busy_seconds += time.monotonic() - started
+            if self._closed:
+                worker.kill()
+            else:
+                if replace:
+                    worker.kill()
+                    worker = self._spawn()
+                self._idle.put(worker)
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            worker.process.join(timeout=2)
+            if worker.process.is_alive():
+                worker.kill()
+        for segment in self._segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "idle_workers": self._idle.qsize(),
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "crashes": self.crashes,
+                "avg_call_seconds": self.busy_seconds / self.calls if self.calls else 0.0,
+                "timeout_seconds": self.timeout,
+                "cpu_seconds": self.cpu_seconds,
+                "memory_mb": self.memory_mb,
+                "shared_mb": sum(segment.size for segment in self._segments) / (1024 * 1024),
+            }
@@ -1,12 +1,19 @@
 import logging
-from threading import Thread
 from queue import Queue, Empty
 from flask import Flask, request, Response, stream_with_context, jsonify
 from flask_cors import CORS
-from langchain.callbacks.base import BaseCallbackHandler
-import re
 import time
-from agent import get_or_create_agent
+from agent import DB_PATH, release_agent, reload_dataset
+from streaming import sse_event
+from worker_pool import AgentWorkerPool, PoolSaturated
+from reloader import DatasetWatcher
+from partitions import question_scope
+from batch import run_batch, BATCH_ITEM_TIMEOUT_SECONDS, NDJSON_MIMETYPE
+from metrics import RequestTrace, TracingCallbackHandler, registry as metrics_registry, CONTENT_TYPE
+from handlers import (
+    ApiError, PredictRequest, BatchRequest, datasets, create_pool_agent, open_export, readiness,
+    register_pool_gauges, stats_routes, warm_up_answer_cache,
+)
 
 
 # Configure logging
@@ -16,97 +23,193 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-class StreamingQueueCallbackHandler(BaseCallbackHandler):
-    def __init__(self, queue: Queue):
-        self.queue = queue
-
-    def on_llm_new_token(self, token: str, **kwargs) -> None:
-        # Don't stream tokens - they include agent reasoning
-        pass
-
-    def on_agent_finish(self, finish, *args, **kwargs) -> None:
-        # <CHANGE> Extract and stream the final answer character by character
-        if finish and hasattr(finish, 'return_values'):
-            output = finish.return_values.get('output', '')
-            
-            # Stream the answer character by character for smooth display
-            for char in output:
-                self.queue.put(char)
-                time.sleep(0.005)  # Smooth typing effect
-                
-        self.queue.put(None)  # Signal completion
-
-    def on_llm_error(self, error: Exception, **kwargs) -> None:
-        error_msg = f"Error: {str(error)}"
-        for char in error_msg:
-            self.queue.put(char)
-            time.sleep(0.005)
-        self.queue.put(None)
+# Bounded set of agent instances; all of them share one sales DataFrame per dataset
+agent_pool = AgentWorkerPool(create_pool_agent, on_agent_retired=release_agent)
+# The pool drops its agents on a named dataset that is unloaded or reloaded
+datasets.on_dataset_changed = agent_pool.drop_dataset
 
-# --- ROUTES ---
-@app.route('/predict', methods=['POST'])
-def predict():
-    data = request.json
-    user_text = data.get('message')
 
-    if not user_text:
-        return jsonify({"error": "No message provided"}), 400
+def reload_agents(version):
+    """New data was loaded: build the new frame and agents here, on the watcher thread."""
+    if reload_dataset(version) is not None:
+        agent_pool.reload()
+
+dataset_watcher = DatasetWatcher(DB_PATH, reload_agents)
+
+register_pool_gauges(lambda: agent_pool.stats()["queue_length"], lambda: agent_pool.stats()["busy_workers"],
+                     lambda: agent_pool.ready_workers)
 
-    agent = get_or_create_agent()
-    if not agent:
-        return jsonify({"error": "AI agent not available. Please check the server logs."}), 503
+def error_response(error: ApiError):
+    return jsonify(error.body), error.status, error.headers
 
+# --- ROUTES ---
+@app.route('/predict', methods=['POST'])
+def predict():
+    try:
+        req = PredictRequest(request.json)
+    except ApiError as e:
+        return error_response(e)
     q = Queue()
+    trace = req.trace
 
     def stream_generator(queue: Queue):
         try:
             while True:
                 try:
-                    token = queue.get(timeout=None) 
+                    token = queue.get(timeout=None)
                     if token is None:
                         break
-                    yield f"data: {token}\n\n"
+                    trace.record_frame()
+                    yield sse_event(token)
                 except Empty:
                     logger.warning("Queue timeout reached, ending stream")
                     break
                 except Exception as e:
                     logger.error(f"Stream error: {e}")
-                    yield f"data: Error: {str(e)}\n\n"
+                    trace.outcome = "error"
+                    yield sse_event(f"Error: {str(e)}")
                     break
-        finally:
             yield "data: [DONE]\n\n"
+        except GeneratorExit:
+            trace.outcome = "disconnected"
+            raise
+        finally:
+            trace.finish()
 
-    def agent_task(prompt: str, handler: BaseCallbackHandler, output_queue: Queue):
+    def agent_task(agent, handler, output_queue: Queue, submitted):
         try:
-            greetings = ["hello", "hi", "hallo", "hai"]
-            if prompt.lower().strip() in greetings:
-                greeting_msg = "Hello, I'm your assistant to help you know a little bit more about your sales. Ask me anything related to your sales. 👋"
-                for char in greeting_msg:
-                    output_queue.put(char)
-                    time.sleep(0.005) # Small delay for streaming effect
-                output_queue.put(None)
-                return
-            
             # --- RUN AGENT ---
-            agent.invoke(
-                {"input": prompt}, 
-                config={"callbacks": [handler]}
-            )
+            started = time.perf_counter()
+            trace.record_queue_wait(started - submitted)
+            with req.scope():
+                result = agent.invoke(req.agent_input(), config=req.agent_config(handler))
+            req.record(result, time.perf_counter() - started)
 
         except Exception as e:
             logger.error(f"❗ Agent task error: {e}")
+            trace.outcome = "error"
             output_queue.put(f"I encountered an error: {str(e)}")
         finally:
             output_queue.put(None)
 
-    handler = StreamingQueueCallbackHandler(q)
-    
-    thread = Thread(target=agent_task, args=(user_text, handler, q))
-    thread.daemon = True 
-    thread.start()
+    def reject_task(message: str, output_queue: Queue):
+        trace.outcome = "rejected"
+        output_queue.put(message)
+        output_queue.put(None)
+
+    # --- GREETING / FAST PATH / ANSWER CACHE: no LLM needed ---
+    answer = req.quick_reply()
+    if answer is not None:
+        q.put(answer)
+        q.put(None)
+        return sse_response(stream_generator(q))
+
+    # --- DATASET AND AGENT: queued for the next free worker ---
+    try:
+        req.load_dataset()
+        agent_pool.start()
+        req.check_ready(agent_pool.ready_workers, agent_pool.warming_up)
+    except ApiError as e:
+        return error_response(e)
+
+    handler = req.streaming_handler(q)
+    submitted = time.perf_counter()
+    try:
+        agent_pool.submit(
+            lambda agent: agent_task(agent, handler, q, submitted),
+            on_rejected=lambda message: reject_task(message, q),
+            dataset=req.named,
+            approximate=req.approximate,
+        )
+    except PoolSaturated as e:
+        logger.warning(f"Rejected /predict with {e.status}: {e}")
+        return error_response(req.reject(str(e), e.status, e.retry_after))
+
+    return sse_response(stream_generator(q))
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Answer a list of questions; NDJSON lines in completion order (see batch.py)."""
+    try:
+        batch = BatchRequest(request.json)
+    except ApiError as e:
+        return error_response(e)
 
     return Response(
-        stream_with_context(stream_generator(q)), 
+        stream_with_context(run_batch(batch.items, batch.concurrency,
+                                      lambda question: answer_batch_question(batch, question), batch.total)),
+        mimetype=NDJSON_MIMETYPE,
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/export', methods=['POST'])
+def export():
+    """Stream every row of a read-only query or rollup as CSV, NDJSON or Arrow IPC (see export.py)."""
+    try:
+        stream, mimetype, headers = open_export(request.json)
+    except ApiError as e:
+        return error_response(e)
+    # The response closes the stream (connection and export slot) when it ends or the client goes away
+    return Response(stream, mimetype=mimetype, headers=headers)
+
+def answer_batch_question(batch, question):
+    """Answer one batch question without streaming: quick answer, else an agent from the pool."""
+    trace = RequestTrace(question)
+    try:
+        answer, version = batch.quick_reply(question, trace)
+        if answer is not None:
+            return {"answer": answer, "path": trace.path}
+        batch.load_dataset()
+        return {"answer": run_on_agent_pool(batch, question, version, trace), "path": trace.path}
+    except Exception as e:
+        trace.outcome = "error"
+        return {"error": str(e)}
+    finally:
+        trace.finish()
+
+def run_on_agent_pool(batch, question, version, trace):
+    """Run the agent on the next free worker and wait for its answer. Raises on errors and timeouts."""
+    done = Queue()
+    submitted = time.perf_counter()
+    deadline = submitted + BATCH_ITEM_TIMEOUT_SECONDS
+
+    def task(agent):
+        try:
+            started = time.perf_counter()
+            trace.record_queue_wait(started - submitted)
+            with question_scope(question):
+                result = agent.invoke({"input": question}, config={"callbacks": [TracingCallbackHandler(trace)]})
+            done.put((True, batch.record(question, result, version, time.perf_counter() - started)))
+        except Exception as e:
+            logger.error(f"❗ Batch agent task error: {e}")
+            done.put((False, f"I encountered an error: {str(e)}"))
+
+    agent_pool.start()
+    if not agent_pool.wait_until_ready(timeout=max(deadline - time.perf_counter(), 0)):
+        raise RuntimeError("AI agent not available. Please check the server logs.")
+    # Unlike /predict, a busy pool isn't an error here: wait for room as long as the item may take
+    while True:
+        try:
+            agent_pool.submit(task, on_rejected=lambda message: done.put((False, message)), dataset=batch.named,
+                              approximate=batch.approximate)
+            break
+        except PoolSaturated as e:
+            if time.perf_counter() + e.retry_after > deadline:
+                trace.outcome = "rejected"
+                raise
+            time.sleep(e.retry_after)
+
+    try:
+        ok, answer = done.get(timeout=max(deadline - time.perf_counter(), 0))
+    except Empty:
+        raise TimeoutError(f"No answer within {BATCH_ITEM_TIMEOUT_SECONDS:g}s")
+    if not ok:
+        raise RuntimeError(answer)
+    return answer
+
+def sse_response(generator):
+    return Response(
+        stream_with_context(generator),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -115,7 +218,30 @@ def predict():
         }
     )
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving, even while agents are still warming up."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: at least one agent (and so the sales frame) is loaded."""
+    agent_pool.start()
+    body, status = readiness(agent_pool.ready_workers, agent_pool.warming_up)
+    return jsonify(body), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics_registry.render(), content_type=CONTENT_TYPE)
+
+# /sandbox/stats, /pool/stats, /datasets/stats, ...: same payloads as the ASGI server
+for path, payload in stats_routes(lambda: agent_pool.stats(), dataset_watcher):
+    app.add_url_rule(path, path, lambda payload=payload: jsonify(payload()), methods=['GET'])
+
 if __name__ == '__main__':
     print("🚀 Starting Flask Server...")
-    get_or_create_agent()
+    # Agents (and the sales frame) load in the worker threads; /healthz and /readyz answer meanwhile
+    agent_pool.start()
+    dataset_watcher.start()
+    warm_up_answer_cache()
     app.run(debug=True, port=5000)
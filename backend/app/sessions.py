@@ -0,0 +1,218 @@
+"""
+Server-side conversation memory for /predict.
+
+A client that sends a `session_id` gets its earlier questions, answers and the
+agent's intermediate results (tool input and a cut of the output) put in front of
+its next question, so follow-ups like "and for Jakarta?" work without the agent
+starting over. The history is compacted as it grows: the newest turns are kept
+word for word, older ones are folded into one line each, and the oldest lines are
+dropped once the context exceeds its token budget. Prompts, and with them LLM
+latency, stay flat however long the conversation gets. Idle sessions expire and
+the least recently used are evicted when the store exceeds its memory cap.
+"""
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from langchain.callbacks.base import BaseCallbackHandler
+from metrics import estimate_tokens
+
+# --- CONFIGURATION ---
+# Tokens of conversation context put in front of a question
+SESSION_TOKEN_BUDGET = int(os.environ.get("SESSION_TOKEN_BUDGET", "600"))
+# Newest turns kept word for word (as far as the budget allows); older ones are one line each
+SESSION_RECENT_TURNS = int(os.environ.get("SESSION_RECENT_TURNS", "2"))
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", str(30 * 60)))
+SESSION_MAX_MB = float(os.environ.get("SESSION_MAX_MB", "32"))
+
+# Characters kept of an answer in a recent turn, of one intermediate result, and of a folded turn
+ANSWER_CHARS = 600
+STEP_CHARS = 200
+FOLDED_CHARS = 160
+# Intermediate results kept per turn (the last ones, which led to the answer)
+MAX_STEPS = 3
+
+
+def _cut(text, limit):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+class Turn:
+    def __init__(self, question, answer, steps=()):
+        self.question = question
+        self.answer = answer
+        self.steps = list(steps)[-MAX_STEPS:]
+
+    def full_text(self):
+        lines = [f"Q: {self.question}", f"A: {_cut(self.answer, ANSWER_CHARS)}"]
+        if self.steps:
+            lines.append("Intermediate results: " + " | ".join(self.steps))
+        return "\n".join(lines)
+
+    def folded_text(self):
+        return f"- Q: {_cut(self.question, FOLDED_CHARS)} -> A: {_cut(self.answer, FOLDED_CHARS)}"
+
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.recent = []
+        self.folded = []
+        self.turns = 0
+        self.compactions = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def context(self):
+        """Conversation so far, for the prompt ("" for a new session)."""
+        parts = self.folded + [turn.full_text() for turn in self.recent]
+        if not parts:
+            return ""
+        return "Earlier in this conversation (use it for follow-up questions):\n" + "\n".join(parts)
+
+    def add(self, turn, budget):
+        self.recent.append(turn)
+        self.turns += 1
+        self.compact(budget)
+
+    def compact(self, budget):
+        """Fold old turns into one line each, then drop the oldest lines, until the context fits `budget`."""
+        while len(self.recent) > SESSION_RECENT_TURNS:
+            self.folded.append(self.recent.pop(0).folded_text())
+            self.compactions += 1
+        while estimate_tokens(self.context()) > budget:
+            if len(self.recent) > 1:
+                self.folded.append(self.recent.pop(0).folded_text())
+            elif self.folded:
+                self.folded.pop(0)
+            elif self.recent and self.recent[0].steps:
+                self.recent[0].steps = []
+            elif self.recent:
+                # A single huge turn: keep only its short form
+                self.folded.append(self.recent.pop(0).folded_text())
+            else:
+                break
+            self.compactions += 1
+
+    def size_bytes(self):
+        return sys.getsizeof(self.context()) + 200
+
+
+class StepRecorder(BaseCallbackHandler):
+    """Collects the agent's tool calls of one run as 'input -> output' summaries for the session."""
+
+    def __init__(self):
+        self.steps = []
+        self._pending = {}
+
+    def on_agent_action(self, action, *, run_id=None, **kwargs):
+        if action.tool != "_Exception":
+            self._pending[action.tool] = action.tool_input
+
+    def on_tool_end(self, output, *, run_id=None, name=None, **kwargs):
+        tool_input = self._pending.pop(name, None) if name else None
+        if tool_input is None and self._pending:
+            tool_input = self._pending.popitem()[1]
+        if tool_input is not None:
+            self.steps.append(f"{_cut(tool_input, STEP_CHARS // 2)} -> {_cut(output, STEP_CHARS)}")
+
+
+def session_key(session_id, dataset=None):
+    """Sessions are per dataset: the same client id on another dataset starts a new conversation."""
+    return f"{dataset}:{session_id}" if session_id and dataset else session_id
+
+
+class SessionStore:
+    """Sessions by id, least recently used first."""
+
+    def __init__(self, token_budget=SESSION_TOKEN_BUDGET, idle_seconds=SESSION_IDLE_SECONDS,
+                 max_bytes=SESSION_MAX_MB * 1024 * 1024):
+        self.token_budget = token_budget
+        self.idle_seconds = idle_seconds
+        self.max_bytes = int(max_bytes)
+        self._sessions = OrderedDict()
+        self._bytes = {}
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _get(self, session_id, create):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.last_used > self.idle_seconds:
+                self._drop(session_id)
+                self.expired += 1
+                session = None
+            if session is None:
+                if not create:
+                    return None
+                session = self._sessions[session_id] = Session(session_id)
+                self._bytes[session_id] = session.size_bytes()
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def _drop(self, session_id):
+        self._sessions.pop(session_id, None)
+        self._bytes.pop(session_id, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used > self.idle_seconds:
+                self._drop(session_id)
+                self.expired += 1
+        while self._sessions and sum(self._bytes.values()) > self.max_bytes:
+            self._drop(next(iter(self._sessions)))
+            self.evicted += 1
+
+    def has_history(self, session_id):
+        session = self._get(session_id, create=False) if session_id else None
+        return session is not None and session.turns > 0
+
+    def prompt(self, session_id, question):
+        """`question` with the session's context in front of it (unchanged without a session)."""
+        session = self._get(session_id, create=False) if session_id else None
+        if session is None:
+            return question
+        with session.lock:
+            context = session.context()
+        return f"{context}\n\nCurrent question: {question}" if context else question
+
+    def record(self, session_id, question, answer, steps=()):
+        """Add a finished turn to the session (created on its first turn) and compact it."""
+        if not session_id:
+            return
+        session = self._get(session_id, create=True)
+        with session.lock:
+            session.add(Turn(question, answer, steps), self.token_budget)
+            size = session.size_bytes()
+        with self._lock:
+            if session_id in self._sessions:
+                self._bytes[session_id] = size
+            self._evict()
+
+    def clear(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            return {
+                "sessions": len(sessions),
+                "bytes": sum(self._bytes.values()),
+                "max_bytes": self.max_bytes,
+                "token_budget": self.token_budget,
+                "idle_seconds": self.idle_seconds,
+                "turns": sum(session.turns for session in sessions),
+                "compactions": sum(session.compactions for session in sessions),
+                "expired": self.expired,
+                "evicted_for_memory": self.evicted,
+            }
+
+
+sessions = SessionStore()
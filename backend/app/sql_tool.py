@@ -0,0 +1,177 @@
+import sqlite3
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from queue import Queue, Empty, Full
+
+# --- CONFIGURATION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(current_dir, "databases", "retail_database.db")
+
+POOL_SIZE = int(os.environ.get("SQL_POOL_SIZE", "4"))
+# Rows returned to the agent per query; anything beyond is cut off
+MAX_RESULT_ROWS = int(os.environ.get("SQL_MAX_ROWS", "200"))
+# Queries running longer than this are interrupted
+QUERY_TIMEOUT_SECONDS = float(os.environ.get("SQL_QUERY_TIMEOUT", "10"))
+
+logger = logging.getLogger(__name__)
+
+_READ_ONLY_STATEMENT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def connect_read_only(db_path=DB_PATH):
+    """A read-only connection (mode=ro and query_only) usable from any thread."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only=ON")
+    conn.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache per connection
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class ReadOnlyConnectionPool:
+    """
+    Small pool of read-only SQLite connections shared across threads.
+    Connections are opened lazily with mode=ro and query_only, so nothing that
+    comes through the pool can modify the database.
+    """
+
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = Queue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return connect_read_only(self.db_path)
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """One shared pool per database file."""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ReadOnlyConnectionPool(db_path)
+            _pools[db_path] = pool
+        return pool
+
+
+def validate_query(sql):
+    """Only a single SELECT (or WITH ... SELECT) statement is allowed."""
+    sql = sql.strip().strip("`").strip()
+    if sql.lower().startswith("sql"):
+        sql = sql[3:].strip()
+    sql = sql.rstrip(";").strip()
+    if not _READ_ONLY_STATEMENT.match(sql):
+        raise ValueError("Only SELECT queries are allowed.")
+    if ";" in sql:
+        raise ValueError("Only one statement per query is allowed.")
+    return sql
+
+
+def execute_query(sql, params=(), db_path=DB_PATH, max_rows=MAX_RESULT_ROWS, timeout=QUERY_TIMEOUT_SECONDS):
+    """
+    Run a validated read-only query on a pooled connection.
+    Returns (column names, rows, truncated). At most `max_rows` rows are fetched.
+    """
+    sql = validate_query(sql)
+    deadline = time.monotonic() + timeout
+
+    def check_deadline():
+        # Non-zero return value makes SQLite abort the statement
+        return 1 if time.monotonic() > deadline else 0
+
+    with get_pool(db_path).connection() as conn:
+        conn.set_progress_handler(check_deadline, 10000)
+        try:
+            cursor = conn.execute(sql, params)
+            columns = [col[0] for col in cursor.description or []]
+            rows = cursor.fetchmany(max_rows + 1)
+            cursor.close()
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise TimeoutError(f"Query took longer than {timeout:g}s and was stopped.") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    truncated = len(rows) > max_rows
+    return columns, rows[:max_rows], truncated
+
+
+def format_rows(columns, rows, truncated=False):
+    if not rows:
+        return "No rows returned."
+    lines = [" | ".join(columns)]
+    lines.extend(" | ".join("" if value is None else str(value) for value in row) for row in rows)
+    if truncated:
+        lines.append(f"... result cut off at {len(rows)} rows, add LIMIT or aggregate further")
+    return "\n".join(lines)
+
+
+def run_sql_tool(tool_input, db_path=DB_PATH):
+    """Entry point for the agent's 'sql_query' tool."""
+    try:
+        columns, rows, truncated = execute_query(tool_input, db_path=db_path)
+    except Exception as e:
+        return f"Error: {e}"
+    return format_rows(columns, rows, truncated)
+
+
+def describe_schema(db_path=DB_PATH, table="sales"):
+    """Column list of `table` for the agent prompt, e.g. 'date DATE, units_sold INTEGER, ...'."""
+    with get_pool(db_path).connection() as conn:
+        info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    return ", ".join(f"{row[1]} {row[2]}" for row in info)
+
+
+SQL_TOOL_DESCRIPTION = (
+    "Run one read-only SQLite SELECT against the 'sales' table and get the rows back. "
+    "Filter and aggregate in SQL (WHERE, GROUP BY, ORDER BY, LIMIT); dates are 'YYYY-MM-DD' text. "
+    f"At most {MAX_RESULT_ROWS} rows are returned. Input is the SQL query only."
+)
@@ -0,0 +1,120 @@
+import re
+import time
+from queue import Queue
+from langchain.callbacks.base import BaseCallbackHandler
+
+# Final-answer tokens are grouped into SSE frames of at least this many characters,
+# or whatever arrived within FRAME_MAX_DELAY seconds, whichever comes first
+FRAME_MIN_CHARS = 24
+FRAME_MAX_DELAY = 0.05
+FINAL_ANSWER_MARKER = "Final Answer:"
+# A ReAct step that names an Action as well as a Final Answer isn't final: the parser rejects it
+ACTION_PATTERN = re.compile(r"Action\s*\d*\s*:")
+# The end of the text that may still turn into "Action:"
+_PARTIAL_ACTION = re.compile(r"A(c(t(i(o(n\s*\d*\s*)?)?)?)?)?$")
+
+
+def _answer_so_far(answer):
+    """The part of a step's answer that can be sent: up to any Action, trailing whitespace held back."""
+    cut = ACTION_PATTERN.search(answer) or _PARTIAL_ACTION.search(answer)
+    return (answer[:cut.start()] if cut else answer).rstrip()
+
+
+class StreamingQueueCallbackHandler(BaseCallbackHandler):
+    """
+    Streams the agent's final answer into `queue` as the LLM generates it.
+    Tokens before 'Final Answer:' are agent reasoning and are not sent, and neither is a
+    step that names an Action too (it isn't final). Text the client already has can't be
+    taken back, so only the first step that streams an answer streams: if the agent
+    still retries, the final answer is only sent where it carries on from that text.
+    `answer_suffix(answer)` may return text to send after the answer (e.g. approximate.approximate_note).
+    """
+
+    def __init__(self, queue: Queue, answer_suffix=None):
+        self.queue = queue
+        self.answer_suffix = answer_suffix
+        self._sent = ""
+        self._pending = ""
+        self._last_flush = time.monotonic()
+        self._start_step()
+
+    def _start_step(self) -> None:
+        # State of the current LLM call (ReAct step)
+        self._text = ""
+        self._answer_at = None
+        self._queued = 0
+        self._may_stream = not self._sent and not self._pending
+
+    def _flush(self) -> None:
+        if self._pending:
+            self.queue.put(self._pending)
+            self._sent += self._pending
+            self._pending = ""
+        self._last_flush = time.monotonic()
+
+    def on_llm_start(self, *args, **kwargs) -> None:
+        # Every ReAct step is a new LLM call; a new one means the last one wasn't final
+        self._pending = ""
+        self._start_step()
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self._text += token
+        if self._answer_at is None:
+            marker_at = self._text.find(FINAL_ANSWER_MARKER)
+            if marker_at == -1:
+                return
+            self._answer_at = marker_at + len(FINAL_ANSWER_MARKER)
+            if ACTION_PATTERN.search(self._text[:marker_at]):
+                self._may_stream = False
+        if not self._may_stream:
+            return
+
+        answer = _answer_so_far(self._text[self._answer_at:].lstrip())
+        self._pending += answer[self._queued:]
+        self._queued = len(answer)
+        if len(self._pending) >= FRAME_MIN_CHARS or time.monotonic() - self._last_flush >= FRAME_MAX_DELAY:
+            self._flush()
+
+    def on_agent_finish(self, finish, *args, **kwargs) -> None:
+        output = finish.return_values.get('output', '') if finish and hasattr(finish, 'return_values') else ''
+        streamed = self._sent + self._pending
+        if not streamed:
+            # Nothing streamed (e.g. the answer came from the parsing-error handler): send it in one frame
+            if output:
+                self.queue.put(output)
+        elif output.startswith(streamed):
+            # The rest of the answer: text held back at the end of the step
+            self._pending += output[len(streamed):]
+            self._flush()
+        else:
+            self._flush()
+        if self.answer_suffix is not None:
+            suffix = self.answer_suffix(output)
+            if suffix:
+                self.queue.put(suffix)
+
+        self.queue.put(None)  # Signal completion
+
+    def on_llm_error(self, error: Exception, **kwargs) -> None:
+        self._flush()
+        self.queue.put(f"Error: {str(error)}")
+        self.queue.put(None)
+
+
+def sse_event(text: str) -> str:
+    """One SSE event; multi-line text becomes several 'data:' lines so newlines survive."""
+    return "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+
+
+class AsyncQueueAdapter:
+    """
+    Lets StreamingQueueCallbackHandler feed an asyncio.Queue from any thread.
+    LangChain may call sync callbacks from worker threads, so puts are handed to the event loop.
+    """
+
+    def __init__(self, queue, loop):
+        self.queue = queue
+        self.loop = loop
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
@@ -0,0 +1,183 @@
+"""
+Memoization of the pandas agent's code-execution tool.
+
+Snippets like `df.head()` or `df.groupby('sales_channel')['revenue'].sum()` come
+back across users all the time. Their output only depends on the code and the
+data, so it is cached under ((dataset name, version), normalized code). Only single
+expressions that can't have side effects and only read `df`, `pd`, `np` and safe
+builtins are cached; everything else runs every time.
+"""
+import os
+import re
+import ast
+import threading
+from collections import OrderedDict
+from sandbox import sanitize_input
+
+# --- CONFIGURATION ---
+# Set TOOL_CACHE=0 to run every tool call
+TOOL_CACHE_ENABLED = os.environ.get("TOOL_CACHE", "1") == "1"
+# Total size of cached outputs (the normalized code counts too)
+TOOL_CACHE_MAX_MB = float(os.environ.get("TOOL_CACHE_MAX_MB", "64"))
+# Outputs larger than this are not cached
+TOOL_CACHE_MAX_ENTRY_KB = float(os.environ.get("TOOL_CACHE_MAX_ENTRY_KB", "512"))
+
+# Names an expression may read
+SAFE_NAMES = {
+    "df", "pd", "np",
+    "len", "sum", "min", "max", "round", "sorted", "abs", "any", "all", "range", "enumerate", "zip",
+    "list", "dict", "set", "tuple", "str", "int", "float", "bool", "True", "False", "None",
+}
+# Method and function names that write files, mutate in place, draw, or aren't deterministic
+UNSAFE_CALLS = {
+    "to_csv", "to_excel", "to_parquet", "to_pickle", "to_sql", "to_json", "to_html", "to_feather",
+    "to_hdf", "to_clipboard", "to_latex", "plot", "hist", "boxplot", "savefig", "show",
+    "append", "extend", "insert", "pop", "popitem", "remove", "clear", "update", "setdefault", "sort",
+    "sample", "random", "rand", "randn", "randint", "choice", "shuffle", "permutation", "now", "today",
+    "utcnow", "print", "exec", "eval", "open", "input", "compile", "globals", "locals", "vars",
+    "setattr", "delattr", "getattr", "__import__", "exit", "quit", "breakpoint",
+}
+# Outputs that describe a failure ("KeyError: 'x'") are never cached
+_ERROR_OUTPUT = re.compile(r"^\w+(Error|Exception|Exit|Interrupt|Warning)\b:")
+
+
+def normalize_code(code):
+    """Canonical source of `code` (formatting, quotes and comments don't matter), or None if it doesn't parse."""
+    try:
+        return ast.unparse(ast.parse(sanitize_input(code)))
+    except (SyntaxError, ValueError):
+        return None
+
+
+def is_cacheable(code):
+    """True if `code` is a single expression with no side effects that only reads the frame and safe names."""
+    try:
+        tree = ast.parse(sanitize_input(code))
+    except (SyntaxError, ValueError):
+        return False
+    if len(tree.body) != 1 or not isinstance(tree.body[0], ast.Expr):
+        return False
+
+    # Names bound inside the expression itself (comprehension targets, lambda arguments)
+    local_names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            local_names.add(node.id)
+        elif isinstance(node, ast.arg):
+            local_names.add(node.arg)
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.NamedExpr, ast.Await, ast.Yield, ast.YieldFrom)):
+            return False
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id not in SAFE_NAMES and node.id not in local_names:
+                return False
+        if isinstance(node, ast.Attribute):
+            if node.attr.startswith("__") or node.attr in UNSAFE_CALLS:
+                return False
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+            if name in UNSAFE_CALLS:
+                return False
+            for keyword in node.keywords:
+                if keyword.arg == "inplace":
+                    return False
+    return True
+
+
+class ToolCache:
+    """LRU cache of tool outputs, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes=TOOL_CACHE_MAX_MB * 1024 * 1024, max_entry_bytes=TOOL_CACHE_MAX_ENTRY_KB * 1024):
+        self.max_bytes = int(max_bytes)
+        self.max_entry_bytes = int(max_entry_bytes)
+        self._entries = OrderedDict()  # (version, code, scope) -> (output, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def call(self, run, code, version, scope=None):
+        """
+        Return run(code) as a string, from the cache when the same expression ran on the same
+        data. `scope` tells apart calls on different parts of it (e.g. a partition row range).
+        """
+        if not TOOL_CACHE_ENABLED or version is None or not is_cacheable(code):
+            with self._lock:
+                self.uncacheable += 1
+            return str(run(code))
+
+        key = (version, normalize_code(code), scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        output = str(run(code))
+        size = len(output.encode("utf-8")) + len(key[1].encode("utf-8"))
+        if size <= self.max_entry_bytes and not _ERROR_OUTPUT.match(output):
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous[1]
+                self._entries[key] = (output, size)
+                self._bytes += size
+                self._evict()
+        return output
+
+    def drop_dataset(self, name, keep_version=None):
+        """
+        Free the entries of dataset `name` (versions are (dataset name, version) keys),
+        except those of `keep_version`: after a reload, or when the dataset is unloaded.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0][0] == name and key[0] != keep_version]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": TOOL_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+tool_cache = ToolCache()
+
+
+def memoized(run, version, scope=None):
+    """
+    Wrap a tool function so its cacheable calls go through tool_cache for dataset `version`.
+    With `scope`, each call runs as run(code, scope()) and is cached per scope.
+    """
+    def cached_run(code):
+        if scope is None:
+            return tool_cache.call(run, code, version)
+        rows = scope()
+        return tool_cache.call(lambda c: run(c, rows), code, version, rows)
+    return cached_run
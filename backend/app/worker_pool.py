@@ -0,0 +1,319 @@
+import os
+import math
+import time
+import logging
+import threading
+from queue import Queue, Full, Empty
+
+# --- CONFIGURATION ---
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", "4"))
+# Requests waiting for a worker; more than this are rejected with 429
+AGENT_QUEUE_SIZE = int(os.environ.get("AGENT_QUEUE_SIZE", "16"))
+# Requests that would wait (or have waited) longer than this for a worker are rejected with 503
+AGENT_MAX_QUEUE_WAIT = float(os.environ.get("AGENT_MAX_QUEUE_WAIT", "30"))
+# How often an idle worker checks for a replacement agent after reload()
+AGENT_SWAP_POLL_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised by submit() when the request can't be admitted. Maps to an HTTP status with Retry-After."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Job:
+    def __init__(self, task, on_rejected, dataset=None, approximate=False):
+        self.task = task
+        self.on_rejected = on_rejected
+        self.dataset = dataset
+        self.approximate = approximate
+        self.enqueued_at = time.monotonic()
+
+
+class _WorkerStats:
+    def __init__(self, name):
+        self.name = name
+        self.busy = False
+        self.busy_seconds = 0.0
+        self.jobs = 0
+        self.errors = 0
+        self.agent_ready = False
+        # Set by reload(); taken over between jobs
+        self.pending_agent = None
+        # (dataset, approximate) -> agent, for named datasets (see datasets.py) and
+        # approximate answers (see approximate.py); built on their first job
+        self.named_agents = {}
+        # Set by drop_dataset(); those agents are discarded between jobs
+        self.dropped_datasets = set()
+
+
+class AgentWorkerPool:
+    """
+    Fixed set of worker threads, each owning its own agent instance, fed from a
+    bounded queue. Admission control happens in submit(): a full queue gives 429,
+    an estimated wait above `max_queue_wait` gives 503, both with a Retry-After hint.
+    Jobs that still end up waiting too long are rejected when a worker picks them up.
+    Jobs for a named dataset or for an approximate answer run on another agent, which
+    the worker builds with agent_factory(dataset=name, approximate=approximate).
+    """
+
+    def __init__(self, agent_factory, num_workers=AGENT_WORKERS, queue_size=AGENT_QUEUE_SIZE,
+                 max_queue_wait=AGENT_MAX_QUEUE_WAIT, on_agent_retired=None):
+        self.agent_factory = agent_factory
+        # Called with an agent that reload() replaced, once its worker has let go of it
+        self.on_agent_retired = on_agent_retired
+        self.num_workers = num_workers
+        self.max_queue_wait = max_queue_wait
+        self._queue = Queue(maxsize=queue_size)
+        self._workers = []
+        self._worker_stats = []
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._init_done = threading.Condition(self._lock)
+        self._init_attempts = 0
+        # Moving average of how long one job keeps a worker busy, used to estimate queue wait
+        self._avg_service_seconds = None
+        self.accepted = 0
+        self.rejected_full = 0
+        self.rejected_wait = 0
+        self.expired = 0
+        self.total_queue_wait = 0.0
+        self.reloads = 0
+
+    def start(self):
+        """Start the workers (idempotent). Each worker builds its agent before taking jobs."""
+        with self._lock:
+            if self._workers:
+                return
+            self._started_at = time.monotonic()
+            for i in range(self.num_workers):
+                stats = _WorkerStats(f"agent-worker-{i}")
+                thread = threading.Thread(target=self._run, args=(stats,), name=stats.name, daemon=True)
+                self._worker_stats.append(stats)
+                self._workers.append(thread)
+                thread.start()
+
+    @property
+    def ready_workers(self):
+        return sum(1 for stats in self._worker_stats if stats.agent_ready)
+
+    @property
+    def warming_up(self):
+        """True while workers are still building their first agent and none is ready yet."""
+        return self._started_at is not None and self.ready_workers == 0 and self._init_attempts < self.num_workers
+
+    def wait_until_ready(self, timeout=None):
+        """Block until one worker has an agent or every worker failed to build one. Returns True if any is ready."""
+        self.start()
+        with self._init_done:
+            self._init_done.wait_for(
+                lambda: self.ready_workers > 0 or self._init_attempts >= self.num_workers, timeout)
+        return self.ready_workers > 0
+
+    def estimated_wait(self):
+        """Seconds a new request would wait for a worker, based on queue length and average job time."""
+        if self._avg_service_seconds is None:
+            return 0.0
+        busy = sum(1 for stats in self._worker_stats if stats.busy)
+        ahead = self._queue.qsize() + busy - self.num_workers + 1
+        if ahead <= 0:
+            return 0.0
+        return ahead * self._avg_service_seconds / self.num_workers
+
+    def submit(self, task, on_rejected, dataset=None, approximate=False):
+        """
+        Queue `task(agent)` for the next free worker, on an agent for `dataset` (None: the default one)
+        that answers exactly or, with `approximate`, from the sample.
+        `on_rejected(message)` is called instead if the job expires in the queue
+        or the worker has no agent. Raises PoolSaturated if the request isn't admitted.
+        """
+        self.start()
+        wait = self.estimated_wait()
+        if wait > self.max_queue_wait:
+            with self._lock:
+                self.rejected_wait += 1
+            raise PoolSaturated("The assistant is busy, please try again shortly.", 503, math.ceil(wait))
+        try:
+            self._queue.put_nowait(_Job(task, on_rejected, dataset, approximate))
+        except Full:
+            with self._lock:
+                self.rejected_full += 1
+            retry_after = math.ceil(self._avg_service_seconds or 1)
+            raise PoolSaturated("Too many requests are waiting, please try again shortly.", 429, retry_after)
+        with self._lock:
+            self.accepted += 1
+
+    def reload(self):
+        """
+        Build a new agent for every worker on the calling thread (e.g. after the data
+        changed). Each worker switches to it between jobs, so running jobs finish on
+        their old agent. Returns the number of agents built.
+        """
+        if not self._workers:
+            return 0
+        built = 0
+        for stats in self._worker_stats:
+            try:
+                agent = self.agent_factory()
+            except Exception as e:
+                logger.error(f"❗ Could not rebuild the agent of {stats.name}: {e}")
+                continue
+            if agent is None:
+                continue
+            with self._lock:
+                previous, stats.pending_agent = stats.pending_agent, agent
+            if previous is not None:
+                self._retire(previous)
+            built += 1
+        # The other agents on the default dataset are built again on their next job
+        self.drop_dataset(None)
+        with self._lock:
+            self.reloads += 1
+        return built
+
+    def drop_dataset(self, name):
+        """Discard the workers' other agents on dataset `name` (unloaded or reloaded); its next jobs build new ones."""
+        with self._lock:
+            for stats in self._worker_stats:
+                stats.dropped_datasets.add(name)
+
+    def _drop_named_agents(self, stats):
+        with self._lock:
+            dropped, stats.dropped_datasets = stats.dropped_datasets, set()
+        for key in [key for key in stats.named_agents if key[0] in dropped]:
+            self._retire(stats.named_agents.pop(key))
+
+    def _named_agent(self, stats, name, approximate):
+        agent = stats.named_agents.get((name, approximate))
+        if agent is None:
+            try:
+                agent = self.agent_factory(dataset=name, approximate=approximate)
+            except Exception as e:
+                logger.error(f"❗ {stats.name} could not create an agent for dataset '{name or 'default'}': {e}")
+                return None
+            if agent is not None:
+                stats.named_agents[(name, approximate)] = agent
+        return agent
+
+    def _retire(self, agent):
+        if agent is not None and self.on_agent_retired is not None:
+            try:
+                self.on_agent_retired(agent)
+            except Exception as e:
+                logger.error(f"❗ Could not release a replaced agent: {e}")
+
+    def _take_pending_agent(self, stats, agent):
+        with self._lock:
+            pending, stats.pending_agent = stats.pending_agent, None
+        if pending is None:
+            return agent
+        self._retire(agent)
+        stats.agent_ready = True
+        return pending
+
+    def _run(self, stats):
+        agent = None
+        try:
+            agent = self.agent_factory()
+            stats.agent_ready = agent is not None
+        except Exception as e:
+            logger.error(f"❗ {stats.name} could not create its agent: {e}")
+        finally:
+            with self._init_done:
+                self._init_attempts += 1
+                self._init_done.notify_all()
+
+        while True:
+            try:
+                job = self._queue.get(timeout=AGENT_SWAP_POLL_SECONDS)
+            except Empty:
+                # Idle: switch now, so the old agent's data can be freed without waiting for a job
+                agent = self._take_pending_agent(stats, agent)
+                self._drop_named_agents(stats)
+                continue
+            agent = self._take_pending_agent(stats, agent)
+            self._drop_named_agents(stats)
+            waited = time.monotonic() - job.enqueued_at
+            with self._lock:
+                self.total_queue_wait += waited
+            if waited > self.max_queue_wait:
+                with self._lock:
+                    self.expired += 1
+                job.on_rejected("The assistant is busy, please try again shortly.")
+                continue
+
+            if job.dataset is not None or job.approximate:
+                job_agent = self._named_agent(stats, job.dataset, job.approximate)
+                if job_agent is None:
+                    job.on_rejected("AI agent not available. Please check the server logs.")
+                    continue
+            else:
+                if agent is None:
+                    # Try again: the database may have appeared since startup
+                    try:
+                        agent = self.agent_factory()
+                        stats.agent_ready = agent is not None
+                    except Exception as e:
+                        logger.error(f"❗ {stats.name} could not create its agent: {e}")
+                    if agent is None:
+                        job.on_rejected("AI agent not available. Please check the server logs.")
+                        continue
+                job_agent = agent
+
+            stats.busy = True
+            started = time.monotonic()
+            try:
+                job.task(job_agent)
+            except Exception as e:
+                stats.errors += 1
+                logger.error(f"❗ {stats.name} job failed: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                stats.busy = False
+                stats.busy_seconds += elapsed
+                stats.jobs += 1
+                with self._lock:
+                    if self._avg_service_seconds is None:
+                        self._avg_service_seconds = elapsed
+                    else:
+                        self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * elapsed
+
+    def stats(self):
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        with self._lock:
+            started_jobs = sum(stats.jobs for stats in self._worker_stats) + self.expired
+            return {
+                "workers": self.num_workers,
+                "ready_workers": self.ready_workers,
+                "warming_up": self.warming_up,
+                "busy_workers": sum(1 for stats in self._worker_stats if stats.busy),
+                "queue_length": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "max_queue_wait_seconds": self.max_queue_wait,
+                "estimated_wait_seconds": self.estimated_wait(),
+                "avg_job_seconds": self._avg_service_seconds,
+                "avg_queue_wait_seconds": self.total_queue_wait / started_jobs if started_jobs else 0.0,
+                "accepted": self.accepted,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_wait_too_long": self.rejected_wait,
+                "expired_in_queue": self.expired,
+                "reloads": self.reloads,
+                "per_worker": [
+                    {
+                        "name": stats.name,
+                        "busy": stats.busy,
+                        "jobs": stats.jobs,
+                        "agent_pending": stats.pending_agent is not None,
+                        "other_agents": [{"dataset": name, "approximate": approximate}
+                                         for name, approximate in stats.named_agents],
+                        "errors": stats.errors,
+                        "utilisation": stats.busy_seconds / uptime if uptime else 0.0,
+                    }
+                    for stats in self._worker_stats
+                ],
+            }
@@ -3,6 +3,9 @@ import { Observable } from "rxjs"
 
 @Injectable({ providedIn: "root" })
 export class ApiService {
+  // One conversation per page load: the server keeps its history for follow-up questions
+  private readonly sessionId = this.newSessionId()
+
   streamPredict(query: string): Observable<string> {
     return new Observable<string>((observer) => {
       const controller = new AbortController()
@@ -15,7 +18,7 @@ export class ApiService {
           "Content-Type": "application/json",
           Accept: "text/event-stream", // Explicit accept header
         },
-        body: JSON.stringify({ message: query }),
+        body: JSON.stringify({ message: query, session_id: this.sessionId }),
         signal: controller.signal,
       })
         .then(async (response) => {
@@ -36,20 +39,24 @@ export class ApiService {
             buffer += decoder.decode(value, { stream: true })
           
             // Split by SSE event boundaries (double newline)
-            const lines = buffer.split("\n\n")
-            // Keep the last incomplete line in the buffer
-            buffer = lines.pop() || ""
-          
-            for (const line of lines) {
-              if (line.startsWith("data: ")) {
-                const data = line.substring(6)
-              
-                // Skip [DONE] marker
-                if (data === "[DONE]") continue
-              
-                if (data) {
-                  observer.next(data)
-                }
+            const events = buffer.split("\n\n")
+            // Keep the last incomplete event in the buffer
+            buffer = events.pop() || ""
+
+            for (const event of events) {
+              // Multi-line text arrives as several "data:" lines in one event
+              const dataLines = event
+                .split("\n")
+                .filter((line) => line.startsWith("data:"))
+                .map((line) => (line.startsWith("data: ") ? line.substring(6) : line.substring(5)))
+              if (dataLines.length === 0) continue
+              const data = dataLines.join("\n")
+
+              // Skip [DONE] marker
+              if (data === "[DONE]") continue
+
+              if (data) {
+                observer.next(data)
               }
             }
           }
@@ -64,6 +71,13 @@ export class ApiService {
     })
   }
 
+  private newSessionId(): string {
+    if (typeof crypto !== "undefined" && "randomUUID" in crypto) {
+      return crypto.randomUUID()
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+  }
+
   private getApiUrl(): string {
     if (location.hostname === "localhost" || location.hostname === "127.0.0.1") {
       return "http://127.0.0.1:5000"